@@ -1,97 +1,178 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
+import sys
 import subprocess
 from threading import Thread
 import os
+import re
+import queue
+import signal
 
 
-def run_scripts(toolsdir, filesdir, outdir, partition, is_it_os, log_widget):
+# The worker threads only put lines on this queue; the Tk main loop drains it on a timer.
+log_queue = queue.Queue()
+
+LOG_PUMP_MS = 100
+MAX_LINES_PER_PUMP = 500
+MAX_SCROLLBACK_LINES = 5000
+
+PIPELINE_STAGES = ["mft", "appcompatcache", "amcache", "i30", "usn", "snapshots", "check", "count-true"]
+STAGES_PER_ROW = 4
+
+STAGE_STARTED = re.compile(r"^Running stage: (?P<stage>\S+)")
+STAGE_FINISHED = re.compile(r"^Stage (?P<stage>\S+) (?P<status>.+?) in [\d.]+s:")
+STAGE_STOPPED = re.compile(r"^Error: stage (?P<stage>\S+) produced no data")
+TQDM_PROGRESS = re.compile(r"(?P<percent>\d+)%\|")
+
+running = {"process": None, "cancelled": False}
+
+
+def post(message):
+    log_queue.put(("line", message))
+
+
+def stream_process(process):
+    """Queue every line the process prints, including tqdm's carriage-return refreshes, until it exits."""
+    for output in process.stdout:
+        post(output if output.endswith("\n") else output + "\n")
+    process.wait()
+
+
+def start_process(command):
+    """Start a child in its own process group, so cancelling it also stops the tools it launched."""
+    options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+    return subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        **options,
+    )
+
+
+def terminate_process_tree(process):
+    """Stop the process and everything it started."""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    else:
+        os.killpg(process.pid, signal.SIGTERM)
+
+
+def run_scripts(toolsdir, filesdir, outdir, partition, is_it_os):
     try:
-      
-        scripts = [
-            ("mft.py", ["-toolsdir", toolsdir, "-filesdir", filesdir, "-outdir", outdir]),
-            ("appcompatcache.py", ["-toolsdir", toolsdir, "-filesdir", filesdir, "-outdir", outdir]),
-            ("amcache.py", ["-toolsdir", toolsdir, "-filesdir", filesdir, "-outdir", outdir]),
-            ("amcache-extraction.py", ["-outdir", outdir]),
-            ("velocerabtor.py", ["-toolsdir", toolsdir, "-outdir", outdir, "-partition", partition, "-is_it_os", is_it_os]),
-            ("check.py", ["-outdir", outdir]),
-            ("count-true.py", ["-outdir", outdir]),
-        ]
-
-        log_widget.insert(tk.END, "Starting script execution...\n")
-        log_widget.update_idletasks()
-
-        for script, args in scripts:
-            log_widget.insert(tk.END, f"Running {script} with arguments: {args}\n")
-            log_widget.update_idletasks()
-
-            
-            process = subprocess.Popen(
-                ["python", script, *args],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, 
-                text=True,
-                env={**os.environ, "PYTHONUNBUFFERED": "1"},  
-            )
 
-            while True:
-                output = process.stdout.readline()
-                if output == "" and process.poll() is not None:
-                    break
-                if output:
-                    log_widget.insert(tk.END, output)
-                    log_widget.see(tk.END)  
-                    log_widget.update_idletasks()
+        args = ["-toolsdir", toolsdir, "-filesdir", filesdir, "-outdir", outdir, "-partition", partition, "-is_it_os", is_it_os]
+
+        post("Starting script execution...\n")
+
+        # All stages run inside one pipeline.py process and hand their results over in memory.
+        post(f"Running pipeline.py with arguments: {args}\n")
 
-        log_widget.insert(tk.END, "All scripts completed.\n")
-        log_widget.update_idletasks()
+        running["process"] = start_process([sys.executable, "pipeline.py", *args])
+        stream_process(running["process"])
+
+        if running["cancelled"]:
+            post("Execution cancelled.\n")
+        elif running["process"].returncode != 0:
+            post(f"pipeline.py exited with code {running['process'].returncode}.\n")
+        else:
+            post("All scripts completed.\n")
 
     except Exception as e:
-        log_widget.insert(tk.END, f"Error occurred: {e}\n")
-        log_widget.update_idletasks()
+        post(f"Error occurred: {e}\n")
+    finally:
+        log_queue.put(("done", None))
 
 
-def run_check(outdir, log_widget):
+def run_check(outdir):
     try:
-        log_widget.insert(tk.END, "Running check.py...\n")
-        log_widget.update_idletasks()
-
-        process = subprocess.Popen(
-            ["python", "check.py", "-outdir", outdir],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=1,
-            universal_newlines=True,  
-        )
-
-      
-        while True:
-            output = process.stdout.readline()
-            if output == "" and process.poll() is not None:
-                break
-            if output:
-                log_widget.insert(tk.END, output)
-                log_widget.see(tk.END)  
-                log_widget.update_idletasks()
-
-     
-        err = process.stderr.read()
-        if err:
-            log_widget.insert(tk.END, err)
-            log_widget.see(tk.END)
-            log_widget.update_idletasks()
-
-        log_widget.insert(tk.END, "check.py completed.\n")
-        log_widget.see(tk.END)
-        log_widget.update_idletasks()
+        post("Running check.py...\n")
+
+        running["process"] = start_process([sys.executable, "check.py", "-outdir", outdir])
+        stream_process(running["process"])
+
+        post("check.py completed.\n")
 
     except Exception as e:
-        log_widget.insert(tk.END, f"Error occurred: {e}\n")
+        post(f"Error occurred: {e}\n")
+    finally:
+        log_queue.put(("done", None))
+
+
+def cancel_execution():
+    process = running["process"]
+    if process is None or process.poll() is not None:
+        post("Nothing is running.\n")
+        return
+    running["cancelled"] = True
+    post("Cancelling the pipeline and every tool it started...\n")
+    try:
+        terminate_process_tree(process)
+    except OSError as e:
+        post(f"Error cancelling: {e}\n")
+
+
+def update_progress(progress_bars, stage, status, percent=None):
+    """Set a stage's progress bar: indeterminate while it runs, determinate once tqdm reports a percentage."""
+    if stage not in progress_bars:
+        return
+    label, bar = progress_bars[stage]
+    label.config(text=f"{stage}: {status}")
+    if status == "running" and percent is None:
+        bar.config(mode="indeterminate")
+        bar.start(20)
+        return
+    if percent is None:
+        percent = 100 if status in ("ok", "cached") else 0
+    bar.stop()
+    bar.config(mode="determinate", value=percent)
+
+
+def pump_log(root, log_widget, progress_bars, controls, state):
+    """Drain a batch of queued lines into the log widget and the progress bars, then reschedule itself."""
+    lines = []
+    for _ in range(MAX_LINES_PER_PUMP):
+        try:
+            kind, line = log_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        if kind == "done":
+            controls["run"].config(state="normal")
+            controls["cancel"].config(state="disabled")
+            if state["stage"] and running["cancelled"]:
+                update_progress(progress_bars, state["stage"], "cancelled", 0)
+            state["stage"] = None
+            continue
+
+        progress = TQDM_PROGRESS.search(line)
+        if progress and state["stage"]:
+            update_progress(progress_bars, state["stage"], "running", int(progress.group("percent")))
+            continue
+
+        started = STAGE_STARTED.match(line)
+        finished = STAGE_FINISHED.match(line) or STAGE_STOPPED.match(line)
+        if started:
+            state["stage"] = started.group("stage")
+            update_progress(progress_bars, state["stage"], "running")
+        elif finished:
+            stage = finished.group("stage")
+            update_progress(progress_bars, stage, finished.groupdict().get("status") or "no data")
+            state["stage"] = None
+        lines.append(line)
+
+    if lines:
+        log_widget.insert(tk.END, "".join(lines))
+        line_count = int(log_widget.index("end-1c").split(".")[0])
+        if line_count > MAX_SCROLLBACK_LINES:
+            log_widget.delete("1.0", f"{line_count - MAX_SCROLLBACK_LINES + 1}.0")
         log_widget.see(tk.END)
-        log_widget.update_idletasks()
 
+    root.after(LOG_PUMP_MS, pump_log, root, log_widget, progress_bars, controls, state)
 
-def start_execution(toolsdir_var, filesdir_var, outdir_var, partition_var, is_it_os_var, log_widget):
+
+def start_execution(toolsdir_var, filesdir_var, outdir_var, partition_var, is_it_os_var, progress_bars, controls):
     toolsdir = toolsdir_var.get()
     filesdir = filesdir_var.get()
     outdir = outdir_var.get()
@@ -102,7 +183,12 @@ def start_execution(toolsdir_var, filesdir_var, outdir_var, partition_var, is_it
         messagebox.showerror("Error", "All fields must be filled.")
         return
 
-    Thread(target=run_scripts, args=(toolsdir, filesdir, outdir, partition, is_it_os, log_widget), daemon=True).start()
+    for stage in progress_bars:
+        update_progress(progress_bars, stage, "waiting", 0)
+    running["cancelled"] = False
+    controls["run"].config(state="disabled")
+    controls["cancel"].config(state="normal")
+    Thread(target=run_scripts, args=(toolsdir, filesdir, outdir, partition, is_it_os), daemon=True).start()
 
 
 def browse_directory(entry_var):
@@ -114,8 +200,8 @@ def browse_directory(entry_var):
 def create_gui():
     root = tk.Tk()
     root.title("Script Executor")
-    root.geometry("1100x700")  
-    root.resizable(False, False)  
+    root.geometry("1100x760")
+    root.resizable(False, False)
 
     toolsdir_var = tk.StringVar()
     filesdir_var = tk.StringVar()
@@ -133,10 +219,10 @@ def create_gui():
     ]
 
     for idx, (label, var) in enumerate(inputs):
-        
+
         tk.Label(root, text=label, font=("Arial", 12)).grid(row=idx, column=0, padx=10, pady=5, sticky="e")
 
-        
+
         entry = tk.Entry(root, textvariable=var, width=60, font=("Arial", 10))
         entry.grid(row=idx, column=1, padx=5, pady=5)
 
@@ -156,24 +242,52 @@ def create_gui():
 
     tk.Label(root, text="Logs:", font=("Arial", 12, "bold")).grid(row=len(inputs), column=0, padx=10, pady=5, sticky="nw")
     log_widget = tk.Text(
-        root, height=30, width=120, bg="black", fg="white", insertbackground="white", font=("Consolas", 10)
+        root, height=26, width=120, bg="black", fg="white", insertbackground="white", font=("Consolas", 10)
     )
     log_widget.grid(row=len(inputs), column=1, columnspan=2, padx=10, pady=5)
     log_widget.configure(state="normal")
 
-    tk.Button(
-        root,
+    tk.Label(root, text="Progress:", font=("Arial", 12, "bold")).grid(row=len(inputs) + 1, column=0, padx=10, pady=5, sticky="nw")
+    progress_frame = tk.Frame(root)
+    progress_frame.grid(row=len(inputs) + 1, column=1, columnspan=2, padx=10, pady=5, sticky="w")
+    progress_bars = {}
+    for number, stage in enumerate(PIPELINE_STAGES):
+        row, column = divmod(number, STAGES_PER_ROW)
+        label = tk.Label(progress_frame, text=f"{stage}: waiting", font=("Arial", 9), width=20, anchor="w")
+        label.grid(row=2 * row, column=column, padx=4, sticky="w")
+        bar = ttk.Progressbar(progress_frame, length=140, maximum=100, mode="determinate")
+        bar.grid(row=2 * row + 1, column=column, padx=4)
+        progress_bars[stage] = (label, bar)
+
+    button_frame = tk.Frame(root)
+    button_frame.grid(row=len(inputs) + 2, column=1, pady=10, sticky="w")
+    controls = {}
+    controls["run"] = tk.Button(
+        button_frame,
         text="Run Scripts",
         width=20,
         font=("Arial", 12),
         bg="#007ACC",
         fg="white",
-        command=lambda: start_execution(toolsdir_var, filesdir_var, outdir_var, partition_var, is_it_os_var, log_widget),
-    ).grid(row=len(inputs) + 1, column=1, pady=10, sticky="w")
+        command=lambda: start_execution(toolsdir_var, filesdir_var, outdir_var, partition_var, is_it_os_var, progress_bars, controls),
+    )
+    controls["run"].grid(row=0, column=0, padx=(0, 10))
+    controls["cancel"] = tk.Button(
+        button_frame,
+        text="Cancel",
+        width=20,
+        font=("Arial", 12),
+        bg="#DC3545",
+        fg="white",
+        state="disabled",
+        command=cancel_execution,
+    )
+    controls["cancel"].grid(row=0, column=1)
+
 
-   
-   
+    root.after(LOG_PUMP_MS, pump_log, root, log_widget, progress_bars, controls, {"stage": None})
     root.mainloop()
 
 
-create_gui()
+if __name__ == "__main__":
+    create_gui()
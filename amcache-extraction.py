@@ -1,6 +1,9 @@
 import os
 import pandas as pd
 import argparse
+from stage_io import FORMATS, write_stage
+from hive_parser import parse_amcache
+from path_normalizer import normalize_paths
 
 def extract_columns_and_modify(csv_file):
     """Extract and modify necessary columns from a CSV file."""
@@ -13,8 +16,8 @@ def extract_columns_and_modify(csv_file):
 
     required_columns = ['SHA1', 'FullPath', 'FileExtension', 'LinkDate', 'Size']
     if all(col in df.columns for col in required_columns):
-        extracted_df = df[required_columns]
-        extracted_df['Full Path with the name'] = extracted_df['FullPath'].apply(lambda x: x[3:] if isinstance(x, str) else x)
+        extracted_df = df[required_columns].copy()
+        extracted_df['Full Path with the name'] = normalize_paths(extracted_df['FullPath'])
         return extracted_df
     else:
         print(f"The CSV file {csv_file} is missing one or more required columns.")
@@ -32,7 +35,7 @@ def extract_drive_binaries_columns(csv_file):
     required_columns = ['KeyName', 'DriverTimeStamp']
     if all(col in df.columns for col in required_columns):
         df['FullPath'] = df['KeyName']
-        df['Full Path with the name'] = df['KeyName'].apply(lambda x: x[3:] if isinstance(x, str) else x)
+        df['Full Path with the name'] = normalize_paths(df['KeyName'])
         df['LinkDate'] = df['DriverTimeStamp']
         extracted_df = df[['FullPath', 'Full Path with the name', 'LinkDate']]
         return extracted_df
@@ -40,8 +43,8 @@ def extract_drive_binaries_columns(csv_file):
         print(f"The CSV file {csv_file} is missing one or more required columns.")
         return None
 
-def combine_and_save(input_dir, output_file):
-    """Combine data from the constant CSV files in the input directory and save it to a new file."""
+def combine_amcache(input_dir):
+    """Combine data from the constant CSV files in the input directory into one frame."""
    
     csv_file_1 = os.path.join(input_dir, "amcache_AssociatedFileEntries.csv")
     csv_file_2 = os.path.join(input_dir, "amcache_UnassociatedFileEntries.csv")
@@ -52,16 +55,37 @@ def combine_and_save(input_dir, output_file):
     df_3 = extract_drive_binaries_columns(csv_file_3)
 
     if df_1 is not None and df_2 is not None and df_3 is not None:
-        combined_df = pd.concat([df_1, df_2, df_3], ignore_index=True)
-        combined_df.to_csv(output_file, index=False)
+        return pd.concat([df_1, df_2, df_3], ignore_index=True)
+
+    print("Error: One or more files could not be processed.")
+    return None
+
+def combine_amcache_native(hive_path):
+    """Read the file and driver entries straight from Amcache.hve, in the same columns as combine_amcache."""
+    if not os.path.exists(hive_path):
+        print(f"Error: Amcache hive not found at {hive_path}")
+        return None
+
+    try:
+        return parse_amcache(hive_path)
+    except ValueError as e:
+        print(f"Error reading Amcache hive: {e}")
+        return None
+
+def combine_and_save(input_dir, output_dir, fmt="csv", hive_path=None):
+    """Combine data from the constant CSV files in the input directory, or from hive_path directly, and save it as amcache_combined_extracted."""
+    combined_df = combine_amcache_native(hive_path) if hive_path else combine_amcache(input_dir)
+    if combined_df is not None:
+        output_file = write_stage(combined_df, output_dir, "amcache_combined_extracted", fmt)
         print(f"Combined data saved to {output_file}")
-    else:
-        print("Error: One or more files could not be processed.")
+    return combined_df
 
 if __name__ == "__main__":
   
     parser = argparse.ArgumentParser(description="Process CSV files from the specified directory.")
     parser.add_argument('-outdir', required=True, help="Directory containing the input CSV files and where the output will be saved.")
+    parser.add_argument('-hive', default=None, help="Read this Amcache.hve directly instead of the AmcacheParser CSVs.")
+    parser.add_argument('-format', choices=list(FORMATS), default="csv", help="File format of the combined output (parquet and arrow need pyarrow).")
     
     
     args = parser.parse_args()
@@ -73,6 +97,4 @@ if __name__ == "__main__":
         print(f"Error: Output directory not found at {input_dir}")
     else:
         
-        output_file = os.path.join(input_dir, "amcache_combined_extracted.csv")
-        
-        combine_and_save(input_dir, output_file)
+        combine_and_save(input_dir, input_dir, args.format, args.hive)
@@ -3,6 +3,9 @@ import pandas as pd
 import os
 import argparse
 from datetime import datetime
+from stage_io import FORMATS, write_stage
+from hive_parser import parse_shimcache
+from path_normalizer import normalize_paths
 
 
 def generate_appcompat_csv(appcompat_path, system_hive_path, output_directory):
@@ -25,21 +28,44 @@ def generate_appcompat_csv(appcompat_path, system_hive_path, output_directory):
         return None
 
 
-def extract_appcompat_info(csv_file, output_directory):
+def shape_appcompat_info(df):
+    """Keep the columns the checks need and build 'Full Path with the name' from an AppCompatCacheParser-style frame."""
+    relevant_columns = ['Path', 'LastModifiedTimeUTC']
+    extracted_data = df[relevant_columns].copy()
+    extracted_data['FileName'] = extracted_data['Path'].str.replace('/', '\\', regex=False).str.rpartition('\\')[2]
+    extracted_data['Full Path with the name'] = normalize_paths(extracted_data['Path'])
+    return extracted_data[['FileName', 'LastModifiedTimeUTC', 'Full Path with the name']]
+
+
+def extract_appcompat_info(csv_file, output_directory, write_output=True, fmt="csv"):
     """
     Extract relevant information from the AppCompatCache CSV.
     """
    
     df = pd.read_csv(csv_file, low_memory=False)
     print("Columns in CSV:", df.columns.tolist())
-    relevant_columns = ['Path', 'LastModifiedTimeUTC']
-    extracted_data = df[relevant_columns].copy()
-    extracted_data['FileName'] = extracted_data['Path'].apply(lambda x: os.path.basename(x))
-    extracted_data['Full Path with the name'] = extracted_data['Path'].apply(lambda x: x[3:] if len(x) > 3 else '')
-    extracted_data = extracted_data[['FileName', 'LastModifiedTimeUTC', 'Full Path with the name']]
-    extracted_file = os.path.join(output_directory, 'extracted_appcompat_info.csv')
-    extracted_data.to_csv(extracted_file, index=False)
-    print(f"Extracted information saved to: {extracted_file}")
+    extracted_data = shape_appcompat_info(df)
+    if write_output:
+        extracted_file = write_stage(extracted_data, output_directory, 'extracted_appcompat_info', fmt)
+        print(f"Extracted information saved to: {extracted_file}")
+    return extracted_data
+
+
+def extract_appcompat_info_native(system_hive_path, output_directory, write_output=True, fmt="csv"):
+    """Read the ShimCache straight from the SYSTEM hive and save the same columns as extract_appcompat_info."""
+    if not os.path.exists(system_hive_path):
+        print(f"Error: SYSTEM hive not found at {system_hive_path}")
+        return None
+
+    try:
+        extracted_data = shape_appcompat_info(parse_shimcache(system_hive_path))
+    except ValueError as e:
+        print(f"Error reading AppCompatCache: {e}")
+        return None
+
+    if write_output:
+        extracted_file = write_stage(extracted_data, output_directory, 'extracted_appcompat_info', fmt)
+        print(f"Extracted information saved to: {extracted_file}")
     return extracted_data
 
 if __name__ == "__main__":
@@ -60,6 +86,17 @@ if __name__ == "__main__":
         required=True,
         help="Path to the output directory where results will be saved."
     )
+    parser.add_argument(
+        "-native",
+        action="store_true",
+        help="Read the ShimCache from the SYSTEM hive with the built-in reader instead of running AppCompatCacheParser.exe."
+    )
+    parser.add_argument(
+        "-format",
+        choices=list(FORMATS),
+        default="csv",
+        help="File format of extracted_appcompat_info (parquet and arrow need pyarrow)."
+    )
     
     args = parser.parse_args()
     appcompat_path = os.path.join(args.tools_directory, "AppCompatCacheParser.exe")
@@ -72,8 +109,13 @@ if __name__ == "__main__":
     if not os.path.exists(args.output_directory):
         os.makedirs(args.output_directory)
 
-    generated_csv = generate_appcompat_csv(appcompat_path, system_hive_path, args.output_directory)
-    
-    if generated_csv:
-        extracted_data = extract_appcompat_info(generated_csv, args.output_directory)
-        print(extracted_data)
+    if args.native:
+        extracted_data = extract_appcompat_info_native(system_hive_path, args.output_directory, fmt=args.format)
+        if extracted_data is not None:
+            print(extracted_data)
+    else:
+        generated_csv = generate_appcompat_csv(appcompat_path, system_hive_path, args.output_directory)
+
+        if generated_csv:
+            extracted_data = extract_appcompat_info(generated_csv, args.output_directory, fmt=args.format)
+            print(extracted_data)
@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import struct
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from path_normalizer import normalize_paths
+from stage_io import DEFAULT_CHUNK_ROWS, find_stage, iter_stage
+
+
+# Bumped whenever the keys or the pattern change, so an index built the old way is rejected instead of never matching.
+MAGIC = b"TSBASE04"
+# magic, Bloom hash count, key count, Bloom filter size in 64-bit words
+HEADER = struct.Struct("<8sIxxxxQQ")
+HEADER_SIZE = 64
+
+BLOOM_BITS_PER_KEY = 16
+BLOOM_HASHES = 6
+BATCH_KEYS = 1 << 22
+
+BASELINE_COLUMN = "In known-good baseline"
+
+# Joins the parts of a key. Control characters cannot occur in NTFS names, and pandas' factorize,
+# which hash_array runs first, compares strings only up to a NUL.
+KEY_SEPARATOR = "\x1f"
+
+# The timestamp pattern of a row: what each indicator says about it.
+PATTERN_COLUMNS = ["si<fn", "useczeros", "$SI M time prior to shimcache time",
+                   "$SI times prior to $I30", "$SI times prior to exe compile time", "BASIC_INFO_CHANGE after creation",
+                   "Timestamps regressed between snapshots"]
+
+# Indicators of sources a case may not have ($J, shadow copies). Missing counts as False in a key,
+# so a baseline built without the source matches hosts that have it and show no hit.
+OPTIONAL_PATTERN_COLUMNS = ["BASIC_INFO_CHANGE after creation", "Timestamps regressed between snapshots"]
+
+
+def cell_strings(df, col):
+    """A merged_output column as strings the same way whatever format it was read from: True/False as text, missing as ''."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    values = df[col].astype(object)
+    return values.where(values.notna(), "").astype(str)
+
+
+def baseline_keys(df):
+    """Hash each merged_output row's (normalized path, SHA1, timestamp pattern) to a 64-bit key.
+
+    Outputs without an Amcache SHA1 column hash an empty SHA1, so such rows match on path and pattern alone.
+    """
+    paths = pd.Series(normalize_paths(df["merge_key"], fold_case=True), index=df.index, dtype=object).fillna("")
+    text = paths + KEY_SEPARATOR + cell_strings(df, "sha1").str.lower()
+    for col in PATTERN_COLUMNS:
+        values = cell_strings(df, col)
+        if col in OPTIONAL_PATTERN_COLUMNS:
+            values = values.replace("", "False")
+        text = text + KEY_SEPARATOR + values
+    return pd.util.hash_array(text.to_numpy(dtype=object))
+
+
+def bloom_words_for(count):
+    """Size of the Bloom filter for count keys, in 64-bit words: at least BLOOM_BITS_PER_KEY bits per key, rounded up to a power of two."""
+    words = 2
+    while words * 64 < count * BLOOM_BITS_PER_KEY:
+        words <<= 1
+    return words
+
+
+def bloom_slots(keys, words, hashes):
+    """The word of the register-blocked Bloom filter each key falls in, and the mask of its bits there.
+
+    The word comes from the key's top bits, so sorted keys fall in sorted words; the bits from
+    6-bit slices of its low bits. A probe reads one word, however many hashes there are.
+    """
+    slots = keys >> np.uint64(65 - words.bit_length())
+    masks = np.zeros(len(keys), dtype=np.uint64)
+    for number in range(hashes):
+        masks |= np.uint64(1) << ((keys >> np.uint64(6 * number)) & np.uint64(63))
+    return slots, masks
+
+
+def build_bloom(sorted_keys, words):
+    """Build the Bloom filter of sorted keys, OR-ing the masks of each run of keys sharing a word in one pass."""
+    bloom = np.zeros(words, dtype=np.uint64)
+    for start in range(0, len(sorted_keys), BATCH_KEYS):
+        slots, masks = bloom_slots(sorted_keys[start:start + BATCH_KEYS], words, BLOOM_HASHES)
+        runs = np.concatenate(([0], np.flatnonzero(np.diff(slots)) + 1))
+        bloom[slots[runs]] |= np.bitwise_or.reduceat(masks, runs)
+    return bloom
+
+
+def write_baseline(keys, index_path):
+    """Write keys, sorted and without repeats, and their Bloom filter to an index file, replacing any previous one.
+
+    keys is a uint64 array, sorted in place to keep a single copy of it in memory. The file is a
+    64-byte header, the Bloom filter and the keys, all 64-bit words in native (little-endian) order.
+    """
+    keys.sort()
+    distinct = np.ones(len(keys), dtype=bool)
+    distinct[1:] = keys[1:] != keys[:-1]
+    count = int(distinct.sum())
+    words = bloom_words_for(count)
+    bloom = build_bloom(keys, words)
+
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "wb") as outfile:
+        outfile.write(HEADER.pack(MAGIC, BLOOM_HASHES, count, words).ljust(HEADER_SIZE, b"\0"))
+        bloom.tofile(outfile)
+        for start in range(0, len(keys), BATCH_KEYS):
+            keys[start:start + BATCH_KEYS][distinct[start:start + BATCH_KEYS]].tofile(outfile)
+    os.replace(temp_path, index_path)
+    return count
+
+
+def merged_output_paths(inputs):
+    """Resolve each input to (directory, stage name): a directory holding merged_output, or a merged_output file itself."""
+    resolved = []
+    for path in inputs:
+        directory, name = (path, "merged_output") if os.path.isdir(path) else os.path.split(path)
+        stage = os.path.splitext(name)[0]
+        if find_stage(directory or ".", stage)[0] is None:
+            raise FileNotFoundError(f"No merged_output found at {path}")
+        resolved.append((directory or ".", stage))
+    return resolved
+
+
+def build_baseline(inputs, index_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Build a known-good index from the merged_output of clean reference images, reading each in chunks.
+
+    Only the 64-bit keys are held in memory, 8 bytes per row, and rows repeated across references are stored once.
+    """
+    keys = []
+    for directory, stage in merged_output_paths(inputs):
+        for chunk in iter_stage(directory, stage, chunk_rows=chunk_rows):
+            keys.append(baseline_keys(chunk))
+        print(f"Hashed {directory}")
+        sys.stdout.flush()
+    return write_baseline(np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64), index_path)
+
+
+def open_baseline(index_path):
+    """Memory-map an index file; returns a dict of its Bloom filter and sorted keys, which are paged in only as probes touch them."""
+    with open(index_path, "rb") as infile:
+        magic, hashes, count, words = HEADER.unpack(infile.read(HEADER.size))
+    if magic != MAGIC:
+        if magic[:6] == MAGIC[:6]:
+            raise ValueError(f"{index_path} was built by an older version with different keys; rebuild it")
+        raise ValueError(f"{index_path} is not a known-good baseline index")
+    bloom = np.memmap(index_path, dtype=np.uint64, mode="r", offset=HEADER_SIZE, shape=(words,))
+    keys = np.memmap(index_path, dtype=np.uint64, mode="r", offset=HEADER_SIZE + words * 8, shape=(count,)) if count else np.empty(0, dtype=np.uint64)
+    return {"hashes": hashes, "bloom": bloom, "keys": keys}
+
+
+def bloom_contains(index, keys):
+    """False for keys certainly not in the index, True for keys that may be."""
+    slots, masks = bloom_slots(keys, len(index["bloom"]), index["hashes"])
+    return (index["bloom"][slots] & masks) == masks
+
+
+def probe_baseline(index, keys):
+    """Return which keys are in the index.
+
+    The Bloom filter turns most non-matching keys away without touching the key array; the
+    rest are binary-searched in it, in sorted order so nearby probes share pages.
+    """
+    found = np.zeros(len(keys), dtype=bool)
+    sorted_keys = index["keys"]
+    if not len(sorted_keys):
+        return found
+    for start in range(0, len(keys), BATCH_KEYS):
+        batch = keys[start:start + BATCH_KEYS]
+        candidates = np.flatnonzero(bloom_contains(index, batch))
+        order = np.argsort(batch[candidates])
+        candidate_keys = batch[candidates][order]
+        positions = np.minimum(np.searchsorted(sorted_keys, candidate_keys), len(sorted_keys) - 1)
+        found[start + candidates[order]] = sorted_keys[positions] == candidate_keys
+    return found
+
+
+def mark_known_good(consolidated_df, index_path):
+    """Add the BASELINE_COLUMN to a checked frame: 'True' where the row's path, SHA1 and timestamp pattern are in the baseline."""
+    index = open_baseline(index_path)
+    matched = probe_baseline(index, baseline_keys(consolidated_df))
+    consolidated_df[BASELINE_COLUMN] = np.where(matched, "True", "False")
+    print(f"{int(matched.sum())} of {len(matched)} rows match the known-good baseline")
+    sys.stdout.flush()
+    return consolidated_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a memory-mapped index of known-good merged_output rows from clean reference images.")
+    parser.add_argument("-inputs", nargs="+", required=True, help="merged_output files, or output directories holding one, of clean reference images.")
+    parser.add_argument("-out", default=None, help="Path of the index file to write.")
+    parser.add_argument("-probe", default=None, help="Instead of building, probe the -inputs against this existing index and print the match counts.")
+    args = parser.parse_args()
+
+    if not args.probe and not args.out:
+        print("Error: Give -out to build an index or -probe to check against one.")
+        exit(1)
+
+    start = time.perf_counter()
+    try:
+        if args.probe:
+            index = open_baseline(args.probe)
+            for directory, stage in merged_output_paths(args.inputs):
+                matched = total = 0
+                for chunk in iter_stage(directory, stage):
+                    found = probe_baseline(index, baseline_keys(chunk))
+                    matched += int(found.sum())
+                    total += len(found)
+                print(f"{directory}: {matched} of {total} rows in the baseline")
+        else:
+            count = build_baseline(args.inputs, args.out)
+            print(f"Baseline of {count} known-good rows saved to: {args.out}")
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        exit(1)
+    print(f"Done in {time.perf_counter() - start:.1f}s")
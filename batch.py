@@ -0,0 +1,330 @@
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import argparse
+import subprocess
+from collections import deque
+
+from fleet_stats import FLEET_NAME, SUMMARY_NAME, merge_fleet
+from stage_io import FORMATS
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+PIPELINE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.py")
+
+MANIFEST_COLUMNS = ["host", "filesdir", "partition", "is_it_os", "volume"]
+
+SUMMARY_COLUMNS = ["host", "status", "returncode", "seconds", "outdir", "log"]
+
+# Inputs whose size drives a host's memory use, and the estimate built from them
+FOOTPRINT_INPUTS = ["$MFT", "$J"]
+HOST_BASE_BYTES = 512 * 1024 ** 2
+INPUT_MEMORY_FACTOR = 3
+
+# Seconds between checks of the running hosts' exit, timeout and memory
+POLL_SECONDS = 0.5
+
+
+def read_manifest(manifest_path):
+    """Read the collections to process from a CSV or JSON manifest.
+
+    Every entry needs filesdir, partition and is_it_os; host defaults to the name of the
+    files directory and volume is optional. Host names must be unique, as they name the output directories.
+    """
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path, "r", encoding="utf-8") as infile:
+            entries = json.load(infile)
+    else:
+        with open(manifest_path, "r", encoding="utf-8", newline="") as infile:
+            entries = list(csv.DictReader(infile))
+
+    collections = []
+    for number, entry in enumerate(entries, start=1):
+        missing = [key for key in ["filesdir", "partition", "is_it_os"] if not entry.get(key)]
+        if missing:
+            raise ValueError(f"Manifest entry {number} is missing {', '.join(missing)}")
+        collection = {key: (entry.get(key) or "").strip() for key in MANIFEST_COLUMNS}
+        collection["host"] = collection["host"] or os.path.basename(os.path.normpath(collection["filesdir"]))
+        collections.append(collection)
+
+    hosts = [collection["host"] for collection in collections]
+    duplicates = sorted({host for host in hosts if hosts.count(host) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate host names in manifest: {', '.join(duplicates)}")
+    return collections
+
+
+def kill_process_tree(process):
+    """Kill a host's pipeline and everything it started: its worker processes and the external tools."""
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def pipeline_command(collection, toolsdir, outdir, host_workers=1, fmt="csv", native_mft=False, native_registry=False,
+                     cache_dir=None, partitions=1, sqlite=False, i30_recursive=False, baseline=None, fleet=None, fleet_summary=False):
+    """Build the pipeline.py command line for one collection."""
+    command = [
+        sys.executable, PIPELINE_SCRIPT,
+        "-toolsdir", toolsdir, "-filesdir", collection["filesdir"], "-outdir", outdir,
+        "-partition", collection["partition"], "-is_it_os", collection["is_it_os"].lower(),
+        "-format", fmt, "-workers", str(host_workers), "-partitions", str(partitions),
+    ]
+    if native_mft:
+        command.append("-native_mft")
+    if native_registry:
+        command.append("-native_registry")
+    if sqlite:
+        command.append("-sqlite")
+    if i30_recursive:
+        command.append("-i30_recursive")
+    if collection.get("volume"):
+        command += ["-volume", collection["volume"]]
+    if cache_dir:
+        command += ["-cache_dir", cache_dir]
+    if baseline:
+        command += ["-baseline", os.path.abspath(baseline)]
+    if fleet:
+        command += ["-fleet", os.path.abspath(fleet)]
+    if fleet_summary:
+        command.append("-fleet_summary")
+    return command
+
+
+def estimate_footprint(collection, host_workers=1):
+    """Rough peak memory of one host: a fixed share per pipeline process plus a multiple of the $MFT and $J it parses."""
+    inputs = 0
+    for name in FOOTPRINT_INPUTS:
+        path = os.path.join(collection["filesdir"], name)
+        if os.path.isfile(path):
+            inputs += os.path.getsize(path)
+    return HOST_BASE_BYTES * max(1, host_workers) + INPUT_MEMORY_FACTOR * inputs
+
+
+def tree_rss(process):
+    """Resident memory in bytes of a host's pipeline and every process it started, or None where it cannot be read."""
+    if psutil is not None:
+        try:
+            root = psutil.Process(process.pid)
+            members = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return 0
+        total = 0
+        for member in members:
+            try:
+                total += member.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    if not os.path.isdir("/proc"):
+        return None
+    # Every process of the host shares its session, whose id is the pipeline's pid.
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as infile:
+                fields = infile.read().rsplit(b")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[3]) == process.pid:
+            total += int(fields[21]) * page_size
+    return total
+
+
+def start_host(collection, toolsdir, outroot, host_workers=1, **options):
+    """Start the pipeline for one host into outroot/<host>, logging to pipeline.log there, and return its running state.
+
+    The pipeline runs in a session of its own, so it can be killed with every process it started.
+    """
+    outdir = os.path.join(outroot, collection["host"])
+    os.makedirs(outdir, exist_ok=True)
+    log_path = os.path.join(outdir, "pipeline.log")
+    command = pipeline_command(collection, toolsdir, outdir, host_workers, **options)
+    session = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+
+    host = {"collection": collection, "outdir": outdir, "log": log_path, "start": time.time(), "process": None, "rss": 0,
+            "log_file": open(log_path, "w", encoding="utf-8")}
+    try:
+        host["process"] = subprocess.Popen(command, stdout=host["log_file"], stderr=subprocess.STDOUT,
+                                           env={**os.environ, "PYTHONUNBUFFERED": "1"}, **session)
+    except OSError as e:
+        host["log_file"].write(f"\nError starting pipeline: {e}\n")
+    return host
+
+
+def stop_host(host, message):
+    """Kill a running host's process tree and note why in its log."""
+    kill_process_tree(host["process"])
+    host["process"].wait()
+    host["log_file"].write(f"\n{message}\n")
+
+
+def finish_host(host, status):
+    """Close a finished host's log and return its summary row."""
+    host["log_file"].close()
+    process = host["process"]
+    return {
+        "host": host["collection"]["host"], "status": status, "returncode": process.returncode if status in ("ok", "failed") and process else None,
+        "seconds": round(time.time() - host["start"], 1), "outdir": host["outdir"], "log": host["log"],
+    }
+
+
+def write_summary(results, summary_path):
+    """Write one row per finished host to the batch summary CSV."""
+    with open(summary_path, "w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def run_batch(collections, toolsdir, outroot, cpus=None, memory_bytes=None, host_workers=1, timeout=None, host_memory=None, **options):
+    """Run the pipeline for every collection on a pool of hosts sized to fit the CPU and memory budget.
+
+    Up to cpus / host_workers hosts run at once, each with host_workers parser processes. With a
+    memory budget, a host only starts while the footprints of the running hosts plus its own fit in
+    it; a footprint is host_memory if given, else estimate_footprint, raised to the resident memory
+    the host was last seen using. The resident memory of every host's process tree is polled, and
+    while the total is over budget the most recently started host is killed and queued again, or
+    recorded with status "memory" if it was running alone. A failing or timed-out host is recorded
+    and the batch carries on. The summary is rewritten to outroot/batch_summary.csv as hosts finish,
+    and the results are returned in manifest order.
+    """
+    os.makedirs(outroot, exist_ok=True)
+    cpus = cpus or os.cpu_count() or 1
+    concurrency = max(1, min(len(collections), cpus // max(1, host_workers)))
+    footprints = {collection["host"]: host_memory or estimate_footprint(collection, host_workers) for collection in collections}
+
+    summary_path = os.path.join(outroot, "batch_summary.csv")
+    print(f"Processing {len(collections)} collections, {concurrency} at a time with {host_workers} worker(s) each...")
+    sys.stdout.flush()
+
+    results = {}
+    pending = deque(collections)
+    running = []
+    watch_memory = bool(memory_bytes)
+
+    def record(host, status):
+        result = finish_host(host, status)
+        results[result["host"]] = result
+        print(f"[{len(results)}/{len(collections)}] {result['host']}: {result['status']} in {result['seconds']}s")
+        sys.stdout.flush()
+        write_summary([results[c["host"]] for c in collections if c["host"] in results], summary_path)
+
+    while pending or running:
+        while pending and len(running) < concurrency:
+            reserved = sum(footprints[host["collection"]["host"]] for host in running)
+            if memory_bytes and running and reserved + footprints[pending[0]["host"]] > memory_bytes:
+                break
+            host = start_host(pending.popleft(), toolsdir, outroot, host_workers, **options)
+            if host["process"] is None:
+                record(host, "failed")
+            else:
+                running.append(host)
+        if not running:
+            continue
+        time.sleep(POLL_SECONDS)
+
+        for host in list(running):
+            if host["process"].poll() is not None:
+                running.remove(host)
+                record(host, "ok" if host["process"].returncode == 0 else "failed")
+            elif timeout and time.time() - host["start"] > timeout:
+                stop_host(host, f"Timed out after {timeout}s")
+                running.remove(host)
+                record(host, "timeout")
+
+        if not (watch_memory and running):
+            continue
+        for host in running:
+            rss = tree_rss(host["process"])
+            if rss is None:
+                print("Resident memory cannot be read on this platform; hosts are only admitted by their estimated footprint.")
+                watch_memory = False
+                break
+            host["rss"] = rss
+            name = host["collection"]["host"]
+            footprints[name] = max(footprints[name], rss)
+        total = sum(host["rss"] for host in running)
+        if watch_memory and total > memory_bytes:
+            youngest = running.pop()
+            over = f"Running hosts used {total // 1024 ** 2} MB, over the {memory_bytes // 1024 ** 2} MB budget"
+            if running:
+                stop_host(youngest, f"{over}; stopped to run again later.")
+                youngest["log_file"].close()
+                pending.appendleft(youngest["collection"])
+                print(f"{youngest['collection']['host']}: stopped at {youngest['rss'] // 1024 ** 2} MB to stay within the memory budget; it will run again later.")
+                sys.stdout.flush()
+            else:
+                stop_host(youngest, f"{over}.")
+                record(youngest, "memory")
+
+    ordered = [results[collection["host"]] for collection in collections]
+    failed = [result["host"] for result in ordered if result["status"] != "ok"]
+    print(f"Batch finished: {len(ordered) - len(failed)} succeeded, {len(failed)} failed. Summary: {summary_path}")
+    if failed:
+        print(f"Failed hosts: {', '.join(failed)}")
+    return ordered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Timestomp Detector pipeline headless for every collection in a manifest.")
+    parser.add_argument("-manifest", required=True, help="CSV or JSON manifest with host, filesdir, partition, is_it_os and optional volume per collection.")
+    parser.add_argument("-toolsdir", required=True, help="Path to the directory containing the external tools.")
+    parser.add_argument("-outroot", required=True, help="Directory receiving one output directory per host and batch_summary.csv.")
+    parser.add_argument("-cpus", type=int, default=None, help="Total CPUs the batch may use (defaults to all).")
+    parser.add_argument("-memory_gb", type=float, default=None, help="Total resident memory the running hosts may use together.")
+    parser.add_argument("-host_memory_gb", type=float, default=None, help="Expected peak memory of one host, used to admit hosts (default: estimated from its $MFT and $J).")
+    parser.add_argument("-host_workers", type=int, default=1, help="Parser processes per host; hosts run at once = cpus / host_workers.")
+    parser.add_argument("-timeout", type=float, default=None, help="Seconds before a single host's pipeline is killed.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of every file written (parquet and arrow need pyarrow).")
+    parser.add_argument("-native_mft", action="store_true", help="Parse the $MFT with the built-in parser instead of mftecmd.exe.")
+    parser.add_argument("-native_registry", action="store_true", help="Read the ShimCache and Amcache with the built-in hive reader instead of the EZ tools.")
+    parser.add_argument("-cache_dir", default=None, help="Stage cache shared by all hosts.")
+    parser.add_argument("-partitions", type=int, default=1, help="Run each host's check over this many on-disk buckets.")
+    parser.add_argument("-sqlite", action="store_true", help="Also write each host's scored rows to an indexed SQLite database.")
+    parser.add_argument("-i30_recursive", action="store_true", help="Collect $I30 data with one recursive, streamed collection per tree.")
+    parser.add_argument("-baseline", default=None, help="Known-good index built by baseline.py, shared by every host.")
+    parser.add_argument("-fleet", default=None, help="Fleet prevalence table from an earlier sweep; adds the fleet columns and fleet_score to every host.")
+    parser.add_argument("-fleet_summary", action="store_true",
+                        help=f"Write each host's mergeable summary and merge them into <outroot>/{FLEET_NAME} at the end.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.toolsdir):
+        print(f"Error: Tools directory not found at {args.toolsdir}")
+        exit(1)
+
+    try:
+        collections = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest: {e}")
+        exit(1)
+
+    memory_bytes = int(args.memory_gb * 1024 ** 3) if args.memory_gb else None
+    host_memory = int(args.host_memory_gb * 1024 ** 3) if args.host_memory_gb else None
+    results = run_batch(collections, args.toolsdir, args.outroot, args.cpus, memory_bytes, args.host_workers, args.timeout, host_memory,
+                        fmt=args.format, native_mft=args.native_mft, native_registry=args.native_registry, cache_dir=args.cache_dir, partitions=args.partitions,
+                        sqlite=args.sqlite, i30_recursive=args.i30_recursive, baseline=args.baseline,
+                        fleet=args.fleet, fleet_summary=args.fleet_summary)
+
+    if args.fleet_summary:
+        summaries = [os.path.join(result["outdir"], SUMMARY_NAME) for result in results
+                     if result["status"] == "ok" and os.path.exists(os.path.join(result["outdir"], SUMMARY_NAME))]
+        if summaries:
+            fleet_path = merge_fleet(summaries, os.path.join(args.outroot, FLEET_NAME), args.cpus or os.cpu_count() or 1)
+            print(f"Fleet prevalence of {len(summaries)} hosts saved to: {fleet_path}")
+    if any(result["status"] != "ok" for result in results):
+        exit(1)
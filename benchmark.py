@@ -0,0 +1,453 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import importlib
+import multiprocessing
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import mft
+import appcompatcache
+import velocerabtor
+import check
+from mft_parser import filetime_to_string
+from stage_io import FORMATS, FILETIME_UNIX_EPOCH, find_stage, iter_stage, stage_path, write_stage_batches
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+amcache_extraction = importlib.import_module("amcache-extraction")
+count_true = importlib.import_module("count-true")
+
+
+DEFAULT_SIZES = [100000, 1000000, 10000000]
+
+STAGES = ["extract_mft_info", "extract_appcompat_info", "combine_and_save", "merge_csv_files", "check", "count_true"]
+
+# Share of files whose $SI times are backdated to whole seconds, as a timestomping tool leaves them
+TIMESTOMP_SHARE = 0.02
+# Share of files that also have an older, deleted MFT record under the same path
+DUPLICATE_SHARE = 0.05
+# Share of files with a deleted entry left in their directory's INDX slack
+SLACK_SHARE = 0.05
+
+FILES_PER_DIRECTORY = 200
+GENERATE_CHUNK_ROWS = 250 * FILES_PER_DIRECTORY
+
+TICKS_PER_SECOND = 10 ** 7
+TICKS_PER_DAY = 86400 * TICKS_PER_SECOND
+TICKS_PER_YEAR = 365 * TICKS_PER_DAY
+BASE_TICKS = 1420070400 * TICKS_PER_SECOND + FILETIME_UNIX_EPOCH  # 2015-01-01
+
+BASE_DIRECTORIES = [
+    r"Windows\System32", r"Windows\SysWOW64", r"Windows\WinSxS", r"Windows\Temp",
+    r"Program Files\Common Files", r"Program Files (x86)\Vendor App", r"ProgramData\Microsoft",
+    r"Users\alice\AppData\Local\Temp", r"Users\bob\Downloads", r"Users\bob\Documents",
+]
+EXTENSIONS = np.array([".exe", ".dll", ".sys", ".txt", ".dat"], dtype=object)
+
+
+def mix(index, salt):
+    """Deterministic 64-bit hash (splitmix64) of every file index, so each artifact can derive the same file's values on its own."""
+    z = index.astype(np.uint64) + np.uint64(salt * 0x9E3779B97F4A7C15 % 2 ** 64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def uniform(index, salt, span):
+    """Deterministic integers in [0, span) per file index."""
+    return (mix(index, salt) % np.uint64(span)).astype(np.int64)
+
+
+def file_times(index):
+    """Return the genuine and the $STANDARD_INFORMATION FILETIMEs of every file, and its timestomped flag."""
+    created = BASE_TICKS + uniform(index, 1, 8 * TICKS_PER_YEAR)
+    modified = created + uniform(index, 2, TICKS_PER_YEAR)
+    changed = modified + uniform(index, 3, 30 * TICKS_PER_DAY)
+    accessed = changed + uniform(index, 4, 30 * TICKS_PER_DAY)
+    link_date = created - uniform(index, 5, TICKS_PER_YEAR)
+    link_date -= link_date % TICKS_PER_SECOND
+
+    stomped = uniform(index, 6, 10 ** 6) < int(TIMESTOMP_SHARE * 10 ** 6)
+    fake_created = BASE_TICKS - 6 * TICKS_PER_YEAR + uniform(index, 7, TICKS_PER_YEAR)
+    fake_created -= fake_created % TICKS_PER_SECOND
+    fake_modified = fake_created + uniform(index, 8, 86400) * TICKS_PER_SECOND
+
+    genuine = {"created": created, "modified": modified, "changed": changed, "accessed": accessed, "link_date": link_date}
+    si = {
+        "created": np.where(stomped, fake_created, created),
+        "modified": np.where(stomped, fake_modified, modified),
+        "changed": np.where(stomped, fake_modified, changed),
+        "accessed": np.where(stomped, fake_modified, accessed),
+    }
+    return genuine, si, stomped
+
+
+def file_names(index):
+    """Return the directory (without drive) and the file name of every file index."""
+    directory = index // FILES_PER_DIRECTORY
+    unique_dirs, inverse = np.unique(directory, return_inverse=True)
+    dir_names = np.array([f"{BASE_DIRECTORIES[d % len(BASE_DIRECTORIES)]}\\Dir{d:06d}" for d in unique_dirs], dtype=object)
+    names = ("file" + pd.Series(index).astype(str) + EXTENSIONS[index % len(EXTENSIONS)]).to_numpy(dtype=object)
+    comma = index % 997 == 0
+    names[comma] = "report, final " + pd.Series(index[comma]).astype(str).to_numpy(dtype=object) + ".txt"
+    return dir_names[inverse], names
+
+
+def seconds_string(ticks):
+    """Render FILETIMEs as 'yyyy-MM-dd HH:mm:ss', the way the registry tools print them."""
+    return filetime_to_string(ticks).str[:19].to_numpy(dtype=object)
+
+
+def velociraptor_string(ticks):
+    """Render FILETIMEs as Velociraptor's 'yyyy-MM-ddTHH:mm:ss.fffffffZ'."""
+    return (filetime_to_string(ticks).str.replace(" ", "T") + "Z").to_numpy(dtype=object)
+
+
+def hex_digest(index, salt):
+    """Deterministic 40-digit hex strings standing in for SHA1 hashes."""
+    high = pd.Series(mix(index, salt)).map("{:016x}".format)
+    low = pd.Series(mix(index, salt + 1)).map("{:016x}".format)
+    return (high + low + pd.Series(mix(index, salt + 2) >> np.uint64(32)).map("{:08x}".format)).to_numpy(dtype=object)
+
+
+def mftecmd_rows(index, dirs, names):
+    """Build MFTECmd rows: the live record of every file plus an older deleted record for some of them."""
+    genuine, si, stomped = file_times(index)
+    deleted = uniform(index, 9, 10 ** 6) < int(DUPLICATE_SHARE * 10 ** 6)
+    rows = np.concatenate([np.arange(len(index)), np.flatnonzero(deleted)])
+    in_use = np.arange(len(rows)) < len(index)
+
+    si_times = {key: values[rows] for key, values in si.items()}
+    fn_times = {key: genuine["created"][rows] for key in ["created", "modified", "changed", "accessed"]}
+    frame = pd.DataFrame({
+        "EntryNumber": np.where(in_use, index[rows], 2 ** 24 + uniform(index[rows], 20, 2 ** 24)) + 64,
+        "SequenceNumber": np.where(in_use, 2, 1),
+        "InUse": in_use,
+        "ParentEntryNumber": index[rows] // FILES_PER_DIRECTORY + 40,
+        "ParentSequenceNumber": 1,
+        "ParentPath": ".\\" + dirs[rows],
+        "FileName": names[rows],
+        "Extension": EXTENSIONS[index[rows] % len(EXTENSIONS)],
+        "FileSize": uniform(index[rows], 10, 50 * 2 ** 20),
+        "ReferenceCount": 1,
+        "IsDirectory": False,
+        "HasAds": False,
+        "IsAds": False,
+        "SI<FN": (si_times["created"] < fn_times["created"]) | (si_times["modified"] < fn_times["modified"]),
+        "uSecZeros": stomped[rows],
+        "Copied": False,
+        "SiFlags": "Archive",
+        "NameType": "Windows",
+    })
+    for label, key in [("Created", "created"), ("LastModified", "modified"), ("LastRecordChange", "changed"), ("LastAccess", "accessed")]:
+        frame[f"{label}0x10"] = filetime_to_string(si_times[key]).to_numpy(dtype=object)
+        # MFTECmd leaves the $FILE_NAME time empty when it equals the $STANDARD_INFORMATION time
+        fn = filetime_to_string(np.where(fn_times[key] == si_times[key], 0, fn_times[key]))
+        frame[f"{label}0x30"] = fn.to_numpy(dtype=object)
+    frame["UpdateSequenceNumber"] = uniform(index[rows], 11, 2 ** 40)
+    frame["SecurityId"] = 256
+    return frame
+
+
+def appcompat_rows(index, dirs, names):
+    """ShimCache rows for a tenth of the files, with every other one duplicated across the two control sets."""
+    chosen = uniform(index, 12, 10) == 0
+    index, dirs, names = index[chosen], dirs[chosen], names[chosen]
+    genuine, _, _ = file_times(index)
+    twice = uniform(index, 13, 2) == 0
+    rows = np.concatenate([np.arange(len(index)), np.flatnonzero(twice)])
+    return pd.DataFrame({
+        "ControlSet": np.where(np.arange(len(rows)) < len(index), 1, 2),
+        "CacheEntryPosition": rows,
+        "Path": "C:\\" + dirs[rows] + "\\" + names[rows],
+        "LastModifiedTimeUTC": seconds_string(genuine["modified"][rows]),
+        "Executed": "NA",
+        "Duplicate": ~(np.arange(len(rows)) < len(index)),
+        "SourceFile": "SYSTEM",
+    })
+
+
+def amcache_rows(index, dirs, names, salt, share):
+    """InventoryApplicationFile rows for a 1/share subset of the files."""
+    chosen = uniform(index, salt, share) == 0
+    index, dirs, names = index[chosen], dirs[chosen], names[chosen]
+    genuine, _, _ = file_times(index)
+    return pd.DataFrame({
+        "ProgramName": "Vendor App",
+        "ProgramID": "0000f519feec486de87ed73cb92d3cac802400000000",
+        "SHA1": hex_digest(index, salt),
+        "FullPath": ("c:\\" + dirs + "\\" + names).astype(object),
+        "FileExtension": EXTENSIONS[index % len(EXTENSIONS)],
+        "LinkDate": seconds_string(genuine["link_date"]),
+        "ProductName": "vendor app",
+        "Size": uniform(index, 10, 50 * 2 ** 20),
+        "Version": "10.0.19041.1",
+        "BinaryType": "pe64_amd64",
+        "IsOsComponent": False,
+    })
+
+
+def drive_binary_rows(index, dirs, names):
+    """InventoryDriverBinary rows for a thousandth of the files."""
+    chosen = uniform(index, 16, 1000) == 0
+    index, dirs, names = index[chosen], dirs[chosen], names[chosen]
+    genuine, _, _ = file_times(index)
+    return pd.DataFrame({
+        "KeyName": ("c:\\" + dirs + "\\" + names).astype(object),
+        "DriverName": names,
+        "DriverTimeStamp": seconds_string(genuine["link_date"]),
+        "Product": "Microsoft Windows Operating System",
+        "ProductVersion": "10.0.19041.1",
+    })
+
+
+def i30_rows(index, dirs, names):
+    """Velociraptor Windows.NTFS.I30 rows for half of the files, plus deleted entries recovered from slack."""
+    genuine, _, _ = file_times(index)
+    live = np.flatnonzero(uniform(index, 17, 2) == 0)
+    slack = np.flatnonzero(uniform(index, 18, 10 ** 6) < int(SLACK_SHARE * 10 ** 6))
+    order = np.argsort(np.concatenate([live, slack]), kind="stable")
+    rows = np.concatenate([live, slack])[order]
+    is_slack = np.concatenate([np.zeros(len(live), bool), np.ones(len(slack), bool)])[order]
+    size = uniform(index[rows], 10, 50 * 2 ** 20)
+    return pd.DataFrame({
+        "FullPath": "\\\\.\\C:\\" + dirs[rows],
+        "Name": np.where(is_slack, "deleted" + pd.Series(index[rows]).astype(str).to_numpy(dtype=object) + ".tmp", names[rows]),
+        "NameType": "Win32",
+        "Size": size,
+        "AllocatedSize": (size + 4095) // 4096 * 4096,
+        "IsSlack": is_slack,
+        "SlackOffset": np.where(is_slack, uniform(index[rows], 19, 4096), 0),
+        "Mtime": velociraptor_string(genuine["modified"][rows]),
+        "Atime": velociraptor_string(genuine["accessed"][rows]),
+        "Ctime": velociraptor_string(genuine["changed"][rows]),
+        "Btime": velociraptor_string(genuine["created"][rows]),
+        "MFTId": index[rows] + 64,
+    })
+
+
+def write_i30_directories(frame, i30_dir):
+    """Write I30 rows, which are sorted by directory, as one CSV per directory like the Velociraptor collection does."""
+    lines = frame.to_csv(index=False, lineterminator="\n").split("\n")
+    header, lines = lines[0], lines[1:-1]
+    full_paths = frame["FullPath"].to_numpy()
+    bounds = np.flatnonzero(full_paths[1:] != full_paths[:-1]) + 1
+    for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(lines)]))):
+        name = full_paths[start].replace(':', '').replace('\\', '_')
+        with open(os.path.join(i30_dir, f"{name}.csv"), "w", encoding="utf-8", newline="") as outfile:
+            outfile.write(header + "\n" + "\n".join(lines[start:end]) + "\n")
+    return len(lines)
+
+
+def generate_dataset(rows, datadir):
+    """Write a deterministic case of `rows` files as the tool outputs each stage reads, and return the row counts.
+
+    The files are written chunk by chunk, so a 10M-row case never has to fit in memory.
+    An existing complete dataset in datadir is reused.
+    """
+    counts_path = os.path.join(datadir, "counts.json")
+    if os.path.exists(counts_path):
+        with open(counts_path, "r", encoding="utf-8") as infile:
+            return json.load(infile)
+
+    i30_dir = os.path.join(datadir, "I30")
+    os.makedirs(i30_dir, exist_ok=True)
+    outputs = {
+        "mft": "mftecmd.csv",
+        "appcompat": "appcompat.csv",
+        "amcache_associated": "amcache_AssociatedFileEntries.csv",
+        "amcache_unassociated": "amcache_UnassociatedFileEntries.csv",
+        "amcache_drivers": "amcache_DriveBinaries.csv",
+    }
+    counts = dict.fromkeys(list(outputs) + ["i30"], 0)
+
+    for start in range(0, rows, GENERATE_CHUNK_ROWS):
+        index = np.arange(start, min(start + GENERATE_CHUNK_ROWS, rows), dtype=np.int64)
+        dirs, names = file_names(index)
+        frames = {
+            "mft": mftecmd_rows(index, dirs, names),
+            "appcompat": appcompat_rows(index, dirs, names),
+            "amcache_associated": amcache_rows(index, dirs, names, 14, 20),
+            "amcache_unassociated": amcache_rows(index, dirs, names, 15, 20),
+            "amcache_drivers": drive_binary_rows(index, dirs, names),
+        }
+        for key, frame in frames.items():
+            frame.to_csv(os.path.join(datadir, outputs[key]), mode="w" if start == 0 else "a", header=start == 0, index=False)
+            counts[key] += len(frame)
+        counts["i30"] += write_i30_directories(i30_rows(index, dirs, names), i30_dir)
+        print(f"Generated {index[-1] + 1} of {rows} files")
+        sys.stdout.flush()
+
+    with open(counts_path, "w", encoding="utf-8") as outfile:
+        json.dump(counts, outfile)
+    return counts
+
+
+def stage_input_rows(stage, counts, outdir):
+    """Number of rows a stage reads, which its rows/sec is measured against."""
+    amcache_rows_count = counts["amcache_associated"] + counts["amcache_unassociated"] + counts["amcache_drivers"]
+    if stage == "extract_mft_info":
+        return counts["mft"]
+    if stage == "extract_appcompat_info":
+        return counts["appcompat"]
+    if stage == "combine_and_save":
+        return amcache_rows_count
+    if stage == "merge_csv_files":
+        return counts["i30"]
+    if stage == "check":
+        return counts["mft"] + counts["appcompat"] + amcache_rows_count + counts["i30"]
+    return stage_rows(outdir, "merged_output")
+
+
+def stage_rows(outdir, name):
+    """Count the rows of a stage file without loading it."""
+    path, fmt = find_stage(outdir, name)
+    if path is None:
+        return None
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=[0]).shape[0]
+    return sum(len(chunk) for chunk in iter_stage(outdir, name, []))
+
+
+def run_stage(stage, datadir, outdir, fmt):
+    """Run one stage on the generated data, reading from datadir and earlier stage outputs in outdir."""
+    if stage == "extract_mft_info":
+        mft.extract_mft_info(os.path.join(datadir, "mftecmd.csv"), outdir, fmt=fmt)
+    elif stage == "extract_appcompat_info":
+        appcompatcache.extract_appcompat_info(os.path.join(datadir, "appcompat.csv"), outdir, fmt=fmt)
+    elif stage == "combine_and_save":
+        amcache_extraction.combine_and_save(datadir, outdir, fmt)
+    elif stage == "merge_csv_files":
+        csv_files = sorted(glob.glob(os.path.join(datadir, "I30", "*.csv")))
+        if fmt == "csv":
+            velocerabtor.merge_csv_files(csv_files, stage_path(outdir, "consolidated_i30_data"))
+        else:
+            write_stage_batches(velocerabtor.merged_i30_frames(csv_files), outdir, "consolidated_i30_data", fmt)
+    elif stage == "check":
+        check.main(outdir, fmt)
+    elif stage == "count_true":
+        count_true.main(outdir)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def stage_process(stage, datadir, outdir, fmt, connection):
+    """Run a stage in a fresh process with its output silenced, and send back its wall time and peak RSS."""
+    devnull = open(os.devnull, "w")
+    sys.stdout = sys.stderr = devnull
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        run_stage(stage, datadir, outdir, fmt)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    connection.send({
+        "seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "baseline_rss_mb": baseline,
+        "error": error,
+    })
+    connection.close()
+
+
+def measure_stage(stage, datadir, outdir, fmt):
+    """Run one stage in a spawned process, so its peak RSS is its own rather than the benchmark's."""
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=stage_process, args=(stage, datadir, outdir, fmt, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"seconds": None, "peak_rss_mb": None, "baseline_rss_mb": None, "error": f"exit code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def run_benchmark(sizes, workdir, fmt="csv", stages=None):
+    """Generate each case size, run every stage on it and return the report."""
+    results = []
+    for rows in sizes:
+        datadir = os.path.join(workdir, f"data_{rows}")
+        outdir = os.path.join(workdir, f"out_{rows}_{fmt}")
+        os.makedirs(outdir, exist_ok=True)
+        print(f"Preparing {rows} row case in {datadir}...")
+        counts = generate_dataset(rows, datadir)
+
+        for stage in stages or STAGES:
+            measured = measure_stage(stage, datadir, outdir, fmt)
+            rows_in = stage_input_rows(stage, counts, outdir)
+            seconds = measured["seconds"]
+            result = {
+                "rows": rows, "stage": stage, "rows_in": rows_in, **measured,
+                "rows_per_second": round(rows_in / seconds) if rows_in and seconds else None,
+            }
+            results.append(result)
+            status = f"error {measured['error']}" if measured["error"] else \
+                f"{seconds}s, {result['rows_per_second']} rows/s, peak RSS {measured['peak_rss_mb']} MB"
+            print(f"  {stage}: {status}")
+            sys.stdout.flush()
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "format": fmt,
+        "platform": {
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "system": platform.platform(), "cpus": os.cpu_count(),
+        },
+        "settings": {"timestomp_share": TIMESTOMP_SHARE, "duplicate_share": DUPLICATE_SHARE, "slack_share": SLACK_SHARE},
+        "results": results,
+    }
+
+
+def compare_reports(baseline, report):
+    """Print the speedup and memory change of every stage against an earlier report."""
+    earlier = {(result["rows"], result["stage"]): result for result in baseline["results"]}
+    print(f"{'rows':>10}  {'stage':<24}{'before s':>10}{'after s':>10}{'speedup':>9}{'RSS before':>12}{'RSS after':>11}")
+    for result in report["results"]:
+        before = earlier.get((result["rows"], result["stage"]))
+        if before is None or not before["seconds"] or not result["seconds"]:
+            continue
+        print(f"{result['rows']:>10}  {result['stage']:<24}{before['seconds']:>10.2f}{result['seconds']:>10.2f}"
+              f"{before['seconds'] / result['seconds']:>8.2f}x{before['peak_rss_mb'] or 0:>12.0f}{result['peak_rss_mb'] or 0:>11.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every Timestomp Detector stage on deterministic synthetic cases.")
+    parser.add_argument("-workdir", required=True, help="Directory for the generated cases, stage outputs and report.")
+    parser.add_argument("-sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Number of files per generated case.")
+    parser.add_argument("-stages", nargs="+", choices=STAGES, default=None, help="Stages to run (default: all, in pipeline order).")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format the stages write (parquet and arrow need pyarrow).")
+    parser.add_argument("-report", default=None, help="Path of the JSON report (default: <workdir>/benchmark_report.json).")
+    parser.add_argument("-compare", default=None, help="Earlier JSON report to print the speedup against.")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = run_benchmark(args.sizes, args.workdir, args.format, args.stages)
+
+    report_path = args.report or os.path.join(args.workdir, "benchmark_report.json")
+    with open(report_path, "w", encoding="utf-8") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"Report saved to {report_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as infile:
+            compare_reports(json.load(infile), report)
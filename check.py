@@ -4,103 +4,377 @@ from tqdm import tqdm
 import argparse
 import os
 import sys
+import glob
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from baseline import mark_known_good
+from path_normalizer import normalize_paths
+from stage_io import DEFAULT_CHUNK_ROWS, FORMATS, NO_TICKS, find_stage, format_timestamps, iter_stage, parse_ticks, read_stage, write_stage
 
 
-tqdm.pandas(desc="Progressing...", file=sys.stdout)
+def join_unique_values(codes, values, n_groups):
+    """Join the unique values of each group code with '; ', keeping first-occurrence order."""
+    pairs = pd.DataFrame({"code": codes, "value": values}).drop_duplicates()
+    order = np.argsort(pairs["code"].to_numpy(), kind="stable")
+    sorted_codes = pairs["code"].to_numpy()[order]
+    sorted_values = pairs["value"].to_numpy(dtype=object)[order].tolist()
 
-def main(outdir):
-    file_mft_info = os.path.join(outdir, "extracted_mft_info.csv")
-    file_appcompat_info = os.path.join(outdir, "extracted_appcompat_info.csv")
-    file_amcache_info = os.path.join(outdir, "amcache_combined_extracted.csv")
-    file_other_csv = os.path.join(outdir, "consolidated_i30_data.csv")
-    output_file = os.path.join(outdir, "merged_output.csv")
+    bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(sorted_values)])).tolist()
 
-    columns_mft = [
-        "Full Path with the name", 
-        "SI<FN", "uSecZeros", "Created0x10", "Created0x30", 
-        "LastModified0x10", "LastModified0x30", 
-        "LastRecordChange0x10", "LastRecordChange0x30"
-    ]
-    columns_appcompat = ["Full Path with the name", "LastModifiedTimeUTC"]
-    columns_amcache = ["Full Path with the name", "LinkDate"]
-    columns_other = ["Full Path with the name", "Mtime", "Atime", "Ctime", "Btime", "MFTId"]
+    joined = np.full(n_groups, "", dtype=object)
+    if sorted_values:
+        joined[sorted_codes[starts]] = ["; ".join(sorted_values[a:b]) for a, b in zip(starts, ends)]
+    return joined
 
-   
+
+def aggregate_source(df, dtypes=None, key="merge_key"):
+    """Reduce a source to one row per key, sorted by key, joining the unique non-null values of each column with '; '.
+
+    Values keep the order of the source's rows. Keys that occur once are stringified
+    column-wise and only duplicated keys are joined, over flat arrays.
+    """
+    df = df[df[key].notna()]
+    if dtypes:
+        df = df.astype({col: dtype for col, dtype in dtypes.items() if df[col].dtype != dtype})
+    df = df.assign(**{col: format_timestamps(df[col]) for col in df.columns
+                      if pd.api.types.is_datetime64_any_dtype(df[col])})
+    codes, keys = pd.factorize(df[key], sort=True)
+    counts = np.bincount(codes, minlength=len(keys))
+    single = counts[codes] == 1
+    duplicated = counts > 1
+
+    aggregated = {key: np.asarray(keys, dtype=object)}
+    for col in df.columns:
+        if col == key:
+            continue
+        values = df[col]
+        present = values.notna().to_numpy()
+        strings = values.astype(str).to_numpy(dtype=object)
+        joined = np.full(len(keys), "", dtype=object)
+        joined[codes[single & present]] = strings[single & present]
+        if duplicated.any():
+            multi = ~single & present
+            joined[duplicated] = join_unique_values(codes[multi], strings[multi], len(keys))[duplicated]
+        aggregated[col] = joined
+    return pd.DataFrame(aggregated)
+
+
+def align_sources(aggregated, key="merge_key"):
+    """Join sources already reduced to one row per key over the sorted union of their keys.
+
+    Every source is scattered into the union with searchsorted, so the joined frame has one row
+    per distinct key. Columns come in outer-merge order: the first source's, then the others'.
+    """
+    keys = np.unique(np.concatenate([df[key].to_numpy(dtype=object) for df in aggregated]))
+    joined = {}
+    for df in aggregated:
+        positions = np.searchsorted(keys, df[key].to_numpy(dtype=object))
+        for col in df.columns:
+            if col == key:
+                continue
+            column = np.full(len(keys), "", dtype=object)
+            column[positions] = df[col].to_numpy(dtype=object)
+            joined[col] = column
+    columns = list(aggregated[0].columns) + [col for df in aggregated[1:] for col in df.columns if col != key]
+    joined[key] = keys
+    return pd.DataFrame({col: joined[col] for col in columns}).astype(str)
+
+
+def key_coverage(frames, key="merge_key"):
+    """For each source, whether it holds every key of the others (a missing path counts as a key, as it does in a merge)."""
+    keys = [pd.unique(df[key].to_numpy(dtype=object)) for df in frames]
+    union = len(pd.unique(np.concatenate(keys)))
+    return [len(source_keys) == union for source_keys in keys]
+
+
+def merged_dtypes(dtypes, covered):
+    """The dtypes a source's columns take in an outer join: integer columns of a source missing some key turn float64."""
+    if covered:
+        return dict(dtypes)
+    return {col: np.dtype("float64") if isinstance(dtype, np.dtype) and pd.api.types.is_integer_dtype(dtype) else dtype
+            for col, dtype in dtypes.items()}
+
+
+def consolidate_sources(frames, key="merge_key", progress=True):
+    """Reduce each normalized source to one row per key, then join them once on the key.
+
+    Gives the frame that outer-merging the sources and combining each key's unique values would,
+    but duplicated keys (hard links, cache entries) never multiply into a cross product.
+    """
+    covered = key_coverage(frames, key)
+    aggregated = [aggregate_source(df, merged_dtypes(df.dtypes.to_dict(), cover), key)
+                  for df, cover in tqdm(list(zip(frames, covered)), desc="Progressing...", file=sys.stdout, disable=not progress)]
+    return align_sources(aggregated, key)
+
+
+columns_mft = [
+    "Full Path with the name", 
+    "SI<FN", "uSecZeros", "Created0x10", "Created0x30", 
+    "LastModified0x10", "LastModified0x30", 
+    "LastRecordChange0x10", "LastRecordChange0x30"
+]
+columns_appcompat = ["Full Path with the name", "LastModifiedTimeUTC"]
+columns_amcache = ["SHA1", "Full Path with the name", "LinkDate"]
+columns_other = ["Full Path with the name", "Mtime", "Atime", "Ctime", "Btime", "MFTId"]
+columns_usn = ["Full Path with the name", "UsnCreated", "UsnBasicInfoChange", "UsnBasicInfoChanges"]
+columns_snapshots = ["Full Path with the name", "SnapshotChanges"]
+
+# Stage file and columns of each source, in merge order
+sources = {
+    "mft": ("extracted_mft_info", columns_mft),
+    "appcompat": ("extracted_appcompat_info", columns_appcompat),
+    "amcache": ("amcache_combined_extracted", columns_amcache),
+    "other": ("consolidated_i30_data", columns_other),
+    "usn": ("extracted_usn_info", columns_usn),
+    "snapshots": ("mft_diff", columns_snapshots),
+}
+
+# Sources a case may lack; a missing one is checked as empty.
+optional_sources = {"usn", "snapshots"}
+
+# A regression entry of mft_diff's SnapshotChanges, e.g. '$SI LastModified0x10 regressed (vss1 -> live)'
+SNAPSHOT_REGRESSION = r"(?:^|; )\$(?:SI|FN) [\w, ]+ regressed \("
+
+
+def project(df, columns):
+    """Keep only the given columns, in the frame's own order, the way read_csv(usecols=...) does."""
+    return df[[col for col in df.columns if col in columns]].copy()
+
+
+def load_sources(outdir):
+    """Read the extracted source files from outdir, keeping only the columns the checks use."""
     print("Loading data...")
     sys.stdout.flush()
     
-    df_mft = pd.read_csv(file_mft_info, usecols=columns_mft)
-    df_appcompat = pd.read_csv(file_appcompat_info, usecols=columns_appcompat)
-    df_amcache = pd.read_csv(file_amcache_info, usecols=columns_amcache)
-    df_other = pd.read_csv(file_other_csv, usecols=columns_other)
+    df_mft = read_stage(outdir, "extracted_mft_info", columns_mft)
+    df_appcompat = read_stage(outdir, "extracted_appcompat_info", columns_appcompat)
+    df_amcache = read_stage(outdir, "amcache_combined_extracted", columns_amcache)
+    df_other = read_stage(outdir, "consolidated_i30_data", columns_other)
+    df_usn = read_stage(outdir, "extracted_usn_info", columns_usn) if find_stage(outdir, "extracted_usn_info")[0] else None
+    df_snapshots = read_stage(outdir, "mft_diff", columns_snapshots) if find_stage(outdir, "mft_diff")[0] else None
 
-   
-    df_mft.columns = df_mft.columns.str.lower()
-    df_appcompat.columns = df_appcompat.columns.str.lower()
-    df_amcache.columns = df_amcache.columns.str.lower()
-    df_other.columns = df_other.columns.str.lower()
+    return df_mft, df_appcompat, df_amcache, df_other, df_usn, df_snapshots
+
+
+def normalize_source(df, columns):
+    """Keep the columns the checks use, lower-case the column names and turn the full path into a normalized, lower-cased merge_key."""
+    df = project(df, columns)
+    df.columns = df.columns.str.lower()
 
    
     merge_key = "full path with the name".lower()
-    df_mft.rename(columns={merge_key: "merge_key"}, inplace=True)
-    df_appcompat.rename(columns={merge_key: "merge_key"}, inplace=True)
-    df_amcache.rename(columns={merge_key: "merge_key"}, inplace=True)
-    df_other.rename(columns={merge_key: "merge_key"}, inplace=True)
+    df.rename(columns={merge_key: "merge_key"}, inplace=True)
+    df["merge_key"] = normalize_paths(df["merge_key"], fold_case=True)
+    return df
+
+
+def first_value_ticks(consolidated_df, col):
+    """FILETIME ticks of the first of the '; '-joined values in each cell of a consolidated column."""
+    values = consolidated_df[col]
+    joined = values.str.contains("; ", regex=False).to_numpy(dtype=bool)
+    if joined.any():
+        values = values.copy()
+        values[joined] = values[joined].str.split("; ", n=1).str[0]
+    return parse_ticks(values)
+
+
+def prior_to(earlier, later):
+    """'True'/'False' for earlier < later where both tick arrays hold a time, '' where either is missing."""
+    return np.where((earlier != NO_TICKS) & (later != NO_TICKS), np.where(earlier < later, "True", "False"), "")
 
-   
-    df_mft["merge_key"] = df_mft["merge_key"].str.lower()
-    df_appcompat["merge_key"] = df_appcompat["merge_key"].str.lower()
-    df_amcache["merge_key"] = df_amcache["merge_key"].str.lower()
-    df_other["merge_key"] = df_other["merge_key"].str.lower()
+
+def add_indicators(consolidated_df):
+    """Add the timestamp comparison columns to a consolidated frame.
+
+    The times are compared as int64 FILETIME ticks, so sources that format their times
+    differently still compare correctly; a cell holding several values is compared by its first.
+    """
+    ticks = {col: first_value_ticks(consolidated_df, col) for col in [
+        "created0x10", "created0x30", "lastmodified0x10", "lastrecordchange0x10", "lastmodifiedtimeutc",
+        "btime", "mtime", "ctime", "linkdate", "usncreated", "usnbasicinfochange",
+    ]}
+
+    consolidated_df["$SI M time prior to shimcache time"] = prior_to(ticks["lastmodified0x10"], ticks["lastmodifiedtimeutc"])
+
+    # NO_TICKS sorts after every time, so the minimum skips missing values.
+    si_min = np.minimum.reduce([ticks["created0x10"], ticks["lastmodified0x10"], ticks["lastrecordchange0x10"]])
+    i30_min = np.minimum.reduce([ticks["btime"], ticks["mtime"], ticks["ctime"]])
+
+    consolidated_df["$SI times prior to $I30"] = prior_to(si_min, i30_min)
+    consolidated_df["$SI times prior to exe compile time"] = prior_to(si_min, ticks["linkdate"])
+
+    # A file is created once; a BASIC_INFO_CHANGE from a later handle means its basic information
+    # was changed afterwards. Creation is the journal's FILE_CREATE, else the $FN creation time.
+    # A benign change or touch leaves the $SI M or C time at or after the change record; both still
+    # earlier than it means the times were set back. Files the journal does not mention are left empty.
+    creation = np.where(ticks["usncreated"] != NO_TICKS, ticks["usncreated"], ticks["created0x30"])
+    creation = np.where(creation != NO_TICKS, creation, np.iinfo(np.int64).min)
+    si_latest = np.maximum.reduce([np.where(ticks[col] != NO_TICKS, ticks[col], np.iinfo(np.int64).min)
+                                   for col in ["lastmodified0x10", "lastrecordchange0x10"]])
+    changed = ((ticks["usnbasicinfochange"] != NO_TICKS) & (creation < ticks["usnbasicinfochange"])
+               & (si_latest != np.iinfo(np.int64).min) & (si_latest < ticks["usnbasicinfochange"]))
+    in_journal = (consolidated_df["usnbasicinfochanges"] != "").to_numpy()
+    consolidated_df["BASIC_INFO_CHANGE after creation"] = np.where(in_journal, np.where(changed, "True", "False"), "")
+
+    # Between two MFT snapshots a file's times only move forward; one moving backwards was set.
+    # Files mft_diff found no change in are left empty.
+    snapshot_changes = consolidated_df["snapshotchanges"]
+    regressed = snapshot_changes.str.contains(SNAPSHOT_REGRESSION, regex=True).to_numpy(dtype=bool)
+    in_diff = (snapshot_changes != "").to_numpy()
+    consolidated_df["Timestamps regressed between snapshots"] = np.where(in_diff, np.where(regressed, "True", "False"), "")
+
+    return consolidated_df
+
+
+def check_frames(df_mft, df_appcompat, df_amcache, df_other, df_usn=None, df_snapshots=None):
+    """Join the sources on the lower-cased full path, one row per path, and add the timestamp checks.
+
+    df_usn and df_snapshots are optional; without a change journal or MFT snapshots their indicators are left empty.
+    """
+    if df_usn is None:
+        df_usn = pd.DataFrame(columns=columns_usn)
+    if df_snapshots is None:
+        df_snapshots = pd.DataFrame(columns=columns_snapshots)
+    df_mft = normalize_source(df_mft, columns_mft)
+    df_appcompat = normalize_source(df_appcompat, columns_appcompat)
+    df_amcache = normalize_source(df_amcache, columns_amcache)
+    df_other = normalize_source(df_other, columns_other)
+    df_usn = normalize_source(df_usn, columns_usn)
+    df_snapshots = normalize_source(df_snapshots, columns_snapshots)
 
    
-    print("Merging data...")
+    print("Consolidating rows per source with progress bar...")
     sys.stdout.flush()
-    merged_df = pd.merge(df_mft, df_appcompat, on="merge_key", how="outer")
-    merged_df = pd.merge(merged_df, df_amcache, on="merge_key", how="outer")
-    merged_df = pd.merge(merged_df, df_other, on="merge_key", how="outer")
+    consolidated_df = consolidate_sources([df_mft, df_appcompat, df_amcache, df_other, df_usn, df_snapshots])
+    return add_indicators(consolidated_df)
 
-  
-    print("Consolidating rows with progress bar...")
-    sys.stdout.flush()
 
-    def consolidate_group(group):
-        """Combine non-null, unique values from all columns into a single cell."""
-        return group.apply(lambda col: "; ".join(col.dropna().astype(str).unique()))
+def partition_sources(source_chunks, bucket_dir, partitions):
+    """Hash-partition every source by merge_key into on-disk buckets, holding one chunk in memory at a time.
 
-    consolidated_df = merged_df.groupby("merge_key", as_index=False).progress_apply(consolidate_group)
+    source_chunks maps each name in `sources` to an iterable of DataFrames. Chunk files are
+    numbered so that a bucket reloads its rows in their original order.
+    """
+    for name, chunks in source_chunks.items():
+        columns = sources[name][1]
+        empty = None
+        for number, chunk in enumerate(chunks):
+            frame = normalize_source(chunk, columns)
+            if empty is None:
+                empty = frame.iloc[:0]
+            buckets = pd.util.hash_array(frame["merge_key"].to_numpy(dtype=object)) % partitions
+            for bucket, part in frame.groupby(buckets, sort=False):
+                part.to_pickle(os.path.join(bucket_dir, f"{bucket}_{name}_{number:06d}.pkl"))
+        if empty is None:
+            empty = normalize_source(pd.DataFrame(columns=columns), columns)
+        empty.to_pickle(os.path.join(bucket_dir, f"empty_{name}.pkl"))
 
-    si_time = consolidated_df["lastmodified0x10"]
-    shimcache_time = consolidated_df["lastmodifiedtimeutc"]
-    consolidated_df["$SI M time prior to shimcache time"] = np.where(
-        si_time.notna() & shimcache_time.notna(),
-        si_time < shimcache_time,
-        ""
-    )
 
-   
-    si_times = consolidated_df[["created0x10", "lastmodified0x10", "lastrecordchange0x10"]]
-    i30_times = consolidated_df[["btime", "mtime", "ctime"]]
+def load_bucket_source(bucket_dir, bucket, name):
+    chunk_files = sorted(glob.glob(os.path.join(bucket_dir, f"{bucket}_{name}_*.pkl")))
+    if not chunk_files:
+        return pd.read_pickle(os.path.join(bucket_dir, f"empty_{name}.pkl"))
+    return pd.concat([pd.read_pickle(path) for path in chunk_files], ignore_index=True)
+
+
+def scan_bucket(bucket_dir, bucket):
+    """Return (column dtypes, holds every key of the bucket) per source of one bucket, or None for an empty bucket.
+
+    The dtypes are None for a source with no rows in the bucket.
+    """
+    frames = [load_bucket_source(bucket_dir, bucket, name) for name in sources]
+    if all(frame.empty for frame in frames):
+        return None
+    return [(None if frame.empty else frame.dtypes.to_dict(), cover) for frame, cover in zip(frames, key_coverage(frames))]
 
-    si_min = si_times.min(axis=1, skipna=True) 
-    i30_min = i30_times.min(axis=1, skipna=True)  
 
-    consolidated_df["$SI times prior to $I30"] = np.where(
-        si_min.notna() & i30_min.notna(),
-        si_min < i30_min,
-        ""
-    )
+def common_dtypes(bucket_dtypes):
+    """Promote each column's dtype across buckets to the dtype it has when the whole source is read at once.
 
-    linkdate = consolidated_df["linkdate"]
-    consolidated_df["$SI times prior to exe compile time"] = np.where(
-        si_min.notna() & linkdate.notna(),
-        si_min < linkdate,
-        ""
-    )
+    A chunk only holds NaN where its own rows do, so an integer column may be int64 in one
+    bucket and float64 in another; the whole column is float64.
+    """
+    common = {}
+    for col in bucket_dtypes[0]:
+        dtypes = {dtypes[col] for dtypes in bucket_dtypes}
+        if len(dtypes) == 1:
+            common[col] = dtypes.pop()
+        elif all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+            common[col] = np.dtype("float64")
+        else:
+            common[col] = np.dtype(object)
+    return common
+
+
+def check_bucket(bucket_dir, bucket, dtypes):
+    """Consolidate and check one bucket with the given per-source dtypes, saving the result next to it."""
+    frames = [load_bucket_source(bucket_dir, bucket, name) for name in sources]
+    aggregated = [aggregate_source(frame, source_dtypes) for frame, source_dtypes in zip(frames, dtypes)]
+    result_path = os.path.join(bucket_dir, f"result_{bucket}.pkl")
+    add_indicators(align_sources(aggregated)).to_pickle(result_path)
+    return result_path
+
+
+def check_partitioned(source_chunks, work_dir, partitions, workers=1):
+    """Run check_frames out of core: partition the sources by merge_key, check the buckets on a process pool, concatenate.
+
+    Peak memory of the join and consolidation is bounded by the largest bucket rather than
+    the whole case. The result equals check_frames on the same data.
+    """
+    bucket_dir = tempfile.mkdtemp(prefix="check_buckets_", dir=work_dir)
+    try:
+        print(f"Partitioning data into {partitions} buckets...")
+        sys.stdout.flush()
+        partition_sources(source_chunks, bucket_dir, partitions)
+
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+            print("Scanning buckets...")
+            sys.stdout.flush()
+            scans = list(executor.map(scan_bucket, repeat(bucket_dir), range(partitions)))
+            buckets = [bucket for bucket, scan in enumerate(scans) if scan is not None]
+            if not buckets:
+                empty_frames = [pd.read_pickle(os.path.join(bucket_dir, f"empty_{name}.pkl")) for name in sources]
+                return add_indicators(consolidate_sources(empty_frames, progress=False))
+
+            # A source's integers turn float64 if any bucket has a key it lacks, as in one in-memory join.
+            dtypes = []
+            for index in range(len(sources)):
+                source_dtypes = [scans[bucket][index][0] for bucket in buckets if scans[bucket][index][0] is not None]
+                covered = all(scans[bucket][index][1] for bucket in buckets)
+                dtypes.append(merged_dtypes(common_dtypes(source_dtypes), covered) if source_dtypes else None)
+
+            print("Consolidating rows with progress bar...")
+            sys.stdout.flush()
+            result_paths = list(tqdm(executor.map(check_bucket, repeat(bucket_dir), buckets, repeat(dtypes)),
+                                     total=len(buckets), desc="Progressing...", file=sys.stdout))
+
+        results = [pd.read_pickle(path) for path in result_paths]
+        return pd.concat(results, ignore_index=True).sort_values("merge_key", kind="stable", ignore_index=True)
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+
+
+def iter_sources(outdir, chunk_rows):
+    """Map each source to a chunked reader of its stage file in outdir, for check_partitioned."""
+    return {name: iter_stage(outdir, stage, columns, chunk_rows) if name not in optional_sources or find_stage(outdir, stage)[0] else []
+            for name, (stage, columns) in sources.items()}
+
+
+def main(outdir, fmt="csv", partitions=1, workers=1, baseline=None):
+    if partitions > 1:
+        consolidated_df = check_partitioned(iter_sources(outdir, DEFAULT_CHUNK_ROWS), outdir, partitions, workers)
+    else:
+        consolidated_df = check_frames(*load_sources(outdir))
+    if baseline:
+        consolidated_df = mark_known_good(consolidated_df, baseline)
 
     print("Saving consolidated data...")
     sys.stdout.flush()
-    consolidated_df.to_csv(output_file, index=False)
+    output_file = write_stage(consolidated_df, outdir, "merged_output", fmt)
 
     print("Consolidated CSV has been saved to:", output_file)
     sys.stdout.flush() 
@@ -108,13 +382,18 @@ def main(outdir):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Merge and consolidate CSV files.")
     parser.add_argument("-outdir", required=True, help="Path to the directory containing input files and for saving the output file.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of merged_output (parquet and arrow need pyarrow).")
+    parser.add_argument("-partitions", type=int, default=1, help="Hash-partition the sources into this many on-disk buckets to bound memory (1 keeps everything in memory).")
+    parser.add_argument("-workers", type=int, default=1, help="Number of processes checking buckets in partitioned mode.")
+    parser.add_argument("-baseline", default=None, help="Known-good index built by baseline.py; rows matching it are marked and not scored.")
     args = parser.parse_args()
 
  
     if not os.path.exists(args.outdir):
         print(f"Error: Output directory not found at {args.outdir}")
         exit(1)
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"Error: Baseline index not found at {args.baseline}")
+        exit(1)
 
-    main(args.outdir)
-    
-    consolidated_file = os.path.join(args.outdir, "merged_output.csv")
+    main(args.outdir, args.format, args.partitions, args.workers, args.baseline)
@@ -1,52 +1,132 @@
 import os
 import argparse
+import numpy as np
 import pandas as pd
-from tqdm import tqdm  
+from baseline import BASELINE_COLUMN
+from fleet_stats import FLEET_COLUMNS, FLEET_INPUT_COLUMNS, SUMMARY_NAME, add_fleet_prevalence, load_summary, write_host_summary
+from results_store import DB_NAME, write_results_db
+from stage_io import as_booleans, find_stage, pa, read_table, write_stage, write_table
 
-parser = argparse.ArgumentParser(description="Process merged_output.csv and save the output in the specified directory.")
-parser.add_argument(
-    "-outdir", 
-    type=str, 
-    required=True, 
-    help="Directory containing the input file and where the output file will be saved."
-)
 
+columns_to_check = ['si<fn', 'useczeros', '$SI M time prior to shimcache time', 
+                    '$SI times prior to $I30', '$SI times prior to exe compile time',
+                    'BASIC_INFO_CHANGE after creation', 'Timestamps regressed between snapshots']
 
-args = parser.parse_args()
-specified_directory = args.outdir
 
+def true_counts(df):
+    """Count, per row, the boolean indicator columns that are True; rows matching the known-good baseline count 0."""
+    true_count = np.zeros(len(df), dtype=np.int64)
+    for col in columns_to_check:
+        values = as_booleans(df[col])
+        if values is not None:
+            true_count += values.eq(True).fillna(False).to_numpy(dtype=np.int64)
+    known_good = as_booleans(df[BASELINE_COLUMN]) if BASELINE_COLUMN in df.columns else None
+    if known_good is not None:
+        true_count[known_good.eq(True).fillna(False).to_numpy(dtype=bool)] = 0
+    return true_count
 
-if not os.path.isdir(specified_directory):
-    print(f"Error: The specified directory '{specified_directory}' does not exist.")
-else:
-   
-    input_file_path = os.path.join(specified_directory, "merged_output.csv")
-    output_file_path = os.path.join(specified_directory, "merged_output.csv")
+
+def add_true_count(df):
+    """Add a 'true_count' column counting the boolean indicators that are True on each row."""
+    missing_columns = [col for col in columns_to_check if col not in df.columns]
+    if missing_columns:
+        print(f"Error: The following columns are missing from the file: {missing_columns}")
+        return None
+
+    df['true_count'] = true_counts(df)
+    return df
+
+
+def add_true_count_columnar(input_file_path, fmt, fleet=None):
+    """Score a Parquet/Arrow merged_output by reading only the indicator columns, then append true_count.
+
+    With a fleet prevalence table the path and SHA1 are read too, and the fleet columns are appended as well.
+    """
+    columns = columns_to_check + [BASELINE_COLUMN] + (FLEET_INPUT_COLUMNS if fleet is not None else [])
+    indicators = read_table(input_file_path, fmt, columns).to_pandas()
+    missing_columns = [col for col in columns_to_check if col not in indicators.columns]
+    if missing_columns:
+        print(f"Error: The following columns are missing from the file: {missing_columns}")
+        return None
+
+    indicators["true_count"] = true_counts(indicators)
+    scores = ["true_count"]
+    if fleet is not None:
+        indicators = add_fleet_prevalence(indicators, fleet)
+        scores += FLEET_COLUMNS
+
+    table = read_table(input_file_path, fmt)
+    table = table.drop([col for col in scores if col in table.column_names])
+    for col in scores:
+        table = table.append_column(col, pa.Array.from_pandas(indicators[col]))
+    write_table(table, input_file_path, fmt)
+    return input_file_path
+
+
+def save_results_db(df, specified_directory):
+    """Write the scored rows to the indexed SQLite results database in the directory."""
+    db_path = write_results_db(df, os.path.join(specified_directory, DB_NAME), columns_to_check + [BASELINE_COLUMN])
+    print(f"Results database saved as {db_path}")
+    return db_path
+
+
+def main(specified_directory, sqlite=False, fleet=None, fleet_summary=False):
+    """Add true_count to the latest merged_output in the directory, in place, and return its path or None.
+
+    With sqlite set, the scored rows are also written to an indexed SQLite database for results_store.py queries.
+    With a fleet prevalence table from fleet_stats.py, the fleet prevalence columns and fleet_score are added;
+    with fleet_summary set, the host's own mergeable summary is written next to merged_output.
+    """
+    input_file_path, fmt = find_stage(specified_directory, "merged_output")
+    fleet = load_summary(fleet) if fleet else None
 
   
-    if not os.path.isfile(input_file_path):
+    if input_file_path is None:
         print(f"Error: The input file 'merged_output.csv' does not exist in the specified directory: {specified_directory}")
+        return None
+    if fmt == "csv":
+        df = add_true_count(pd.read_csv(input_file_path))
+        if df is None:
+            return None
+        if fleet is not None:
+            df = add_fleet_prevalence(df, fleet)
+        output_file_path = write_stage(df, specified_directory, "merged_output", fmt)
+        print(f"File saved successfully as {output_file_path}")
+        if sqlite:
+            save_results_db(df, specified_directory)
+        if fleet_summary:
+            write_host_summary(df, specified_directory)
+        return output_file_path
+    if add_true_count_columnar(input_file_path, fmt, fleet):
+        print(f"File saved successfully as {input_file_path}")
+        if sqlite:
+            save_results_db(read_table(input_file_path, fmt).to_pandas(), specified_directory)
+        if fleet_summary:
+            write_host_summary(read_table(input_file_path, fmt, FLEET_INPUT_COLUMNS + columns_to_check).to_pandas(), specified_directory)
+        return input_file_path
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process merged_output.csv and save the output in the specified directory.")
+    parser.add_argument(
+        "-outdir", 
+        type=str, 
+        required=True, 
+        help="Directory containing the input file and where the output file will be saved."
+    )
+    parser.add_argument("-sqlite", action="store_true", help=f"Also write the scored rows to an indexed SQLite database, {DB_NAME}.")
+    parser.add_argument("-fleet", default=None, help="Fleet prevalence table merged by fleet_stats.py; adds the fleet columns and fleet_score.")
+    parser.add_argument("-fleet_summary", action="store_true", help=f"Also write this host's mergeable summary, {SUMMARY_NAME}.")
+
+
+    args = parser.parse_args()
+    specified_directory = args.outdir
+
+
+    if not os.path.isdir(specified_directory):
+        print(f"Error: The specified directory '{specified_directory}' does not exist.")
+    elif args.fleet and not os.path.exists(args.fleet):
+        print(f"Error: Fleet prevalence table not found at {args.fleet}")
     else:
-        df = pd.read_csv(input_file_path)
-        columns_to_check = ['si<fn', 'useczeros', '$SI M time prior to shimcache time', 
-                            '$SI times prior to $I30', '$SI times prior to exe compile time']
-
-        missing_columns = [col for col in columns_to_check if col not in df.columns]
-        if missing_columns:
-            print(f"Error: The following columns are missing from the file: {missing_columns}")
-        else:
-            
-            def count_valid_trues(row):
-                count = 0
-                for col in columns_to_check:
-                    value = row[col]
-                  
-                    if isinstance(value, bool):
-                        count += value  
-                return count
-
-            tqdm.pandas(desc="Processing rows")
-            df['true_count'] = df.progress_apply(count_valid_trues, axis=1)
-
-            df.to_csv(output_file_path, index=False)
-            print(f"File saved successfully as {output_file_path}")
+        main(specified_directory, args.sqlite, args.fleet, args.fleet_summary)
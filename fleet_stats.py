@@ -0,0 +1,274 @@
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from baseline import KEY_SEPARATOR, PATTERN_COLUMNS, cell_strings
+from path_normalizer import normalize_paths
+from stage_io import as_booleans, find_stage, read_stage
+
+
+SUMMARY_NAME = "fleet_summary.npz"
+FLEET_NAME = "fleet_prevalence.npz"
+
+# Items seen on fewer hosts than this keep an exact count; the rest are counted in the sketch.
+EXACT_BELOW = 100
+SKETCH_WIDTH = 1 << 22
+SKETCH_DEPTH = 4
+MERGE_BATCH = 64
+
+# Odd multipliers hashing a key to its column in each row of the count-min sketch.
+SKETCH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                               0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9], dtype=np.uint64)
+
+FLEET_COLUMNS = ["fleet_hosts_with_path", "fleet_hosts_with_hits", "fleet_hosts_with_sha1", "fleet_score"]
+FLEET_INPUT_COLUMNS = ["merge_key", "sha1"]
+
+
+def item_keys(kind, values):
+    """64-bit keys of items of one kind (path, an indicator hit on a path, a SHA1) from a column of strings."""
+    text = pd.Series(values, dtype=object)
+    return pd.util.hash_array((kind + KEY_SEPARATOR + text).to_numpy(dtype=object))
+
+
+def indicator_hits(df, col):
+    """Rows where an indicator is True, counted the way count-true counts them."""
+    values = as_booleans(df[col]) if col in df.columns else None
+    if values is None:
+        return np.zeros(len(df), dtype=bool)
+    return values.eq(True).fillna(False).to_numpy(dtype=bool)
+
+
+def first_sha1(df):
+    """The first of the '; '-joined Amcache SHA1s of each row, lower-cased, '' where there is none."""
+    return cell_strings(df, "sha1").str.split("; ", n=1).str[0].str.lower().to_numpy(dtype=object)
+
+
+def host_items(df):
+    """The distinct item keys of one host's merged_output: its paths, its (indicator, path) hits and its SHA1s."""
+    paths = pd.Series(normalize_paths(df["merge_key"], fold_case=True), dtype=object).fillna("").to_numpy(dtype=object)
+    keys = [item_keys("path", paths)]
+    for col in PATTERN_COLUMNS:
+        keys.append(item_keys("hit" + KEY_SEPARATOR + col, paths[indicator_hits(df, col)]))
+    sha1s = cell_strings(df, "sha1").str.lower().str.split("; ").explode()
+    keys.append(item_keys("sha1", sha1s[sha1s != ""].to_numpy(dtype=object)))
+    return np.unique(np.concatenate(keys))
+
+
+def summarize_host(df):
+    """Reduce a host's merged_output to a mergeable summary that counts each of its items once."""
+    keys = host_items(df)
+    return {"hosts": 1, "keys": keys, "counts": np.ones(len(keys), dtype=np.uint32), "sketch": None, "exact_below": EXACT_BELOW}
+
+
+def sketch_columns(keys, width, depth):
+    """Column of each key in each row of a sketch of the given power-of-two width, by multiplicative hashing."""
+    return (SKETCH_MULTIPLIERS[:depth, None] * keys[None, :]) >> np.uint64(65 - width.bit_length())
+
+
+def sketch_estimate(sketch, keys):
+    """Count-min estimate of each key: the smallest of its counters, never below its true count."""
+    depth, width = sketch.shape
+    columns = sketch_columns(keys, width, depth)
+    return sketch[np.arange(depth)[:, None], columns].min(axis=0)
+
+
+def sketch_add(sketch, keys, counts):
+    depth, width = sketch.shape
+    columns = sketch_columns(keys, width, depth)
+    for row in range(depth):
+        sketch[row] += np.bincount(columns[row], weights=counts, minlength=width).astype(np.uint32)
+
+
+def merge_summaries(summaries, exact_below=EXACT_BELOW, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+    """Combine summaries into one, as if every host had been summarized together.
+
+    Exact counts of the same key are added up. A key reaching exact_below hosts, or one the
+    sketch already holds, moves into the count-min sketch, so the exact table only grows with
+    rare items and the sketch stays a fixed depth x width whatever the fleet size.
+    """
+    keys, inverse = np.unique(np.concatenate([summary["keys"] for summary in summaries]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([summary["counts"] for summary in summaries]),
+                         minlength=len(keys)).astype(np.uint32)
+
+    sketch = None
+    for summary in summaries:
+        if summary["sketch"] is None:
+            continue
+        if summary["sketch"].shape != (depth, width):
+            raise ValueError(f"Cannot merge a {summary['sketch'].shape} sketch into a {(depth, width)} one")
+        sketch = summary["sketch"].copy() if sketch is None else sketch + summary["sketch"]
+
+    common = counts >= exact_below
+    if sketch is not None:
+        common |= sketch_estimate(sketch, keys) >= exact_below
+    if common.any():
+        if sketch is None:
+            sketch = np.zeros((depth, width), dtype=np.uint32)
+        sketch_add(sketch, keys[common], counts[common])
+    return {"hosts": sum(summary["hosts"] for summary in summaries), "keys": keys[~common], "counts": counts[~common],
+            "sketch": sketch, "exact_below": exact_below}
+
+
+def prevalence(summary, keys):
+    """Number of hosts of a summary holding each key: exact below its threshold, the sketch's estimate above it.
+
+    A key is either in the exact table or promoted to the sketch, never both, so a key with an
+    exact count takes it alone; the sketch only holds other keys' collisions for it.
+    """
+    found = np.zeros(len(keys), dtype=np.int64)
+    exact = np.zeros(len(keys), dtype=bool)
+    if len(summary["keys"]):
+        positions = np.minimum(np.searchsorted(summary["keys"], keys), len(summary["keys"]) - 1)
+        exact = summary["keys"][positions] == keys
+        found[exact] = summary["counts"][positions[exact]]
+    if summary["sketch"] is not None:
+        estimate = sketch_estimate(summary["sketch"], keys[~exact]).astype(np.int64)
+        found[~exact] = np.where(estimate >= summary["exact_below"], estimate, 0)
+    return found
+
+
+def save_summary(summary, path):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as outfile:
+        np.savez_compressed(outfile, hosts=summary["hosts"], keys=summary["keys"], counts=summary["counts"],
+                            sketch=summary["sketch"] if summary["sketch"] is not None else np.zeros((0, 0), dtype=np.uint32),
+                            exact_below=summary["exact_below"])
+    os.replace(temp_path, path)
+    return path
+
+
+def load_summary(path):
+    with np.load(path) as data:
+        sketch = data["sketch"]
+        return {"hosts": int(data["hosts"]), "keys": data["keys"], "counts": data["counts"],
+                "sketch": sketch if sketch.size else None, "exact_below": int(data["exact_below"])}
+
+
+def write_host_summary(df, outdir):
+    """Summarize a host's scored rows to outdir/fleet_summary.npz."""
+    path = save_summary(summarize_host(df), os.path.join(outdir, SUMMARY_NAME))
+    print(f"Fleet summary saved as {path}")
+    return path
+
+
+def merge_group(paths, out_path, exact_below=EXACT_BELOW, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+    """Merge summary files MERGE_BATCH at a time into one file, holding one batch of summaries in memory."""
+    merged = None
+    for start in range(0, len(paths), MERGE_BATCH):
+        batch = [load_summary(path) for path in paths[start:start + MERGE_BATCH]]
+        merged = merge_summaries(batch if merged is None else [merged] + batch, exact_below, width, depth)
+    return save_summary(merged, out_path)
+
+
+def merge_fleet(paths, out_path, workers=1, exact_below=EXACT_BELOW, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+    """Merge host (or already merged) summary files into a fleet prevalence table.
+
+    The files are split between `workers` processes, each merging its share into a partial
+    table, and the partial tables are merged last. Only summaries are ever loaded, never rows.
+    """
+    if workers <= 1 or len(paths) <= MERGE_BATCH:
+        return merge_group(paths, out_path, exact_below, width, depth)
+    work_dir = tempfile.mkdtemp(prefix="fleet_merge_", dir=os.path.dirname(os.path.abspath(out_path)))
+    try:
+        groups = [paths[index::workers] for index in range(workers)]
+        partial_paths = [os.path.join(work_dir, f"partial_{index}.npz") for index in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partials = list(executor.map(merge_group, groups, partial_paths, repeat(exact_below), repeat(width), repeat(depth)))
+        return merge_group(partials, out_path, exact_below, width, depth)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def find_summaries(inputs):
+    """Summary files given directly, or found anywhere below the given directories (a batch outroot holds one per host)."""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths += sorted(glob.glob(os.path.join(path, "**", SUMMARY_NAME), recursive=True))
+        else:
+            paths.append(path)
+    return paths
+
+
+def counts_where(counts, present):
+    """Counts as a nullable integer column, missing where a row has nothing to count."""
+    column = pd.array(counts, dtype="Int64")
+    column[~present] = pd.NA
+    return column
+
+
+def add_fleet_prevalence(df, fleet):
+    """Add how many fleet hosts share each row's path, its indicator hits and its SHA1, and a rarity-weighted score.
+
+    fleet_hosts_with_hits is the number of hosts showing the row's rarest indicator hit on the
+    same path. fleet_score weights true_count by log2(fleet hosts / that number), so a hit on every
+    host scores 0 and a hit on one host out of 2,000 scores about 11 times its true_count.
+    """
+    paths = pd.Series(normalize_paths(df["merge_key"], fold_case=True), dtype=object).fillna("").to_numpy(dtype=object)
+    df["fleet_hosts_with_path"] = prevalence(fleet, item_keys("path", paths))
+
+    hit_hosts = np.full(len(df), np.iinfo(np.int64).max, dtype=np.int64)
+    for col in PATTERN_COLUMNS:
+        hits = indicator_hits(df, col)
+        if hits.any():
+            hit_hosts[hits] = np.minimum(hit_hosts[hits], prevalence(fleet, item_keys("hit" + KEY_SEPARATOR + col, paths[hits])))
+    any_hit = hit_hosts != np.iinfo(np.int64).max
+    hit_hosts[~any_hit] = 0
+    df["fleet_hosts_with_hits"] = counts_where(hit_hosts, any_hit)
+
+    sha1s = first_sha1(df)
+    has_sha1 = sha1s != ""
+    sha1_hosts = np.zeros(len(df), dtype=np.int64)
+    sha1_hosts[has_sha1] = prevalence(fleet, item_keys("sha1", sha1s[has_sha1]))
+    df["fleet_hosts_with_sha1"] = counts_where(sha1_hosts, has_sha1)
+
+    rarity = np.log2(fleet["hosts"] / np.clip(hit_hosts, 1, None))
+    df["fleet_score"] = np.round(df["true_count"].to_numpy(dtype=np.float64) * np.clip(rarity, 0, None), 2)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize host results and merge the summaries into fleet-wide prevalence statistics.")
+    parser.add_argument("-summarize", nargs="+", default=None, help="Host output directories to write a fleet_summary.npz for, from their merged_output.")
+    parser.add_argument("-merge", nargs="+", default=None, help="Summary files, or directories searched for them, to merge into -out.")
+    parser.add_argument("-out", default=None, help=f"Fleet prevalence table written by -merge (default: ./{FLEET_NAME}).")
+    parser.add_argument("-workers", type=int, default=1, help="Number of processes merging summaries.")
+    parser.add_argument("-exact_below", type=int, default=EXACT_BELOW, help="Items on fewer hosts than this keep exact counts.")
+    parser.add_argument("-sketch_width", type=int, default=SKETCH_WIDTH, help="Counters per row of the count-min sketch (a power of two).")
+    parser.add_argument("-sketch_depth", type=int, default=SKETCH_DEPTH, help=f"Rows of the count-min sketch (at most {len(SKETCH_MULTIPLIERS)}).")
+    args = parser.parse_args()
+
+    if not args.summarize and not args.merge:
+        print("Error: Give -summarize to summarize host outputs or -merge to combine summaries.")
+        exit(1)
+    if args.sketch_width & (args.sketch_width - 1) or not 1 <= args.sketch_depth <= len(SKETCH_MULTIPLIERS):
+        print(f"Error: -sketch_width must be a power of two and -sketch_depth between 1 and {len(SKETCH_MULTIPLIERS)}.")
+        exit(1)
+
+    for outdir in args.summarize or []:
+        if find_stage(outdir, "merged_output")[0] is None:
+            print(f"Error: No merged_output found in {outdir}")
+            exit(1)
+        write_host_summary(read_stage(outdir, "merged_output"), outdir)
+
+    if args.merge:
+        paths = find_summaries(args.merge)
+        if not paths:
+            print(f"Error: No {SUMMARY_NAME} found in {args.merge}")
+            exit(1)
+        out_path = args.out or FLEET_NAME
+        try:
+            merge_fleet(paths, out_path, args.workers, args.exact_below, args.sketch_width, args.sketch_depth)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+        fleet = load_summary(out_path)
+        print(f"Merged {len(paths)} summaries of {fleet['hosts']} hosts into {out_path}: "
+              f"{len(fleet['keys'])} rare items counted exactly")
@@ -0,0 +1,293 @@
+import mmap
+import os
+import struct
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from mft_parser import filetime_to_string
+from path_normalizer import normalize_paths
+
+
+BASE_BLOCK_SIZE = 4096
+NO_CELL = 0xFFFFFFFF
+BIG_DATA_SEGMENT = 16344
+
+KEY_COMP_NAME = 0x0020
+VALUE_COMP_NAME = 0x0001
+DATA_RESIDENT = 0x80000000
+
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_DWORD = 4
+REG_QWORD = 11
+
+AMCACHE_FILES_KEY = "Root\\InventoryApplicationFile"
+AMCACHE_DRIVERS_KEY = "Root\\InventoryDriverBinary"
+SHIMCACHE_KEY = "Control\\Session Manager\\AppCompatCache"
+
+# Windows 10 AppCompatCache headers are 0x30 bytes, 0x34 from the Creators Update on.
+WIN10_HEADER_SIZES = (0x30, 0x34)
+WIN10_ENTRY_SIGNATURE = b"10ts"
+
+AMCACHE_COLUMNS = ["SHA1", "FullPath", "FileExtension", "LinkDate", "Size", "Full Path with the name"]
+SHIMCACHE_COLUMNS = ["ControlSet", "CacheEntryPosition", "Path", "LastModifiedTimeUTC"]
+
+
+def open_hive(hive_path):
+    """Memory-map a registry hive and return (hive, root key position). Nothing else is read up front.
+
+    Transaction logs (.LOG1/.LOG2) are not replayed, so changes of a dirty hive still pending
+    in its logs are missing; a warning is printed when the base block says the hive is dirty.
+    """
+    with open(hive_path, "rb") as infile:
+        hive = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    if hive[:4] != b"regf":
+        hive.close()
+        raise ValueError(f"{hive_path} is not a registry hive")
+    primary, secondary = struct.unpack_from("<II", hive, 4)
+    if primary != secondary:
+        print(f"Warning: {hive_path} is dirty; changes pending in its .LOG1/.LOG2 transaction logs are not replayed.")
+    root = cell(hive, struct.unpack_from("<I", hive, 0x24)[0])
+    if root is None or hive[root:root + 2] != b"nk":
+        hive.close()
+        raise ValueError(f"{hive_path} has no valid root key")
+    return hive, root
+
+
+def cell(hive, offset):
+    """Return the position of the data of the cell at a hive bin offset, or None if the offset points nowhere."""
+    position = BASE_BLOCK_SIZE + offset + 4
+    if offset == NO_CELL or position >= len(hive):
+        return None
+    return position
+
+
+def key_name(hive, key):
+    flags = struct.unpack_from("<H", hive, key + 2)[0]
+    length = struct.unpack_from("<H", hive, key + 72)[0]
+    raw = hive[key + 76:key + 76 + length]
+    return raw.decode("latin-1") if flags & KEY_COMP_NAME else raw.decode("utf-16-le", "replace")
+
+
+def iter_key_list(hive, offset):
+    """Yield the key positions of an lf/lh/li subkey list, following ri lists of lists."""
+    position = cell(hive, offset)
+    if position is None:
+        return
+    signature = hive[position:position + 2]
+    count = struct.unpack_from("<H", hive, position + 2)[0]
+    if signature in (b"lf", b"lh"):
+        offsets = struct.unpack_from(f"<{2 * count}I", hive, position + 4)[::2]
+    elif signature in (b"li", b"ri"):
+        offsets = struct.unpack_from(f"<{count}I", hive, position + 4)
+    else:
+        return
+
+    for child in offsets:
+        if signature == b"ri":
+            yield from iter_key_list(hive, child)
+            continue
+        key = cell(hive, child)
+        if key is not None and hive[key:key + 2] == b"nk":
+            yield key
+
+
+def iter_subkeys(hive, key):
+    count, list_offset = struct.unpack_from("<I4xI", hive, key + 20)
+    if count:
+        yield from iter_key_list(hive, list_offset)
+
+
+def open_key(hive, key, path):
+    """Walk a backslash-separated path of subkey names down from key, case-insensitively; None if it is missing."""
+    for name in path.split("\\"):
+        name = name.casefold()
+        key = next((subkey for subkey in iter_subkeys(hive, key) if key_name(hive, subkey).casefold() == name), None)
+        if key is None:
+            return None
+    return key
+
+
+def iter_values(hive, key):
+    count, list_offset = struct.unpack_from("<II", hive, key + 36)
+    position = cell(hive, list_offset) if count else None
+    if position is None:
+        return
+    for offset in struct.unpack_from(f"<{count}I", hive, position):
+        value = cell(hive, offset)
+        if value is not None and hive[value:value + 2] == b"vk":
+            yield value
+
+
+def value_name(hive, value):
+    length, flags = struct.unpack_from("<H12xH", hive, value + 2)
+    raw = hive[value + 20:value + 20 + length]
+    return raw.decode("latin-1") if flags & VALUE_COMP_NAME else raw.decode("utf-16-le", "replace")
+
+
+def value_data(hive, value):
+    """Return (type, raw bytes) of a value, reassembling big data ("db") values split over several cells."""
+    size, data_offset, data_type = struct.unpack_from("<III", hive, value + 4)
+    if size & DATA_RESIDENT:
+        return data_type, hive[value + 8:value + 8 + min(size & ~DATA_RESIDENT, 4)]
+
+    position = cell(hive, data_offset)
+    if position is None:
+        return data_type, b""
+    minor_version = struct.unpack_from("<I", hive, 0x18)[0]
+    if size > BIG_DATA_SEGMENT and minor_version >= 4 and hive[position:position + 2] == b"db":
+        segments, list_offset = struct.unpack_from("<HI", hive, position + 2)
+        segment_list = cell(hive, list_offset)
+        chunks = [hive[segment:segment + BIG_DATA_SEGMENT]
+                  for segment in (cell(hive, offset) for offset in struct.unpack_from(f"<{segments}I", hive, segment_list))
+                  if segment is not None]
+        return data_type, b"".join(chunks)[:size]
+    return data_type, hive[position:position + size]
+
+
+def decode_value(data_type, data):
+    if data_type in (REG_SZ, REG_EXPAND_SZ):
+        return data.decode("utf-16-le", "replace").split("\0", 1)[0]
+    if data_type == REG_DWORD and len(data) >= 4:
+        return struct.unpack_from("<I", data)[0]
+    if data_type == REG_QWORD and len(data) >= 8:
+        return struct.unpack_from("<Q", data)[0]
+    return data
+
+
+def key_values(hive, key, names):
+    """Decode only the named values of a key into a dict; values that are not present are left out."""
+    wanted = {name.casefold(): name for name in names}
+    found = {}
+    for value in iter_values(hive, key):
+        name = wanted.get(value_name(hive, value).casefold())
+        if name is not None:
+            found[name] = decode_value(*value_data(hive, value))
+            if len(found) == len(wanted):
+                break
+    return found
+
+
+def parse_size(value):
+    """Amcache Size is a QWORD, or on some builds a string: decimal, or hex with a 0x prefix. None if unreadable."""
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    try:
+        return int(value, 16) if value[:2].lower() == "0x" else int(value)
+    except ValueError:
+        return None
+
+
+def seconds_string(stamps):
+    """Format datetimes as 'yyyy-MM-dd HH:mm:ss', the Zimmerman tools' CSV format; NaT becomes NaN."""
+    return stamps.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object).where(stamps.notna(), np.nan)
+
+
+def parse_amcache(hive_path):
+    """Read the file and driver inventory of an Amcache.hve into the columns amcache-extraction keeps.
+
+    Only Root\\InventoryApplicationFile and Root\\InventoryDriverBinary are walked, and of each
+    entry only the values that end up in a column are decoded.
+    """
+    hive, root = open_hive(hive_path)
+    try:
+        files_key = open_key(hive, root, AMCACHE_FILES_KEY)
+        drivers_key = open_key(hive, root, AMCACHE_DRIVERS_KEY)
+        if files_key is None and drivers_key is None:
+            raise ValueError(f"{hive_path} has no {AMCACHE_FILES_KEY} or {AMCACHE_DRIVERS_KEY} key (pre-Windows 10 Amcache?)")
+
+        files = [key_values(hive, entry, ["LowerCaseLongPath", "FileId", "LinkDate", "Size"])
+                 for entry in (iter_subkeys(hive, files_key) if files_key is not None else [])]
+        drivers = [(key_name(hive, entry), key_values(hive, entry, ["DriverTimeStamp"]).get("DriverTimeStamp"))
+                   for entry in (iter_subkeys(hive, drivers_key) if drivers_key is not None else [])]
+    finally:
+        hive.close()
+
+    file_df = pd.DataFrame({
+        "SHA1": [entry.get("FileId") for entry in files],
+        "FullPath": [entry.get("LowerCaseLongPath") for entry in files],
+        "LinkDate": [entry.get("LinkDate") for entry in files],
+        "Size": [entry.get("Size") for entry in files],
+    }, dtype=object)
+    # FileId is the SHA-1 behind four zero characters; LinkDate is stored as "MM/dd/yyyy HH:mm:ss".
+    file_df["SHA1"] = file_df["SHA1"].where(file_df["SHA1"].str[:4] != "0000", file_df["SHA1"].str[4:])
+    file_df["FileExtension"] = file_df["FullPath"].str.extract(r"(\.[^.\\]*)$", expand=False)
+    file_df["LinkDate"] = seconds_string(pd.to_datetime(file_df["LinkDate"], format="%m/%d/%Y %H:%M:%S", errors="coerce"))
+    file_df["Size"] = pd.to_numeric(file_df["Size"].map(parse_size), errors="coerce")
+
+    # DriverTimeStamp is the driver's PE link time in Unix seconds.
+    timestamps = pd.to_numeric(pd.Series([stamp for _, stamp in drivers], dtype=object), errors="coerce")
+    driver_df = pd.DataFrame({
+        "FullPath": pd.Series([name for name, _ in drivers], dtype=object),
+        "LinkDate": seconds_string(pd.to_datetime(timestamps.where(timestamps > 0), unit="s")),
+    })
+
+    combined = pd.concat([file_df, driver_df], ignore_index=True)
+    combined["Full Path with the name"] = normalize_paths(combined["FullPath"])
+    return combined.reindex(columns=AMCACHE_COLUMNS)
+
+
+def parse_shimcache_value(data):
+    """Decode a Windows 10 AppCompatCache value into a list of (path, FILETIME ticks), in cache order."""
+    header_size = struct.unpack_from("<I", data)[0] if len(data) >= 4 else 0
+    if header_size not in WIN10_HEADER_SIZES or data[header_size:header_size + 4] != WIN10_ENTRY_SIGNATURE:
+        raise ValueError("AppCompatCache value is not in the Windows 10 format")
+
+    entries = []
+    position = header_size
+    while position + 14 <= len(data) and data[position:position + 4] == WIN10_ENTRY_SIGNATURE:
+        entry_size, path_length = struct.unpack_from("<IH", data, position + 8)
+        path_end = position + 14 + path_length
+        if path_end + 8 > len(data):
+            break
+        path = data[position + 14:path_end].decode("utf-16-le", "replace")
+        entries.append((path, struct.unpack_from("<Q", data, path_end)[0]))
+        position += 12 + entry_size
+    return entries
+
+
+def parse_shimcache(hive_path):
+    """Read the AppCompatCache of every ControlSet00x of a SYSTEM hive, like AppCompatCacheParser's CSV."""
+    hive, root = open_hive(hive_path)
+    rows = []
+    try:
+        control_sets = sorted((key_name(hive, key), key) for key in iter_subkeys(hive, root)
+                              if key_name(hive, key).casefold().startswith("controlset"))
+        for name, control_set in control_sets:
+            cache_key = open_key(hive, control_set, SHIMCACHE_KEY)
+            if cache_key is None:
+                continue
+            value = next((value for value in iter_values(hive, cache_key) if value_name(hive, value) == "AppCompatCache"), None)
+            if value is None:
+                continue
+            for position, (path, ticks) in enumerate(parse_shimcache_value(value_data(hive, value)[1])):
+                rows.append((int(name[-3:]) if name[-3:].isdigit() else name, position, path, ticks))
+    finally:
+        hive.close()
+
+    df = pd.DataFrame(rows, columns=["ControlSet", "CacheEntryPosition", "Path", "Ticks"])
+    df["LastModifiedTimeUTC"] = filetime_to_string(df["Ticks"].to_numpy(dtype=np.uint64)).str[:19].to_numpy()
+    return df[SHIMCACHE_COLUMNS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read Amcache or ShimCache entries straight from a registry hive.")
+    parser.add_argument("-amcache", default=None, help="Path to an Amcache.hve to read the file and driver inventory from.")
+    parser.add_argument("-system", default=None, help="Path to a SYSTEM hive to read the AppCompatCache from.")
+    parser.add_argument("-out", required=True, help="Path of the CSV file to write.")
+    args = parser.parse_args()
+
+    hive_path = args.amcache or args.system
+    if not hive_path or (args.amcache and args.system):
+        print("Error: Specify exactly one of -amcache or -system.")
+        exit(1)
+    if not os.path.exists(hive_path):
+        print(f"Error: Hive file not found at {hive_path}")
+        exit(1)
+
+    df = parse_amcache(hive_path) if args.amcache else parse_shimcache(hive_path)
+    df.to_csv(args.out, index=False)
+    print(f"Read {len(df)} entries into: {args.out}")
@@ -0,0 +1,287 @@
+import mmap
+import os
+import struct
+import argparse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from mft_parser import (
+    BATCH_RECORDS, FLAG_DIRECTORY, FLAG_IN_USE, ROOT_ENTRY,
+    apply_fixups, filetime_to_string, iter_attributes, parse_data_runs, parse_file_name, parse_mft, read_record_size, resident_content,
+)
+from path_normalizer import join_paths
+from stage_io import FORMATS, write_stage
+
+
+ATTR_INDEX_ROOT = 0x90
+ATTR_INDEX_ALLOCATION = 0xA0
+I30_NAME = "$I30"
+
+ENTRY_LAST = 0x02
+INDX_HEADER_OFFSET = 24
+DEFAULT_INDEX_BLOCK_SIZE = 4096
+
+NAME_TYPES = {0: "POSIX", 1: "Win32", 2: "DOS", 3: "DOS+Win32"}
+
+# A carved slack key is only accepted when all four of its times fall between 1980 and 2100.
+MIN_SLACK_FILETIME = 119600064000000000
+MAX_SLACK_FILETIME = 157469184000000000
+
+I30_COLUMNS = [
+    "FullPath", "Name", "NameType", "Size", "AllocatedSize", "IsSlack", "SlackOffset",
+    "Mtime", "Atime", "Ctime", "Btime", "MFTId", "Full Path with the name",
+]
+
+
+def read_boot_sector(volume):
+    """Return (cluster_size, index_block_size) from the NTFS boot sector of a raw volume."""
+    bytes_per_sector = struct.unpack_from("<H", volume, 0x0B)[0]
+    sectors_per_cluster = volume[0x0D]
+    if sectors_per_cluster > 0x80:
+        sectors_per_cluster = 1 << (256 - sectors_per_cluster)
+    cluster_size = bytes_per_sector * sectors_per_cluster
+    clusters_per_index = struct.unpack_from("<b", volume, 0x44)[0]
+    index_block_size = cluster_size * clusters_per_index if clusters_per_index > 0 else 1 << -clusters_per_index
+    return cluster_size, index_block_size
+
+
+def parse_index_key(buffer, start, end):
+    """Decode the $FILE_NAME key of an index entry into (parent_entry, times, namespace, name, size, allocated)."""
+    parsed = parse_file_name(buffer, start, end)
+    if parsed is None:
+        return None
+    parent_entry, _, times, namespace, name = parsed
+    allocated, size = struct.unpack_from("<QQ", buffer, start + 40)
+    return parent_entry, times, namespace, name, size, allocated
+
+
+def plausible_slack_key(key):
+    """Reject carved keys whose namespace, name or timestamps cannot belong to a real deleted entry."""
+    _, times, namespace, name, _, _ = key
+    return (
+        namespace in NAME_TYPES
+        and name
+        and "\x00" not in name
+        and all(MIN_SLACK_FILETIME <= value <= MAX_SLACK_FILETIME for value in times)
+    )
+
+
+def walk_index_entries(buffer, start, used_end):
+    """Yield (offset, file_reference, key) for every allocated entry of an index node."""
+    offset = start
+    while offset + 16 <= used_end:
+        file_reference, entry_length, key_length, flags = struct.unpack_from("<QHHH", buffer, offset)
+        if entry_length < 16 or offset + entry_length > used_end or flags & ENTRY_LAST:
+            return
+        if key_length >= 66:
+            key = parse_index_key(buffer, offset + 16, offset + 16 + key_length)
+            if key is not None:
+                yield offset, file_reference, key
+        offset += entry_length
+
+
+def carve_slack_entries(buffer, start, end, directory_entry):
+    """Yield (offset, file_reference, key) for deleted entries whose key names directory_entry as parent."""
+    start = (start + 7) & ~7
+    if end - start < 82:
+        return
+    words = np.frombuffer(buffer, dtype="<u8", count=(end - start) // 8, offset=start)
+    for index in np.flatnonzero((words & 0xFFFFFFFFFFFF) == directory_entry):
+        key_start = start + 8 * int(index)
+        key = parse_index_key(buffer, key_start, end)
+        if key is None or not plausible_slack_key(key):
+            continue
+        file_reference = struct.unpack_from("<Q", buffer, key_start - 16)[0] if key_start >= 16 else 0
+        yield key_start - 16, file_reference, key
+
+
+def index_node_rows(buffer, header_offset, directory_entry, stream_offset=None):
+    """Return (is_slack, slack_offset, file_reference, key) rows for one index node, slack included."""
+    first, used, allocated = struct.unpack_from("<III", buffer, header_offset)
+    used_end = min(header_offset + used, len(buffer))
+    allocated_end = min(header_offset + allocated, len(buffer))
+
+    rows = [(False, None, reference, key) for _, reference, key in walk_index_entries(buffer, header_offset + first, used_end)]
+    if directory_entry is not None:
+        for offset, reference, key in carve_slack_entries(buffer, used_end, allocated_end, directory_entry):
+            slack_offset = offset if stream_offset is None else stream_offset + offset
+            rows.append((True, slack_offset, reference, key))
+    return rows
+
+
+def index_blocks(stream, block_size):
+    """Split an $INDEX_ALLOCATION stream into fixed-up INDX buffers, yielding (stream_offset, bytes)."""
+    count = len(stream) // block_size
+    if not count:
+        return
+    blocks = np.frombuffer(stream, dtype=np.uint8, count=count * block_size).reshape(count, block_size)
+    signature = (blocks[:, 0] == 0x49) & (blocks[:, 1] == 0x4E) & (blocks[:, 2] == 0x44) & (blocks[:, 3] == 0x58)
+    candidates = np.flatnonzero(signature)
+    batch = blocks[candidates].copy()
+    valid = apply_fixups(batch)
+    for index in np.flatnonzero(valid):
+        yield int(candidates[index]) * block_size, batch[index].tobytes()
+
+
+def parse_index_allocation(stream, block_size=DEFAULT_INDEX_BLOCK_SIZE, directory_entry=None):
+    """Return the entry rows of an $INDEX_ALLOCATION stream, recovering slack entries.
+
+    When the directory's MFT entry number is not known it is taken from the parent
+    reference most of the allocated entries share.
+    """
+    blocks = list(index_blocks(stream, block_size))
+    if directory_entry is None:
+        parents = Counter(
+            key[0]
+            for _, block in blocks
+            for _, _, key in walk_index_entries(block, INDX_HEADER_OFFSET + struct.unpack_from("<I", block, INDX_HEADER_OFFSET)[0],
+                                                INDX_HEADER_OFFSET + struct.unpack_from("<I", block, INDX_HEADER_OFFSET + 4)[0])
+        )
+        directory_entry = parents.most_common(1)[0][0] if parents else None
+
+    rows = []
+    for stream_offset, block in blocks:
+        rows.extend(index_node_rows(block, INDX_HEADER_OFFSET, directory_entry, stream_offset))
+    return rows
+
+
+def read_runs(volume, runs, cluster_size, real_size):
+    """Read a non-resident attribute's clusters from the mapped volume, zero-filling sparse runs."""
+    chunks = []
+    for lcn, count in runs:
+        if lcn is None:
+            chunks.append(bytes(count * cluster_size))
+        else:
+            chunks.append(volume[lcn * cluster_size:(lcn + count) * cluster_size])
+    return b"".join(chunks)[:real_size]
+
+
+def directory_index_rows(record, entry, volume, cluster_size, default_block_size):
+    """Collect the $I30 entry rows of one directory FILE record from $INDEX_ROOT and $INDEX_ALLOCATION."""
+    first_offset = struct.unpack_from("<H", record, 20)[0]
+    rows = []
+    block_size = default_block_size
+    allocation = None
+
+    for attr_type, offset, _, non_resident, name in iter_attributes(record, first_offset):
+        if name != I30_NAME:
+            continue
+        if attr_type == ATTR_INDEX_ROOT and not non_resident:
+            start, end = resident_content(record, offset)
+            block_size = struct.unpack_from("<I", record, start + 8)[0] or default_block_size
+            rows.extend(index_node_rows(record[:end], start + 16, entry))
+        elif attr_type == ATTR_INDEX_ALLOCATION and non_resident:
+            real_size = struct.unpack_from("<Q", record, offset + 48)[0]
+            allocation = (parse_data_runs(record, offset), real_size)
+
+    if allocation is not None and volume is not None:
+        stream = read_runs(volume, allocation[0], cluster_size, allocation[1])
+        rows.extend(parse_index_allocation(stream, block_size, entry))
+    return rows
+
+
+def directory_paths(mft_path, workers=1):
+    """Map every MFT entry number to its path relative to the volume root."""
+    df = parse_mft(mft_path, workers=workers)
+    full_paths = join_paths(df["ParentPath"], df["FileName"])
+    paths = dict(zip(df["EntryNumber"].astype(int), full_paths))
+    paths[ROOT_ENTRY] = ""
+    return paths
+
+
+def rows_to_frame(rows, drive):
+    """Build the Windows.NTFS.I30-style columns from (directory_path, is_slack, slack_offset, reference, key) rows."""
+    directory = pd.Series([row[0] for row in rows], dtype=object)
+    keys = [row[4] for row in rows]
+    names = pd.Series([key[3] for key in keys], dtype=object)
+    times = np.array([key[1] for key in keys], dtype=np.uint64).reshape(-1, 4)
+
+    def velociraptor_time(values):
+        text = filetime_to_string(values)
+        return text.str[:10] + "T" + text.str[11:] + "Z"
+
+    prefix = "\\\\.\\" + drive.rstrip("\\")
+    df = pd.DataFrame({
+        "FullPath": np.where(directory == "", prefix, prefix + "\\" + directory),
+        "Name": names,
+        "NameType": [NAME_TYPES.get(key[2], "") for key in keys],
+        "Size": [key[4] for key in keys],
+        "AllocatedSize": [key[5] for key in keys],
+        "IsSlack": [row[1] for row in rows],
+        "SlackOffset": pd.array([row[2] for row in rows], dtype="Int64"),
+        "Mtime": velociraptor_time(times[:, 1]),
+        "Atime": velociraptor_time(times[:, 3]),
+        "Ctime": velociraptor_time(times[:, 2]),
+        "Btime": velociraptor_time(times[:, 0]),
+        "MFTId": [row[3] & 0xFFFFFFFFFFFF for row in rows],
+        "Full Path with the name": join_paths(directory, names),
+    })
+    return df[I30_COLUMNS]
+
+
+def parse_volume_i30(mft_path, volume_path, drive="C:", workers=1, batch_records=BATCH_RECORDS):
+    """Parse the $I30 index of every in-use directory in the $MFT in one memory-mapped pass over the volume."""
+    paths = directory_paths(mft_path, workers)
+    record_size = read_record_size(mft_path)
+    total = os.path.getsize(mft_path) // record_size
+    rows = []
+
+    with open(volume_path, "rb") as volume_handle, mmap.mmap(volume_handle.fileno(), 0, access=mmap.ACCESS_READ) as volume, \
+            open(mft_path, "rb") as mft_handle, mmap.mmap(mft_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        cluster_size, default_block_size = read_boot_sector(volume)
+
+        for batch_start in range(0, total, batch_records):
+            batch_end = min(batch_start + batch_records, total)
+            records = np.frombuffer(mapped[batch_start * record_size:batch_end * record_size], dtype=np.uint8).reshape(-1, record_size)
+            flags = records[:, 22].astype(np.uint16) | (records[:, 23].astype(np.uint16) << 8)
+            signature = (records[:, 0] == 0x46) & (records[:, 1] == 0x49) & (records[:, 2] == 0x4C) & (records[:, 3] == 0x45)
+            candidates = np.flatnonzero(signature & ((flags & (FLAG_IN_USE | FLAG_DIRECTORY)) == (FLAG_IN_USE | FLAG_DIRECTORY)))
+            if not len(candidates):
+                continue
+            batch = records[candidates].copy()
+            valid = apply_fixups(batch)
+
+            for index in np.flatnonzero(valid):
+                entry = batch_start + int(candidates[index])
+                directory = paths.get(entry, f"PathUnknown\\Directory with ID 0x{entry:08X}")
+                for is_slack, slack_offset, reference, key in directory_index_rows(
+                        batch[index].tobytes(), entry, volume, cluster_size, default_block_size):
+                    rows.append((directory, is_slack, slack_offset, reference, key))
+
+    return rows_to_frame(rows, drive)
+
+
+def parse_index_stream(stream_path, directory_path, drive="C:", block_size=DEFAULT_INDEX_BLOCK_SIZE, directory_entry=None):
+    """Parse a single directory's extracted $I30 $INDEX_ALLOCATION stream."""
+    with open(stream_path, "rb") as handle:
+        stream = handle.read()
+    rows = [(directory_path, *row) for row in parse_index_allocation(stream, block_size, directory_entry)]
+    return rows_to_frame(rows, drive)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse NTFS $I30 directory indexes, including slack entries.")
+    parser.add_argument("-outdir", required=True, help="Path to the output directory.")
+    parser.add_argument("-mft", help="Path to the $MFT file (used with -volume).")
+    parser.add_argument("-volume", help="Path to the raw NTFS volume image or device the $MFT belongs to.")
+    parser.add_argument("-stream", help="Path to an extracted $I30 $INDEX_ALLOCATION stream of one directory.")
+    parser.add_argument("-dirpath", default="", help="Volume-relative path of the directory the -stream belongs to.")
+    parser.add_argument("-blocksize", type=int, default=DEFAULT_INDEX_BLOCK_SIZE, help="INDX buffer size of the -stream.")
+    parser.add_argument("-drive", default="C:", help="Drive letter used in the FullPath column.")
+    parser.add_argument("-workers", type=int, default=1, help="Number of processes for the $MFT path pass.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of the output (parquet and arrow need pyarrow).")
+    args = parser.parse_args()
+
+    if args.stream:
+        df = parse_index_stream(args.stream, args.dirpath, args.drive, args.blocksize)
+    elif args.mft and args.volume:
+        df = parse_volume_i30(args.mft, args.volume, args.drive, args.workers)
+    else:
+        print("Error: pass either -mft and -volume, or -stream.")
+        exit(1)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    output_file = write_stage(df, args.outdir, "consolidated_i30_data", args.format)
+    print(f"Parsed {len(df)} $I30 entries ({int(df['IsSlack'].sum())} from slack) into: {output_file}")
@@ -3,6 +3,22 @@ import pandas as pd
 import os
 import argparse
 from datetime import datetime
+from mft_parser import parse_mft
+from path_normalizer import join_paths, normalize_directories
+from stage_io import DEFAULT_CHUNK_ROWS, FORMATS, as_booleans, parse_ticks, usec_zeros, write_stage, write_stage_batches
+
+
+MFT_COLUMNS = [
+    'EntryNumber', 'SequenceNumber', 'ParentEntryNumber', 'ParentSequenceNumber', 'ParentPath', 'FileName', 'Created0x10', 'Created0x30',
+    'LastModified0x10', 'LastModified0x30',
+    'LastRecordChange0x10', 'LastRecordChange0x30',
+    'SI<FN', 'uSecZeros'
+]
+
+# Types the MFTECmd columns are read with. The flags are read as text and converted per
+# chunk, so a row with an empty flag does not stop the read.
+MFT_CSV_DTYPES = {col: str for col in MFT_COLUMNS}
+MFT_CSV_DTYPES.update({col: 'int64' for col in ['EntryNumber', 'SequenceNumber', 'ParentEntryNumber', 'ParentSequenceNumber']})
 
 
 def generate_mft_csv(mftecmd_path, mft_file_path, output_directory):
@@ -25,29 +41,68 @@ def generate_mft_csv(mftecmd_path, mft_file_path, output_directory):
         return None
 
 
-def extract_mft_info(csv_file, output_directory):
-    
-    df = pd.read_csv(csv_file, low_memory=False)
-    print("Columns in CSV:", df.columns.tolist())
-
-    relevant_columns = [
-        'ParentPath', 'FileName', 'Created0x10', 'Created0x30',
-        'LastModified0x10', 'LastModified0x30',
-        'LastRecordChange0x10', 'LastRecordChange0x30',
-        'SI<FN', 'uSecZeros'
-    ]
+def shape_mft_info(df):
+    """Keep the columns the checks need and build 'Full Path with the name' from an MFTECmd-style frame."""
+    extracted_data = df[MFT_COLUMNS].copy()
 
-    extracted_data = df[relevant_columns]
+    extracted_data['Full Path with the name'] = join_paths(extracted_data['ParentPath'], extracted_data['FileName'])
+    extracted_data['ParentPath'] = normalize_directories(extracted_data['ParentPath'])
 
-    extracted_data['ParentPath'] = extracted_data['ParentPath'].str.replace(r'^\.\\', '', regex=True)
-    extracted_data['Full Path with the name'] = (
-        extracted_data['ParentPath'].str.rstrip('\\') + '\\' + extracted_data['FileName']
-    )
-    extracted_data['Full Path with the name'] = extracted_data['Full Path with the name'].str.replace(r'^\.\\', '', regex=True)
+    # Recomputed at full 100 ns precision, the same way for MFTECmd output and the built-in parser.
+    extracted_data['uSecZeros'] = usec_zeros(*(parse_ticks(extracted_data[col])
+                                               for col in ['Created0x10', 'LastModified0x10', 'LastRecordChange0x10']))
+
+    return extracted_data
+
+
+def iter_mft_info(csv_file, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Read an MFTECmd CSV chunk_rows rows at a time, parsing only the columns the checks need, and yield each chunk shaped."""
+    for chunk in pd.read_csv(csv_file, usecols=MFT_COLUMNS, dtype=MFT_CSV_DTYPES, chunksize=chunk_rows):
+        flags = as_booleans(chunk['SI<FN'])
+        if flags is not None:
+            chunk['SI<FN'] = flags
+        yield shape_mft_info(chunk)
+
+
+def extract_mft_info(csv_file, output_directory, write_output=True, fmt="csv", chunk_rows=DEFAULT_CHUNK_ROWS, keep_frame=False):
+    """Extract the MFT columns the checks need from an MFTECmd CSV, streaming it chunk by chunk.
+
+    Each shaped chunk is appended to the output as soon as it is read and then dropped, so memory
+    stays at one chunk whatever the size of the MFT, and the output path is returned. With
+    keep_frame set the chunks are kept and the shaped frame is returned instead.
+    """
+    kept = []
+
+    def chunks():
+        for chunk in iter_mft_info(csv_file, chunk_rows):
+            if keep_frame:
+                kept.append(chunk)
+            yield chunk
+
+    extracted_file = None
+    if write_output:
+        extracted_file = write_stage_batches(chunks(), output_directory, 'extracted_mft_info', fmt)
+        print(f"Extracted information saved to: {extracted_file}")
+    else:
+        for _ in chunks():
+            pass
 
-    extracted_file = os.path.join(output_directory, 'extracted_mft_info.csv')
-    extracted_data.to_csv(extracted_file, index=False)
-    print(f"Extracted information saved to: {extracted_file}")
+    if not keep_frame:
+        return extracted_file
+    return pd.concat(kept, ignore_index=True)
+
+
+def extract_mft_info_native(mft_file_path, output_directory, workers=1, write_output=True, fmt="csv"):
+    """Parse the $MFT with the built-in parser and save the same columns as extract_mft_info."""
+    if not os.path.exists(mft_file_path):
+        print(f"Error: MFT file not found at {mft_file_path}")
+        return None
+
+    extracted_data = shape_mft_info(parse_mft(mft_file_path, workers=workers))
+
+    if write_output:
+        extracted_file = write_stage(extracted_data, output_directory, 'extracted_mft_info', fmt)
+        print(f"Extracted information saved to: {extracted_file}")
 
     return extracted_data
 
@@ -58,8 +113,7 @@ if __name__ == "__main__":
     
     parser.add_argument(
         "-toolsdir", "--tools_directory",
-        required=True,
-        help="Path to the directory containing the tools (e.g., mftecmd.exe)."
+        help="Path to the directory containing the tools (e.g., mftecmd.exe); not needed with -native."
     )
     
     parser.add_argument(
@@ -74,14 +128,33 @@ if __name__ == "__main__":
         help="Path to the output directory where results will be saved."
     )
     
+    parser.add_argument(
+        "-native",
+        action="store_true",
+        help="Parse the $MFT with the built-in parser instead of running mftecmd.exe."
+    )
+
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=1,
+        help="Number of processes the built-in parser shards the record range across."
+    )
+
+    parser.add_argument(
+        "-format",
+        choices=list(FORMATS),
+        default="csv",
+        help="File format of extracted_mft_info (parquet and arrow need pyarrow)."
+    )
+    
     args = parser.parse_args()
 
 
-    mftecmd_path = os.path.join(args.tools_directory, "mftecmd.exe")
     mft_file_path = os.path.join(args.files_directory, "$mft")
 
   
-    if not os.path.exists(args.tools_directory):
+    if not args.native and not (args.tools_directory and os.path.exists(args.tools_directory)):
         raise FileNotFoundError(f"Tools directory not found: {args.tools_directory}")
     if not os.path.exists(args.files_directory):
         raise FileNotFoundError(f"Files directory not found: {args.files_directory}")
@@ -89,9 +162,14 @@ if __name__ == "__main__":
         os.makedirs(args.output_directory)
 
 
-    generated_csv = generate_mft_csv(mftecmd_path, mft_file_path, args.output_directory)
+    if args.native:
+        extracted_data = extract_mft_info_native(mft_file_path, args.output_directory, workers=args.workers, fmt=args.format)
+        if extracted_data is not None:
+            print(extracted_data)
+    else:
+        mftecmd_path = os.path.join(args.tools_directory, "mftecmd.exe")
+        generated_csv = generate_mft_csv(mftecmd_path, mft_file_path, args.output_directory)
 
-   
-    if generated_csv:
-        extracted_data = extract_mft_info(generated_csv, args.output_directory)
-        print(extracted_data)
+       
+        if generated_csv:
+            extract_mft_info(generated_csv, args.output_directory, fmt=args.format)
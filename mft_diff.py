@@ -0,0 +1,212 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import mft
+from stage_io import FORMATS, NO_TICKS, find_stage, parse_ticks, read_stage, write_stage
+
+
+SI_FIELDS = ["Created0x10", "LastModified0x10", "LastRecordChange0x10"]
+FN_FIELDS = ["Created0x30", "LastModified0x30", "LastRecordChange0x30"]
+
+# extracted_mft_info columns a snapshot is diffed on
+SNAPSHOT_COLUMNS = (["EntryNumber", "SequenceNumber", "ParentEntryNumber", "ParentSequenceNumber", "FileName", "Full Path with the name"]
+                    + SI_FIELDS + FN_FIELDS)
+
+# Record-indexed arrays of record numbers, -1 where the record is absent
+NUMBER_FIELDS = ["SequenceNumber", "ParentEntryNumber", "ParentSequenceNumber"]
+
+DIFF_COLUMNS = ["EntryNumber", "SequenceNumber", "PreviousSequenceNumber", "Snapshot", "NextSnapshot",
+                "Full Path with the name", "PreviousPath", "SIRegressed", "FNRegressed", "Reused", "Renamed", "SnapshotChanges"]
+
+
+def snapshot_label(path):
+    """Name a snapshot after its directory, or the directory holding its $MFT or CSV."""
+    path = os.path.abspath(path)
+    return os.path.basename(path if os.path.isdir(path) else os.path.dirname(path)) or path
+
+
+def load_snapshot(path, workers=1):
+    """Read one MFT snapshot as extracted_mft_info columns.
+
+    path is an output directory holding extracted_mft_info, an MFTECmd CSV, or a raw $MFT,
+    which is read with the built-in parser.
+    """
+    if os.path.isdir(path):
+        if find_stage(path, "extracted_mft_info")[0] is None:
+            raise FileNotFoundError(f"No extracted_mft_info found in {path}")
+        return read_stage(path, "extracted_mft_info", SNAPSHOT_COLUMNS)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Snapshot not found at {path}")
+    if path.lower().endswith(".csv"):
+        return pd.concat(list(mft.iter_mft_info(path)), ignore_index=True)
+    return mft.shape_mft_info(mft.parse_mft(path, workers=workers))
+
+
+def index_records(df):
+    """Lay a snapshot out in arrays indexed by record number: sequence and parent numbers (-1 where absent), tick columns, names and paths.
+
+    MFTECmd can list a record more than once (one row per alternate data stream); its first row is kept.
+    """
+    entries = df["EntryNumber"].to_numpy(dtype=np.int64)
+    size = int(entries.max()) + 1 if len(entries) else 0
+    rows = np.full(size, -1, dtype=np.int64)
+    rows[entries[::-1]] = np.arange(len(entries) - 1, -1, -1)
+    present = rows >= 0
+    taken = rows[present]
+
+    def column(values, fill, dtype):
+        laid_out = np.full(size, fill, dtype=dtype)
+        laid_out[present] = np.asarray(values)[taken]
+        return laid_out
+
+    records = {field: column(df[field].to_numpy(dtype=np.int64), -1, np.int64) for field in NUMBER_FIELDS}
+    records["FileName"] = column(df["FileName"].to_numpy(dtype=object), None, object)
+    records["Path"] = column(df["Full Path with the name"].to_numpy(dtype=object), None, object)
+    for field in SI_FIELDS + FN_FIELDS:
+        records[field] = column(parse_ticks(df[field]), NO_TICKS, np.int64)
+    return records
+
+
+def resize(records, size):
+    """Pad record-indexed arrays with absent records up to size."""
+    padded = {}
+    for key, values in records.items():
+        fill = -1 if key in NUMBER_FIELDS else NO_TICKS if values.dtype == np.int64 else None
+        padded[key] = np.concatenate((values, np.full(size - len(values), fill, dtype=values.dtype)))
+    return padded
+
+
+def regressed_fields(older, newer, fields, same):
+    """For each record of the same file in both snapshots, the fields whose time moved backwards, joined with ', '."""
+    names = np.full(len(same), "", dtype=object)
+    for field in fields:
+        backwards = same & (older[field] != NO_TICKS) & (newer[field] != NO_TICKS) & (newer[field] < older[field])
+        names[backwards] = np.where(names[backwards] == "", field, names[backwards] + ", " + field)
+    return names
+
+
+def diff_pair(older, newer, report_paths, older_label, newer_label):
+    """Compare two record-indexed snapshots in one pass and return a row per record that changed between them.
+
+    A record holding the same sequence number in both is the same file: its $SI and $FN times
+    should only move forward, and a new name or parent directory means it was renamed or moved; a file
+    whose directory was renamed keeps both, so it is not reported. A record whose sequence number
+    changed was freed and reused by another file. Rows are reported under report_paths, the path
+    the newer file has in the latest snapshot. All arrays are of one size.
+    """
+    in_both = (older["SequenceNumber"] >= 0) & (newer["SequenceNumber"] >= 0)
+    same = in_both & (older["SequenceNumber"] == newer["SequenceNumber"])
+    reused = in_both & ~same
+
+    si_regressed = regressed_fields(older, newer, SI_FIELDS, same)
+    fn_regressed = regressed_fields(older, newer, FN_FIELDS, same)
+    renamed = same & ((older["FileName"] != newer["FileName"]) | (older["ParentEntryNumber"] != newer["ParentEntryNumber"])
+                      | (older["ParentSequenceNumber"] != newer["ParentSequenceNumber"]))
+
+    changed = np.flatnonzero((si_regressed != "") | (fn_regressed != "") | renamed | reused)
+    between = f"({older_label} -> {newer_label})"
+    changes = np.full(len(changed), "", dtype=object)
+    previous_paths = older["Path"][changed]
+    previous_text = pd.Series(previous_paths, dtype=object).fillna("").to_numpy(dtype=object)
+    notes = [(si_regressed[changed] != "", "$SI " + si_regressed[changed] + " regressed " + between),
+             (fn_regressed[changed] != "", "$FN " + fn_regressed[changed] + " regressed " + between),
+             (renamed[changed], "renamed from " + previous_text + " " + between),
+             (reused[changed], "record reused, was " + previous_text + " " + between)]
+    for flags, note in notes:
+        changes[flags] = np.where(changes[flags] == "", note[flags], changes[flags] + "; " + note[flags])
+
+    return pd.DataFrame({
+        "EntryNumber": changed,
+        "SequenceNumber": newer["SequenceNumber"][changed],
+        "PreviousSequenceNumber": older["SequenceNumber"][changed],
+        "Snapshot": older_label,
+        "NextSnapshot": newer_label,
+        "Full Path with the name": report_paths[changed],
+        "PreviousPath": previous_paths,
+        "SIRegressed": si_regressed[changed],
+        "FNRegressed": fn_regressed[changed],
+        "Reused": reused[changed],
+        "Renamed": renamed[changed],
+        "SnapshotChanges": changes,
+    }, columns=DIFF_COLUMNS)
+
+
+def diff_snapshots(snapshots, labels):
+    """Diff MFT snapshots, oldest first, each against the next, holding two of them in memory at a time.
+
+    snapshots yields extracted_mft_info frames, or callables returning one. They are aligned
+    by (entry, sequence) number rather than joined on paths, and walked from the latest back so
+    that every finding is keyed by the path its file has in the latest snapshot.
+    """
+    snapshots = list(snapshots)
+    load = lambda snapshot: index_records(snapshot() if callable(snapshot) else snapshot)
+
+    newer = load(snapshots[-1])
+    report_paths = newer["Path"]
+    found = []
+    for position in range(len(snapshots) - 2, -1, -1):
+        older = load(snapshots[position])
+        size = max(len(older["SequenceNumber"]), len(newer["SequenceNumber"]))
+        older, newer = resize(older, size), resize(newer, size)
+        report_paths = np.concatenate((report_paths, np.full(size - len(report_paths), None, dtype=object)))
+        found.append(diff_pair(older, newer, report_paths, labels[position], labels[position + 1]))
+        print(f"{labels[position]} -> {labels[position + 1]}: {len(found[-1])} changed records")
+        sys.stdout.flush()
+
+        # The same file in the older snapshot is reported under its latest path, any other under its own.
+        same = (older["SequenceNumber"] >= 0) & (older["SequenceNumber"] == newer["SequenceNumber"])
+        report_paths = np.where(same, report_paths, older["Path"])
+        newer = older
+
+    found.reverse()
+    return pd.concat(found, ignore_index=True) if found else pd.DataFrame(columns=DIFF_COLUMNS)
+
+
+def extract_mft_diff(snapshot_paths, output_directory, latest=None, write_output=True, fmt="csv", workers=1):
+    """Diff the MFT snapshots at snapshot_paths, oldest first, and save the changed records as mft_diff.
+
+    latest, an extracted_mft_info frame of the live volume, is diffed as the newest snapshot.
+    Without snapshots the stage is empty, so the check leaves its snapshot indicator blank.
+    """
+    snapshots = [lambda path=path: load_snapshot(path, workers) for path in snapshot_paths]
+    labels = [snapshot_label(path) for path in snapshot_paths]
+    if latest is not None:
+        snapshots.append(latest)
+        labels.append("live")
+
+    if len(snapshots) < 2:
+        print("Fewer than two MFT snapshots, skipping the snapshot checks.")
+        extracted_data = pd.DataFrame({col: pd.Series(dtype=object) for col in DIFF_COLUMNS})
+    else:
+        extracted_data = diff_snapshots(snapshots, labels)
+
+    if write_output:
+        extracted_file = write_stage(extracted_data, output_directory, "mft_diff", fmt)
+        print(f"Snapshot differences saved to: {extracted_file}")
+    return extracted_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diff MFT snapshots (e.g. from Volume Shadow Copies) record by record.")
+    parser.add_argument("-snapshots", nargs="+", required=True,
+                        help="Snapshots, oldest first: raw $MFT files, MFTECmd CSVs or output directories holding extracted_mft_info.")
+    parser.add_argument("-outdir", required=True, help="Output directory receiving mft_diff; its extracted_mft_info, if any, is diffed as the live volume.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of mft_diff (parquet and arrow need pyarrow).")
+    parser.add_argument("-workers", type=int, default=1, help="Number of processes the built-in parser shards each raw $MFT across.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.outdir):
+        print(f"Error: Output directory not found at {args.outdir}")
+        exit(1)
+
+    latest = read_stage(args.outdir, "extracted_mft_info", SNAPSHOT_COLUMNS) if find_stage(args.outdir, "extracted_mft_info")[0] else None
+    try:
+        extracted_data = extract_mft_diff(args.snapshots, args.outdir, latest, fmt=args.format, workers=args.workers)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        exit(1)
+    print(extracted_data)
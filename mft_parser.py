@@ -0,0 +1,305 @@
+import mmap
+import os
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+RECORD_SIZE = 1024
+SECTOR_SIZE = 512
+ROOT_ENTRY = 5
+BATCH_RECORDS = 65536
+
+ATTR_STANDARD_INFORMATION = 0x10
+ATTR_FILE_NAME = 0x30
+ATTR_END = 0xFFFFFFFF
+
+FLAG_IN_USE = 0x0001
+FLAG_DIRECTORY = 0x0002
+
+# Win32 and Win32&DOS names win over POSIX, DOS-only short names come last.
+NAMESPACE_RANK = {1: 0, 3: 0, 0: 1, 2: 2}
+
+TICKS_PER_SECOND = 10_000_000
+
+TIME_FIELDS = ["Created", "LastModified", "LastRecordChange", "LastAccess"]
+
+
+def apply_fixups(records):
+    """Apply update sequence fixups in place to an (n, size) uint8 batch of FILE or INDX buffers and return the valid mask."""
+    n, size = records.shape
+    rows = np.arange(n)
+    usa_offset = records[:, 4].astype(np.int64) | (records[:, 5].astype(np.int64) << 8)
+    usa_count = records[:, 6].astype(np.int64) | (records[:, 7].astype(np.int64) << 8)
+    sectors = size // SECTOR_SIZE
+
+    valid = (usa_offset + 2 * sectors + 2 <= size) & (usa_count == sectors + 1)
+    usa_offset = np.where(valid, usa_offset, 0)
+
+    for sector in range(sectors):
+        end = sector * SECTOR_SIZE + SECTOR_SIZE - 2
+        valid &= (records[:, end] == records[rows, usa_offset]) & (records[:, end + 1] == records[rows, usa_offset + 1])
+        fix = usa_offset + 2 + 2 * sector
+        records[:, end] = np.where(valid, records[rows, fix], records[:, end])
+        records[:, end + 1] = np.where(valid, records[rows, fix + 1], records[:, end + 1])
+
+    return valid
+
+
+def iter_attributes(record, first_offset):
+    """Yield (type, offset, length, non_resident, name) for each attribute header in a fixed-up record."""
+    offset = first_offset
+    size = len(record)
+    while offset + 16 <= size:
+        attr_type, length = struct.unpack_from("<II", record, offset)
+        if attr_type == ATTR_END or length < 16 or offset + length > size:
+            return
+        non_resident = record[offset + 8]
+        name_length = record[offset + 9]
+        name_offset = struct.unpack_from("<H", record, offset + 10)[0]
+        name = ""
+        if name_length:
+            start = offset + name_offset
+            name = bytes(record[start:start + 2 * name_length]).decode("utf-16-le", errors="replace")
+        yield attr_type, offset, length, non_resident, name
+        offset += length
+
+
+def resident_content(record, offset):
+    """Return the (start, end) byte range of a resident attribute's content."""
+    content_size, content_offset = struct.unpack_from("<IH", record, offset + 16)
+    start = offset + content_offset
+    return start, start + content_size
+
+
+def parse_data_runs(record, offset):
+    """Decode the run list of a non-resident attribute into (lcn, cluster_count) pairs; sparse runs have lcn None."""
+    length = struct.unpack_from("<I", record, offset + 4)[0]
+    position = offset + struct.unpack_from("<H", record, offset + 32)[0]
+    end = offset + length
+    runs = []
+    lcn = 0
+    while position < end and record[position]:
+        length_size = record[position] & 0x0F
+        offset_size = record[position] >> 4
+        start = position + 1
+        count = int.from_bytes(record[start:start + length_size], "little")
+        if offset_size:
+            lcn += int.from_bytes(record[start + length_size:start + length_size + offset_size], "little", signed=True)
+            runs.append((lcn, count))
+        else:
+            runs.append((None, count))
+        position = start + length_size + offset_size
+    return runs
+
+
+def parse_file_name(record, start, end):
+    """Decode a $FILE_NAME body into (parent_entry, parent_seq, times, namespace, name)."""
+    if end - start < 66:
+        return None
+    parent_ref, created, modified, changed, accessed = struct.unpack_from("<QQQQQ", record, start)
+    name_length = record[start + 64]
+    namespace = record[start + 65]
+    name_end = start + 66 + 2 * name_length
+    if name_end > end:
+        return None
+    name = bytes(record[start + 66:name_end]).decode("utf-16-le", errors="replace")
+    return (
+        parent_ref & 0xFFFFFFFFFFFF,
+        parent_ref >> 48,
+        (created, modified, changed, accessed),
+        namespace,
+        name,
+    )
+
+
+def parse_record(record):
+    """Decode one fixed-up FILE record into a tuple of its base fields, or None if it holds no $FILE_NAME."""
+    sequence, _, first_offset, flags = struct.unpack_from("<HHHH", record, 16)
+    base_ref = struct.unpack_from("<Q", record, 32)[0]
+    if base_ref & 0xFFFFFFFFFFFF:
+        # Extension records carry overflow attributes of their base record and have no path of their own.
+        return None
+
+    si_times = (0, 0, 0, 0)
+    best = None
+    for attr_type, offset, _, non_resident, _ in iter_attributes(record, first_offset):
+        if non_resident:
+            continue
+        if attr_type == ATTR_STANDARD_INFORMATION:
+            start, end = resident_content(record, offset)
+            if end - start >= 32:
+                si_times = struct.unpack_from("<QQQQ", record, start)
+        elif attr_type == ATTR_FILE_NAME:
+            parsed = parse_file_name(record, *resident_content(record, offset))
+            if parsed and (best is None or NAMESPACE_RANK.get(parsed[3], 3) < NAMESPACE_RANK.get(best[3], 3)):
+                best = parsed
+
+    if best is None:
+        return None
+    parent_entry, parent_seq, fn_times, _, name = best
+    return sequence, flags, parent_entry, parent_seq, name, si_times, fn_times
+
+
+def read_record_size(mft_path):
+    """Return the FILE record size of an $MFT from the header of its first record: 1024, or 4096 on 4K-sector volumes."""
+    with open(mft_path, "rb") as handle:
+        header = handle.read(32)
+    if len(header) == 32 and header[:4] == b"FILE":
+        size = struct.unpack_from("<I", header, 28)[0]
+        if size >= SECTOR_SIZE and size & (size - 1) == 0:
+            return size
+    return RECORD_SIZE
+
+
+def parse_record_range(mft_path, start_entry, end_entry, batch_records=BATCH_RECORDS, record_size=RECORD_SIZE):
+    """Decode records [start_entry, end_entry) of an $MFT file and return them as column lists."""
+    columns = {
+        "EntryNumber": [], "SequenceNumber": [], "InUse": [], "IsDirectory": [],
+        "ParentEntryNumber": [], "ParentSequenceNumber": [], "FileName": [],
+    }
+    for field in TIME_FIELDS:
+        columns[f"{field}0x10"] = []
+        columns[f"{field}0x30"] = []
+
+    with open(mft_path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for batch_start in range(start_entry, end_entry, batch_records):
+            batch_end = min(batch_start + batch_records, end_entry)
+            raw = mapped[batch_start * record_size:batch_end * record_size]
+            records = np.frombuffer(raw, dtype=np.uint8).reshape(-1, record_size)
+
+            signature = (records[:, 0] == 0x46) & (records[:, 1] == 0x49) & (records[:, 2] == 0x4C) & (records[:, 3] == 0x45)
+            candidates = np.flatnonzero(signature)
+            if not len(candidates):
+                continue
+            batch = records[candidates].copy()
+            valid = apply_fixups(batch)
+
+            for index in np.flatnonzero(valid):
+                record = batch[index].tobytes()
+                parsed = parse_record(record)
+                if parsed is None:
+                    continue
+                sequence, flags, parent_entry, parent_seq, name, si_times, fn_times = parsed
+                columns["EntryNumber"].append(batch_start + int(candidates[index]))
+                columns["SequenceNumber"].append(sequence)
+                columns["InUse"].append(bool(flags & FLAG_IN_USE))
+                columns["IsDirectory"].append(bool(flags & FLAG_DIRECTORY))
+                columns["ParentEntryNumber"].append(parent_entry)
+                columns["ParentSequenceNumber"].append(parent_seq)
+                columns["FileName"].append(name)
+                for field, si_value, fn_value in zip(TIME_FIELDS, si_times, fn_times):
+                    columns[f"{field}0x10"].append(si_value)
+                    columns[f"{field}0x30"].append(fn_value)
+
+    return columns
+
+
+def build_parent_paths(entries, sequences, parents, parent_seqs, names, is_dir):
+    """Resolve every referenced parent directory to an MFTECmd-style '.\\' relative path."""
+    directories = {
+        int(entry): (int(seq), int(parent), int(parent_seq), str(name))
+        for entry, seq, parent, parent_seq, name, directory in zip(entries, sequences, parents, parent_seqs, names, is_dir)
+        if directory
+    }
+    resolved = {(ROOT_ENTRY, directories.get(ROOT_ENTRY, (0,))[0]): "."}
+
+    for start in set(zip(map(int, parents), map(int, parent_seqs))):
+        chain = []
+        key = start
+        while key not in resolved:
+            entry, seq = key
+            info = directories.get(entry)
+            if entry == ROOT_ENTRY:
+                resolved[key] = "."
+                break
+            if info is None or info[0] != seq or key in chain:
+                resolved[key] = f".\\PathUnknown\\Directory with ID 0x{entry:08X}-{seq:08X}"
+                break
+            chain.append(key)
+            key = (info[1], info[2])
+        for key in reversed(chain):
+            info = directories[key[0]]
+            resolved[key] = resolved[(info[1], info[2])] + "\\" + info[3]
+
+    return resolved
+
+
+def filetime_to_string(ticks):
+    """Format FILETIME ticks as MFTECmd 'yyyy-MM-dd HH:mm:ss.fffffff' strings; zero ticks become NaN."""
+    ticks = np.asarray(ticks, dtype=np.uint64)
+    seconds = (ticks // TICKS_PER_SECOND).astype(np.int64)
+    fraction = (ticks % TICKS_PER_SECOND).astype(np.int64)
+    stamps = np.datetime64("1601-01-01T00:00:00", "s") + seconds.astype("timedelta64[s]")
+
+    # Assemble the 27 characters directly in a UCS4 buffer instead of per-row string operations.
+    chars = np.empty((len(ticks), 27), dtype=np.uint32)
+    chars[:, :19] = np.datetime_as_string(stamps, unit="s").astype("<U19").view(np.uint32).reshape(-1, 19)
+    chars[:, 10] = ord(" ")
+    chars[:, 19] = ord(".")
+    for position in range(7):
+        chars[:, 26 - position] = fraction // 10 ** position % 10 + ord("0")
+
+    text = chars.view("<U27").ravel().astype(object)
+    text[ticks == 0] = np.nan
+    return pd.Series(text)
+
+
+def parse_mft(mft_path, workers=1, batch_records=BATCH_RECORDS):
+    """Parse an $MFT file into a DataFrame with the MFTECmd columns used by extract_mft_info."""
+    record_size = read_record_size(mft_path)
+    total = os.path.getsize(mft_path) // record_size
+    if workers > 1 and total > batch_records:
+        shard = -(-total // workers)
+        ranges = [(start, min(start + shard, total)) for start in range(0, total, shard)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(parse_record_range, [mft_path] * len(ranges),
+                                      [r[0] for r in ranges], [r[1] for r in ranges],
+                                      [batch_records] * len(ranges), [record_size] * len(ranges)))
+        columns = {key: [value for part in parts for value in part[key]] for key in parts[0]}
+    else:
+        columns = parse_record_range(mft_path, 0, total, batch_records, record_size)
+
+    raw = pd.DataFrame(columns)
+    paths = build_parent_paths(raw["EntryNumber"], raw["SequenceNumber"], raw["ParentEntryNumber"],
+                               raw["ParentSequenceNumber"], raw["FileName"], raw["IsDirectory"])
+
+    df = raw[["EntryNumber", "SequenceNumber", "InUse", "ParentEntryNumber", "ParentSequenceNumber", "FileName"]].copy()
+    parent_keys = zip(raw["ParentEntryNumber"].astype(int), raw["ParentSequenceNumber"].astype(int))
+    df.insert(3, "ParentPath", [paths[key] for key in parent_keys])
+
+    si_created = raw["Created0x10"].to_numpy(np.uint64)
+    si_modified = raw["LastModified0x10"].to_numpy(np.uint64)
+    si_changed = raw["LastRecordChange0x10"].to_numpy(np.uint64)
+    fn_created = raw["Created0x30"].to_numpy(np.uint64)
+    fn_modified = raw["LastModified0x30"].to_numpy(np.uint64)
+
+    for field in TIME_FIELDS:
+        df[f"{field}0x10"] = filetime_to_string(raw[f"{field}0x10"]).to_numpy()
+        df[f"{field}0x30"] = filetime_to_string(raw[f"{field}0x30"]).to_numpy()
+
+    # Zero ticks mean the time is missing, as for a record without $STANDARD_INFORMATION; they never count.
+    df["SI<FN"] = (((si_created != 0) & (fn_created != 0) & (si_created < fn_created))
+                   | ((si_modified != 0) & (fn_modified != 0) & (si_modified < fn_modified)))
+    df["uSecZeros"] = np.logical_or.reduce([(ticks != 0) & (ticks % TICKS_PER_SECOND == 0)
+                                            for ticks in (si_created, si_modified, si_changed)])
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse an $MFT file natively into an MFTECmd-compatible CSV.")
+    parser.add_argument("-mft", required=True, help="Path to the $MFT file.")
+    parser.add_argument("-out", required=True, help="Path of the CSV file to write.")
+    parser.add_argument("-workers", type=int, default=1, help="Number of processes to shard the record range across.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.mft):
+        print(f"Error: MFT file not found at {args.mft}")
+        exit(1)
+
+    df = parse_mft(args.mft, workers=args.workers)
+    df.to_csv(args.out, index=False)
+    print(f"Parsed {len(df)} records into: {args.out}")
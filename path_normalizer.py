@@ -0,0 +1,120 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# The memo of normalized directories is dropped and refilled once it holds this many entries.
+MAX_CACHED_DIRECTORIES = 1 << 20
+
+# Environment variables found in ShimCache, Amcache and service paths, as paths relative to the volume root.
+PATH_VARIABLES = {
+    "systemroot": "Windows",
+    "windir": "Windows",
+    "systemdrive": "",
+    "programfiles": "Program Files",
+    "programw6432": "Program Files",
+    "programfiles(x86)": "Program Files (x86)",
+    "commonprogramfiles": "Program Files\\Common Files",
+    "commonprogramfiles(x86)": "Program Files (x86)\\Common Files",
+    "programdata": "ProgramData",
+    "allusersprofile": "ProgramData",
+    "public": "Users\\Public",
+}
+
+VARIABLE = re.compile(r"%([^%\\]+)%")
+
+# An optional \\?\, \??\ or \\.\ namespace prefix, then what names the volume: a drive letter, a volume
+# GUID, a \Device\HarddiskVolumeN (or shadow copy) device path, ShimCache's SYSVOL or MFTECmd's '.' for the volume root.
+VOLUME_PREFIX = re.compile(
+    r"^(?:\\\\[?.]\\|\\\?\?\\)?"
+    r"(?:[a-z]:|volume\{[0-9a-f-]+\}|\\?(?:globalroot\\)?device\\harddiskvolume(?:shadowcopy)?\d+|sysvol|\.)(?=\\|$)",
+    re.IGNORECASE,
+)
+
+# Full paths that may change when normalized: everything else is already relative to the volume root.
+NEEDS_NORMALIZING = r"(?i)^(?:[\\.%]|[a-z]:|volume\{|sysvol(?:\\|$)|globalroot\\|device\\)|[/%]|\\$"
+
+# (directory, fold_case) -> normalized directory
+directory_cache = {}
+
+
+def expand_variable(match):
+    return PATH_VARIABLES.get(match.group(1).lower(), match.group(0))
+
+
+def normalize_directory(directory, fold_case=False):
+    """Normalize one directory to a path relative to its volume root, without leading or trailing backslashes.
+
+    Forward slashes become backslashes, known %VARIABLES% are expanded, and namespace, drive
+    letter, volume GUID and device prefixes are dropped. Results are memoized.
+    """
+    key = (directory, fold_case)
+    normalized = directory_cache.get(key)
+    if normalized is None:
+        if len(directory_cache) >= MAX_CACHED_DIRECTORIES:
+            directory_cache.clear()
+        path = VARIABLE.sub(expand_variable, directory.replace("/", "\\"))
+        path = VOLUME_PREFIX.sub("", path, count=1).strip("\\")
+        normalized = directory_cache[key] = path.lower() if fold_case else path
+    return normalized
+
+
+def normalize_directories(directories, fold_case=False):
+    """Normalize a column of directories, each distinct value once; missing values stay NaN. Returns an object array."""
+    directories = pd.Series(directories)
+    present = directories.notna().to_numpy()
+    codes, uniques = pd.factorize(directories[present])
+    normalized = np.full(len(directories), np.nan, dtype=object)
+    normalized[present] = np.array([normalize_directory(str(value), fold_case) for value in uniques], dtype=object)[codes]
+    return normalized
+
+
+def join_paths(directories, names, fold_case=False):
+    """Build normalized full paths from directory and name columns; NaN where either is missing. Returns an object array."""
+    directories = normalize_directories(directories, fold_case)
+    names = pd.Series(names)
+    present = pd.notna(directories) & names.notna().to_numpy()
+    name_values = names[present].astype(str)
+    name_values = (name_values.str.lower() if fold_case else name_values).to_numpy(dtype=object)
+
+    joined = np.full(len(names), np.nan, dtype=object)
+    parents = directories[present]
+    joined[present] = np.where(parents == "", name_values, parents + "\\" + name_values)
+    return joined
+
+
+def normalize_paths(paths, fold_case=False):
+    """Normalize a column of full paths: split at the last separator, normalize the parent once per distinct value, rejoin.
+
+    Paths already relative to the volume root are found with one vectorized match and only
+    case-folded, so re-normalizing a normalized column is cheap. With fold_case the result is
+    lower-cased, the form paths are compared in. A path ending in a separator, or without one,
+    or that is only a volume, is normalized whole as a directory, so 'C:', 'C:\\' and '\\\\.\\C:' all become ''.
+    Returns an object array.
+    """
+    paths = pd.Series(paths)
+    present = paths.notna().to_numpy()
+    text = paths[present].astype(str)
+    needs = text.str.contains(NEEDS_NORMALIZING, regex=True).to_numpy(dtype=bool)
+
+    normalized = np.empty(len(text), dtype=object)
+    plain = text[~needs]
+    normalized[~needs] = (plain.str.lower() if fold_case else plain).to_numpy(dtype=object)
+    if needs.any():
+        values = text[needs].tolist()
+        parts = [value.replace("/", "\\").rpartition("\\") for value in values]
+        joined = join_paths([part[0] for part in parts], [part[2] for part in parts], fold_case)
+        whole = np.array([not part[1] or not part[2] or VOLUME_PREFIX.fullmatch("".join(part)) is not None for part in parts])
+        joined[whole] = [normalize_directory(value, fold_case) for value, is_whole in zip(values, whole) if is_whole]
+        normalized[needs] = joined
+
+    result = np.full(len(paths), np.nan, dtype=object)
+    result[present] = normalized
+    return result
+
+
+def full_path(directory, name):
+    """Scalar join_paths, for rows rendered one at a time."""
+    directory = normalize_directory(directory)
+    return f"{directory}\\{name}" if directory else name
@@ -0,0 +1,334 @@
+import os
+import sys
+import shutil
+import argparse
+import importlib
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+
+import mft
+import appcompatcache
+import amcache
+import velocerabtor
+import check
+import fleet_stats
+import i30_parser
+import mft_diff
+import usn_parser
+import stage_cache
+import stage_metrics
+from stage_io import FORMATS, find_stage, read_stage, write_stage
+
+amcache_extraction = importlib.import_module("amcache-extraction")
+count_true = importlib.import_module("count-true")
+
+
+# File each stage writes when intermediate outputs are requested
+STAGE_OUTPUTS = {
+    "mft": "extracted_mft_info",
+    "appcompatcache": "extracted_appcompat_info",
+    "amcache": "amcache_combined_extracted",
+    "i30": "consolidated_i30_data",
+    "usn": "extracted_usn_info",
+    "snapshots": "mft_diff",
+}
+
+
+def log(message):
+    print(message)
+    sys.stdout.flush()
+
+
+def log_metrics(record):
+    """Log the headline metrics of a finished stage."""
+    log(f"Stage {record['stage']} {record['status']} in {record['wall_seconds']}s: rows out {record['rows_out']}, "
+        f"peak RSS {record['peak_rss_mb']} MB, {record['subprocesses']} subprocess(es) launched")
+
+
+def run_mft_stage(toolsdir, filesdir, outdir, native=False, workers=1, write_output=False, fmt="csv"):
+    """Extract the MFT columns, either through MFTECmd or the built-in parser."""
+    mft_file_path = os.path.join(filesdir, "$mft")
+    if native:
+        return mft.extract_mft_info_native(mft_file_path, outdir, workers=workers, write_output=write_output, fmt=fmt)
+
+    generated_csv = mft.generate_mft_csv(os.path.join(toolsdir, "mftecmd.exe"), mft_file_path, outdir)
+    if not generated_csv:
+        return None
+    # The CSV is streamed into the stage file one chunk at a time and read back in one go, rather than
+    # holding every chunk and their concatenation at once. Unless kept, the stage file goes to a scratch directory.
+    stage_dir = outdir if write_output else tempfile.mkdtemp(prefix="mft_", dir=outdir)
+    try:
+        mft.extract_mft_info(generated_csv, stage_dir, fmt=fmt)
+        return read_stage(stage_dir, "extracted_mft_info")
+    finally:
+        if not write_output:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+
+def run_appcompat_stage(toolsdir, filesdir, outdir, native=False, write_output=False, fmt="csv"):
+    """Extract the ShimCache columns from the SYSTEM hive, either through AppCompatCacheParser or the built-in reader."""
+    if native:
+        return appcompatcache.extract_appcompat_info_native(os.path.join(filesdir, "system"), outdir, write_output=write_output, fmt=fmt)
+
+    appcompat_path = os.path.join(toolsdir, "AppCompatCacheParser.exe")
+    generated_csv = appcompatcache.generate_appcompat_csv(appcompat_path, os.path.join(filesdir, "system"), outdir)
+    if generated_csv:
+        return appcompatcache.extract_appcompat_info(generated_csv, outdir, write_output=write_output, fmt=fmt)
+    return None
+
+
+def run_amcache_stage(toolsdir, filesdir, outdir, native=False, write_output=False, fmt="csv"):
+    """Parse Amcache.hve, either through AmcacheParser or the built-in reader, and combine the file and driver entries."""
+    hive_path = os.path.join(filesdir, "Amcache.hve")
+    if native:
+        combined_df = amcache_extraction.combine_amcache_native(hive_path)
+    else:
+        amcache.run_amcache_parser(toolsdir, hive_path, outdir)
+        combined_df = amcache_extraction.combine_amcache(outdir)
+    if combined_df is not None and write_output:
+        output_file = write_stage(combined_df, outdir, "amcache_combined_extracted", fmt)
+        print(f"Combined data saved to {output_file}")
+    return combined_df
+
+
+def run_i30_stage(toolsdir, outdir, partition, is_os_partition, fmt="csv", workers=1, recursive=False):
+    """Collect $I30 index entries through Velociraptor and load the consolidated result.
+
+    With recursive, each tree is one recursive collection streamed into the consolidated file.
+    """
+    velociraptor_path = os.path.join(toolsdir, "Velociraptor.exe")
+    if not os.path.exists(velociraptor_path):
+        print(f"Velociraptor executable not found in tools directory: {toolsdir}")
+        return None
+
+    consolidated_file = velocerabtor.consolidate_i30_index(velociraptor_path, partition, is_os_partition, outdir, fmt, workers=workers,
+                                                           recursive=recursive)
+    if consolidated_file is None:
+        return None
+    return read_stage(outdir, "consolidated_i30_data", check.columns_other)
+
+
+def run_native_i30_stage(filesdir, outdir, volume, partition, workers=1, write_output=False, fmt="csv"):
+    """Parse the $I30 index of every directory from the $MFT and the raw volume, without Velociraptor."""
+    if not os.path.exists(volume):
+        print(f"Error: Volume not found at {volume}")
+        return None
+
+    i30_df = i30_parser.parse_volume_i30(os.path.join(filesdir, "$mft"), volume, partition[:2], workers)
+    if write_output:
+        output_file = write_stage(i30_df, outdir, "consolidated_i30_data", fmt)
+        print(f"$I30 entries saved to: {output_file}")
+    return i30_df
+
+
+def run_usn_stage(filesdir, outdir, mft_df, write_output=False, fmt="csv"):
+    """Summarize the $J change journal, if the case has one, and join it to the MFT data."""
+    return usn_parser.extract_usn_info(os.path.join(filesdir, "$J"), mft_df, outdir, write_output=write_output, fmt=fmt)
+
+
+def run_snapshot_stage(snapshots, outdir, mft_df, workers=1, write_output=False, fmt="csv"):
+    """Diff the MFT snapshots, oldest first, and the live MFT record by record, if the case has snapshots."""
+    return mft_diff.extract_mft_diff(snapshots or [], outdir, mft_df, write_output=write_output, fmt=fmt, workers=workers)
+
+
+def stage_fingerprints(toolsdir, filesdir, partition, is_os_partition, fmt, native_mft, native_registry, volume, i30_recursive=False,
+                       snapshots=None):
+    """Return the (inputs, params) each stage's cache key is built from."""
+    hash_file = lru_cache(maxsize=None)(stage_cache.hash_file)
+    mft_file_path = os.path.join(filesdir, "$mft")
+
+    def i30_inputs():
+        if volume:
+            return {"$mft": hash_file(mft_file_path), "volume": stage_cache.stat_signature(volume)}
+        return {
+            "directories": stage_cache.hash_directories(velocerabtor.plan_i30_directories(partition, is_os_partition)),
+            "tool": hash_file(os.path.join(toolsdir, "Velociraptor.exe")),
+        }
+
+    def mft_inputs():
+        return {"$mft": hash_file(mft_file_path), "tool": None if native_mft else hash_file(os.path.join(toolsdir, "mftecmd.exe"))}
+
+    def snapshot_inputs():
+        return [hash_file(find_stage(path, "extracted_mft_info")[0] or path if os.path.isdir(path) else path) for path in snapshots or []]
+
+    return {
+        "mft": lambda: (mft_inputs(), {"native": native_mft}),
+        "appcompatcache": lambda: ({"system": hash_file(os.path.join(filesdir, "system")),
+                                    "tool": None if native_registry else hash_file(os.path.join(toolsdir, "AppCompatCacheParser.exe"))},
+                                   {"native": native_registry}),
+        "amcache": lambda: ({"Amcache.hve": hash_file(os.path.join(filesdir, "Amcache.hve")),
+                             "tool": None if native_registry else hash_file(os.path.join(toolsdir, "AmcacheParser.exe"))},
+                            {"native": native_registry}),
+        "i30": lambda: (i30_inputs(), {"partition": partition, "is_os": is_os_partition, "native": bool(volume), "format": fmt,
+                                        "recursive": i30_recursive}),
+        # $J can be several GB, so it is fingerprinted by size and mtime rather than hashed.
+        "usn": lambda: ({"$J": stage_cache.stat_signature(os.path.join(filesdir, "$J")), "mft": mft_inputs()}, {"native_mft": native_mft}),
+        "snapshots": lambda: ({"snapshots": snapshot_inputs(), "mft": mft_inputs()}, {"native_mft": native_mft}),
+    }
+
+
+def run_pipeline(toolsdir, filesdir, outdir, partition, is_it_os, write_output=False, fmt="csv", native_mft=False, workers=1,
+                 native_registry=False, volume=None, cache_dir=None, cache_size=stage_cache.DEFAULT_CACHE_SIZE, partitions=1,
+                 metrics_path=None, profile=False, sqlite=False, i30_recursive=False, baseline=None, fleet=None, fleet_summary=False,
+                 snapshots=None):
+    """Run every stage in this process, handing DataFrames from one stage to the next.
+
+    Only merged_output is written unless write_output is set, in which case every
+    stage also saves the intermediate file its standalone script would have written.
+    fmt selects CSV or the typed Parquet/Arrow IPC format for every file written.
+    A $J change journal in filesdir adds the journal stage; without one its check is left empty.
+    With snapshots, $MFT files (or their extracts) of earlier Volume Shadow Copies, oldest first, each
+    is diffed against the next and the last against the live MFT; without them the snapshot check is left empty.
+    With native_registry, the ShimCache and Amcache entries are read straight from the hives instead of through the EZ tools.
+    With a raw volume, $I30 entries are parsed natively instead of collected by Velociraptor;
+    with i30_recursive, Velociraptor collects each tree in one recursive, streamed collection.
+    With a cache_dir, a stage whose inputs, version and parameters are unchanged is loaded
+    from the cache instead of run, so reruns and interrupted runs pick up where they left off.
+    With partitions > 1 the check runs out of core over that many on-disk buckets on `workers` processes.
+    Every stage appends its metrics to metrics_path (default outdir/pipeline_metrics.jsonl) as a JSON line;
+    with profile set the stages also run under cProfile, saving their stats to outdir/profiles.
+    With sqlite set, the scored rows are also written to the indexed results database outdir/merged_output.sqlite.
+    With a baseline index from baseline.py, rows matching a known-good (path, SHA1, timestamp pattern) are marked and score 0.
+    With a fleet prevalence table from fleet_stats.py the fleet columns and fleet_score are added, and with
+    fleet_summary set the host's mergeable summary is written to outdir/fleet_summary.npz.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    is_os_partition = str(is_it_os).lower() == "yes"
+
+    stages = [
+        ("mft", lambda: run_mft_stage(toolsdir, filesdir, outdir, native_mft, workers, write_output, fmt)),
+        ("appcompatcache", lambda: run_appcompat_stage(toolsdir, filesdir, outdir, native_registry, write_output, fmt)),
+        ("amcache", lambda: run_amcache_stage(toolsdir, filesdir, outdir, native_registry, write_output, fmt)),
+        ("i30", lambda: run_native_i30_stage(filesdir, outdir, volume, partition, workers, write_output, fmt) if volume
+                else run_i30_stage(toolsdir, outdir, partition, is_os_partition, fmt, workers, i30_recursive)),
+        ("usn", lambda: run_usn_stage(filesdir, outdir, frames["mft"], write_output, fmt)),
+        ("snapshots", lambda: run_snapshot_stage(snapshots, outdir, frames["mft"], workers, write_output, fmt)),
+    ]
+
+    fingerprints = stage_fingerprints(toolsdir, filesdir, partition, is_os_partition, fmt, native_mft, native_registry, volume,
+                                      i30_recursive, snapshots) if cache_dir else {}
+
+    metrics_path = metrics_path or os.path.join(outdir, "pipeline_metrics.jsonl")
+    profile_dir = os.path.join(outdir, "profiles") if profile else None
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    stage_metrics.count_subprocesses()
+
+    frames = {}
+    for name, stage in stages:
+        with stage_metrics.measure(name, metrics_path, run_id, profile_dir) as record:
+            key = None
+            if cache_dir:
+                key = stage_cache.cache_key(name, *fingerprints[name]())
+                frames[name] = stage_cache.load(cache_dir, key)
+            if frames.get(name) is not None:
+                log(f"Stage {name} unchanged, loaded from cache.")
+                record["status"] = "cached"
+                if write_output:
+                    write_stage(frames[name], outdir, STAGE_OUTPUTS[name], fmt)
+            else:
+                log(f"Running stage: {name}")
+                frames[name] = stage()
+                if frames[name] is None:
+                    record["status"] = "no data"
+                elif key:
+                    stage_cache.store(cache_dir, key, frames[name], cache_size)
+            record["rows_out"] = len(frames[name]) if frames[name] is not None else None
+        log_metrics(record)
+        if frames[name] is None:
+            log(f"Error: stage {name} produced no data, stopping.")
+            return None
+
+    source_frames = [frames["mft"], frames["appcompatcache"], frames["amcache"], frames["i30"], frames["usn"], frames["snapshots"]]
+    with stage_metrics.measure("check", metrics_path, run_id, profile_dir) as record:
+        log("Running stage: check")
+        record["rows_in"] = sum(len(frame) for frame in source_frames)
+        if partitions > 1:
+            consolidated_df = check.check_partitioned(
+                {name: [frame] for name, frame in zip(check.sources, source_frames)}, outdir, partitions, workers
+            )
+        else:
+            consolidated_df = check.check_frames(*source_frames)
+        if baseline:
+            consolidated_df = check.mark_known_good(consolidated_df, baseline)
+        record["rows_out"] = len(consolidated_df)
+    log_metrics(record)
+
+    with stage_metrics.measure("count-true", metrics_path, run_id, profile_dir) as record:
+        log("Running stage: count-true")
+        record["rows_in"] = len(consolidated_df)
+        scored_df = count_true.add_true_count(consolidated_df)
+        if scored_df is None:
+            record["status"] = "failed"
+        else:
+            if fleet:
+                scored_df = fleet_stats.add_fleet_prevalence(scored_df, fleet_stats.load_summary(fleet))
+            output_file = write_stage(scored_df, outdir, "merged_output", fmt)
+            if sqlite:
+                count_true.save_results_db(scored_df, outdir)
+            if fleet_summary:
+                fleet_stats.write_host_summary(scored_df, outdir)
+            record["rows_out"] = len(scored_df)
+    log_metrics(record)
+    if scored_df is None:
+        return None
+
+    log(f"File saved successfully as {output_file}")
+    return scored_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every Timestomp Detector stage in a single process.")
+    parser.add_argument("-toolsdir", required=True, help="Path to the directory containing the external tools.")
+    parser.add_argument("-filesdir", required=True, help="Path to the directory containing $mft, system, Amcache.hve and optionally the $J change journal.")
+    parser.add_argument("-outdir", required=True, help="Path to the output directory.")
+    parser.add_argument("-partition", required=True, help="Partition to scan for $I30 data (e.g., C:\\ or D:\\).")
+    parser.add_argument("-is_it_os", required=True, choices=["yes", "no"], help="Is the specified partition the OS partition? (yes or no).")
+    parser.add_argument("-write_output", action="store_true", help="Also save every intermediate stage file to the output directory.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of every file written (parquet and arrow need pyarrow).")
+    parser.add_argument("-native_mft", action="store_true", help="Parse the $MFT with the built-in parser instead of mftecmd.exe.")
+    parser.add_argument("-native_registry", action="store_true",
+                        help="Read the ShimCache and Amcache from the hives with the built-in reader instead of the EZ tools.")
+    parser.add_argument("-volume", default=None, help="Raw NTFS volume image or device to parse $I30 indexes from natively.")
+    parser.add_argument("-i30_recursive", action="store_true",
+                        help="Collect $I30 data with one recursive Velociraptor collection per tree, streamed without per-directory CSVs.")
+    parser.add_argument("-cache_dir", default=None, help="Directory of the stage cache; unchanged stages are loaded from it instead of rerun.")
+    parser.add_argument("-cache_size_mb", type=int, default=stage_cache.DEFAULT_CACHE_SIZE // 1024 ** 2,
+                        help="Size cap of the stage cache; least recently used entries are evicted beyond it.")
+    parser.add_argument("-partitions", type=int, default=1, help="Run the check over this many on-disk buckets to bound memory (1 keeps it in memory).")
+    parser.add_argument("-metrics", default=None, help="JSON-lines file receiving per-stage metrics (default: <outdir>/pipeline_metrics.jsonl).")
+    parser.add_argument("-profile", action="store_true", help="Run the stages under cProfile and save their stats to <outdir>/profiles.")
+    parser.add_argument("-workers", type=int, default=1, help="Number of MFT parser processes and concurrent $I30 collectors.")
+    parser.add_argument("-sqlite", action="store_true", help="Also write the scored rows to an indexed SQLite database for results_store.py queries.")
+    parser.add_argument("-baseline", default=None, help="Known-good index built by baseline.py; rows matching it are marked and not scored.")
+    parser.add_argument("-fleet", default=None, help="Fleet prevalence table merged by fleet_stats.py; adds the fleet columns and fleet_score.")
+    parser.add_argument("-fleet_summary", action="store_true", help="Also write this host's mergeable summary for fleet_stats.py -merge.")
+    parser.add_argument("-snapshots", nargs="+", default=None,
+                        help="$MFT files (or MFTECmd CSVs) of Volume Shadow Copies, oldest first, to diff against each other and the live MFT.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.toolsdir):
+        print(f"Error: Tools directory not found at {args.toolsdir}")
+        exit(1)
+    if not os.path.exists(args.filesdir):
+        print(f"Error: Files directory not found at {args.filesdir}")
+        exit(1)
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"Error: Baseline index not found at {args.baseline}")
+        exit(1)
+    if args.fleet and not os.path.exists(args.fleet):
+        print(f"Error: Fleet prevalence table not found at {args.fleet}")
+        exit(1)
+    for snapshot in args.snapshots or []:
+        if not os.path.exists(snapshot):
+            print(f"Error: MFT snapshot not found at {snapshot}")
+            exit(1)
+
+    result = run_pipeline(args.toolsdir, args.filesdir, args.outdir, args.partition, args.is_it_os,
+                          write_output=args.write_output, fmt=args.format, native_mft=args.native_mft, workers=args.workers,
+                          native_registry=args.native_registry, volume=args.volume, cache_dir=args.cache_dir, cache_size=args.cache_size_mb * 1024 ** 2,
+                          partitions=args.partitions, metrics_path=args.metrics, profile=args.profile, sqlite=args.sqlite,
+                          i30_recursive=args.i30_recursive, baseline=args.baseline, fleet=args.fleet, fleet_summary=args.fleet_summary,
+                          snapshots=args.snapshots)
+    if result is None:
+        exit(1)
@@ -0,0 +1,135 @@
+import os
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from path_normalizer import normalize_directory
+from stage_io import as_booleans
+
+
+DB_NAME = "merged_output.sqlite"
+TABLE = "results"
+INSERT_BATCH_ROWS = 100000
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def column_values(df, col, booleans):
+    """A column as a list of Python values sqlite3 can bind: 1/0 for booleans, text otherwise, None where empty."""
+    values = df[col]
+    if col in booleans:
+        flags = as_booleans(values)
+        return [None if pd.isna(flag) else int(flag) for flag in flags.tolist()]
+    if col == "true_count":
+        return values.astype(np.int64).tolist()
+    present = values.notna() & (values.astype(str) != "")
+    return values.astype(str).astype(object).where(present, None).tolist()
+
+
+def write_results_db(df, db_path, indicator_columns):
+    """Write a scored merged_output to an indexed SQLite database, replacing any previous one.
+
+    Rows go in with executemany in batches of INSERT_BATCH_ROWS inside a single transaction,
+    and the indexes on the path, its parent directory, true_count and every indicator are
+    built once the table is filled. The database is written next to db_path and moved into place.
+    """
+    booleans = [col for col in indicator_columns if col in df.columns and as_booleans(df[col]) is not None]
+    columns = list(df.columns) + ["parent"]
+    keys = df["merge_key"].astype(str)
+    parents = keys.str.rpartition("\\")[0].tolist()
+
+    temp_path = db_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        types = {col: "INTEGER" if col in booleans or col == "true_count" else "TEXT" for col in columns}
+        connection.execute(f"CREATE TABLE {TABLE} ({', '.join(f'{quote(col)} {types[col]}' for col in columns)})")
+
+        insert = f"INSERT INTO {TABLE} VALUES ({', '.join('?' for _ in columns)})"
+        with connection:
+            for start in range(0, len(df), INSERT_BATCH_ROWS):
+                batch = df.iloc[start:start + INSERT_BATCH_ROWS]
+                values = [column_values(batch, col, booleans) for col in df.columns]
+                values.append(parents[start:start + INSERT_BATCH_ROWS])
+                connection.executemany(insert, zip(*values))
+
+            for number, col in enumerate(["merge_key", "parent", "true_count"] + [col for col in indicator_columns if col in df.columns]):
+                connection.execute(f"CREATE INDEX index_{number} ON {TABLE} ({quote(col)})")
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+    os.replace(temp_path, db_path)
+    return db_path
+
+
+def query_results(db_path, under=None, min_score=None, indicators=(), limit=None):
+    """Select the rows of a results database under a directory, with a minimum true_count and the given indicators True.
+
+    The directory filter is a range over the indexed parent column, so it covers every level below it.
+    Indicators stored as 1/0 come back as True/False, as they read in merged_output.
+    """
+    clauses, params = [], []
+    if under:
+        # Normalized as the merge keys are: \\?\C:\Windows or %SystemRoot% become windows.
+        directory = normalize_directory(under, fold_case=True)
+        clauses.append("(parent = ? OR (parent >= ? AND parent < ?))")
+        params += [directory, directory + "\\", directory + "]"]
+    if min_score is not None:
+        clauses.append("true_count >= ?")
+        params.append(min_score)
+    for indicator in indicators:
+        clauses.append(f"{quote(indicator)} IN (1, 'True')")
+
+    sql = f"SELECT * FROM {TABLE}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY true_count DESC, merge_key"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = pd.read_sql_query(sql, connection, params=params)
+        flags = [name for _, name, declared, *_ in connection.execute(f"PRAGMA table_info({TABLE})")
+                 if declared == "INTEGER" and name != "true_count"]
+    finally:
+        connection.close()
+    for col in flags:
+        rows[col] = rows[col].map({1: True, 0: False}).astype(object)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the indexed SQLite copy of merged_output written by count-true.py -sqlite.")
+    parser.add_argument("-db", required=True, help=f"Path to the results database, or a directory holding {DB_NAME}.")
+    parser.add_argument("-under", default=None, help="Only files in this directory or below it (e.g. C:\\Windows\\System32).")
+    parser.add_argument("-min_score", type=int, default=None, help="Only files with at least this true_count.")
+    parser.add_argument("-indicator", action="append", default=[], help="Only files where this indicator column is True; may be repeated.")
+    parser.add_argument("-limit", type=int, default=None, help="Return at most this many rows.")
+    parser.add_argument("-out", default=None, help="Save the rows to this CSV file instead of printing them.")
+    args = parser.parse_args()
+
+    db_path = os.path.join(args.db, DB_NAME) if os.path.isdir(args.db) else args.db
+    if not os.path.exists(db_path):
+        print(f"Error: Results database not found at {db_path}")
+        exit(1)
+
+    start = time.perf_counter()
+    rows = query_results(db_path, args.under, args.min_score, args.indicator, args.limit)
+    elapsed = time.perf_counter() - start
+
+    if args.out:
+        rows.to_csv(args.out, index=False)
+        print(f"Rows saved to: {args.out}")
+    else:
+        with pd.option_context("display.max_columns", None, "display.width", 200):
+            print(rows)
+    print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+
+import pandas as pd
+
+
+# Bump a stage's version whenever a change to it alters its output, so older cache entries stop matching.
+STAGE_VERSIONS = {
+    "mft": 8,
+    "appcompatcache": 3,
+    "amcache": 4,
+    "i30": 4,
+    "usn": 2,
+    "snapshots": 3,
+}
+
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def hash_file(path):
+    """Return the BLAKE2b digest of a file's contents, or None if it does not exist."""
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_directories(directories):
+    """Fingerprint a set of directories by path and modification time.
+
+    A directory's mtime changes whenever an entry is added, removed or renamed in it,
+    which is exactly when its $I30 index changes.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for directory in directories:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        digest.update(f"{directory}\0{mtime}\n".encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def stat_signature(path):
+    """Fingerprint a file too large to hash, such as a raw volume, by path, size and mtime."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def cache_key(stage, inputs, params=None):
+    """Build the cache key of a stage from its input fingerprints, its version and its parameters."""
+    description = json.dumps({
+        "stage": stage,
+        "version": STAGE_VERSIONS.get(stage, 0),
+        "inputs": inputs,
+        "params": params or {},
+    }, sort_keys=True, default=str)
+    return f"{stage}-{hashlib.blake2b(description.encode(), digest_size=20).hexdigest()}"
+
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".pkl")
+
+
+def load(cache_dir, key):
+    """Return the cached DataFrame for key, or None on a miss.
+
+    A hit refreshes the entry's mtime, which the LRU eviction uses as its last-use time.
+    """
+    path = entry_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_pickle(path)
+    except Exception as e:
+        print(f"Ignoring unreadable cache entry {path}: {e}")
+        return None
+    os.utime(path)
+    return df
+
+
+def store(cache_dir, key, df, max_bytes=DEFAULT_CACHE_SIZE):
+    """Save a stage result under key, then evict least recently used entries beyond max_bytes.
+
+    The entry is written to a temporary file and renamed into place, so an interrupted
+    run never leaves a partial entry behind.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = entry_path(cache_dir, key)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_pickle(temp_path)
+    os.replace(temp_path, path)
+    evict(cache_dir, max_bytes, keep=path)
+    return path
+
+
+def evict(cache_dir, max_bytes, keep=None):
+    """Delete the least recently used cache entries until the cache fits in max_bytes.
+
+    Several pipelines may share a cache, so entries removed by another process are skipped.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pkl"):
+            try:
+                stat = os.stat(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(cache_dir, name)))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            print(f"Evicted cache entry: {path}")
+        except FileNotFoundError:
+            pass
+        total -= size
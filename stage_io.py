@@ -0,0 +1,369 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from mft_parser import TICKS_PER_SECOND, filetime_to_string
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+FILETIME_UNIX_EPOCH = 116444736000000000
+
+# Tick value of a missing or unparseable timestamp. It sorts after every real time, so a
+# row-wise minimum over tick columns skips missing values by itself.
+NO_TICKS = np.iinfo(np.int64).max
+
+# 'yyyy-MM-dd HH:mm:ss[.f...][Z]' with digits written as 'd', as MFTECmd, Velociraptor and the EZ tools write times.
+TIMESTAMP_LAYOUT = re.compile(r"dddd-dd-dd[ T]dd:dd:dd(\.d{1,9})?Z?")
+
+DEFAULT_CHUNK_ROWS = 500000
+
+# Fixed schema of every stage output: timestamp, boolean, integer and path columns.
+# Columns not listed here are kept as strings.
+STAGE_SCHEMAS = {
+    "extracted_mft_info": {
+        "timestamps": ["Created0x10", "Created0x30", "LastModified0x10", "LastModified0x30",
+                       "LastRecordChange0x10", "LastRecordChange0x30"],
+        "booleans": ["SI<FN", "uSecZeros"],
+        "integers": ["EntryNumber", "SequenceNumber", "ParentEntryNumber", "ParentSequenceNumber"],
+        "paths": ["ParentPath", "FileName", "Full Path with the name"],
+    },
+    "extracted_appcompat_info": {
+        "timestamps": ["LastModifiedTimeUTC"],
+        "booleans": [],
+        "integers": [],
+        "paths": ["FileName", "Full Path with the name"],
+    },
+    "amcache_combined_extracted": {
+        "timestamps": ["LinkDate"],
+        "booleans": [],
+        "integers": ["Size"],
+        "paths": ["FullPath", "Full Path with the name", "FileExtension"],
+    },
+    "extracted_usn_info": {
+        "timestamps": ["UsnCreated", "UsnBasicInfoChange"],
+        "booleans": [],
+        "integers": ["EntryNumber", "SequenceNumber", "UsnBasicInfoChanges"],
+        "paths": ["Full Path with the name"],
+    },
+    "mft_diff": {
+        "timestamps": [],
+        "booleans": ["Reused", "Renamed"],
+        "integers": ["EntryNumber", "SequenceNumber", "PreviousSequenceNumber"],
+        "paths": ["Full Path with the name", "PreviousPath"],
+    },
+    "consolidated_i30_data": {
+        "timestamps": ["Mtime", "Atime", "Ctime", "Btime"],
+        "booleans": ["IsSlack"],
+        "integers": ["MFTId", "Size", "AllocatedSize", "SlackOffset"],
+        "paths": ["FullPath", "Name", "Full Path with the name"],
+    },
+    "merged_output": {
+        "timestamps": [],
+        "booleans": ["si<fn", "useczeros", "$SI M time prior to shimcache time",
+                     "$SI times prior to $I30", "$SI times prior to exe compile time", "BASIC_INFO_CHANGE after creation",
+                     "Timestamps regressed between snapshots", "In known-good baseline"],
+        "integers": ["true_count", "fleet_hosts_with_path", "fleet_hosts_with_hits", "fleet_hosts_with_sha1"],
+        "paths": ["merge_key"],
+    },
+}
+
+
+def require_pyarrow(fmt):
+    if fmt != "csv" and pa is None:
+        raise ImportError(f"The '{fmt}' format needs pyarrow: pip install pyarrow")
+
+
+def stage_path(outdir, name, fmt="csv"):
+    return os.path.join(outdir, name + FORMATS[fmt])
+
+
+def find_stage(outdir, name):
+    """Return (path, fmt) of the most recently written output of a stage, or (None, None)."""
+    found = [(os.path.getmtime(stage_path(outdir, name, fmt)), fmt)
+             for fmt in FORMATS if os.path.exists(stage_path(outdir, name, fmt))]
+    if not found:
+        return None, None
+    fmt = max(found)[1]
+    return stage_path(outdir, name, fmt), fmt
+
+
+def as_booleans(series):
+    """Return the column as booleans the way read_csv would type it, or None if it is not a True/False column."""
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    values = series.replace("", np.nan).dropna()
+    if values.empty or not values.isin([True, False, "True", "False"]).all():
+        return None
+    return series.map({True: True, False: False, "True": True, "False": False})
+
+
+def parse_timestamps(series):
+    """Parse a timestamp column into naive UTC datetime64[ns], turning unparseable values into NaT."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        parsed = series
+        if getattr(parsed.dt, "tz", None) is not None:
+            parsed = parsed.dt.tz_convert("UTC").dt.tz_localize(None)
+        return parsed.astype("datetime64[ns]")
+    return pd.Series(ticks_to_datetimes(parse_ticks(series)), index=series.index, name=series.name)
+
+
+def timestamp_layout(text):
+    """Return the layout of a timestamp string (digits as 'd'), or None if it is not one the integer parser reads."""
+    layout = re.sub(r"\d", "d", text)
+    return layout if TIMESTAMP_LAYOUT.fullmatch(layout) else None
+
+
+def days_from_civil(year, month, day):
+    """Days since 1970-01-01 of proleptic Gregorian dates, on integer arrays."""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def layout_ticks(text, layout):
+    """Parse an array of strings in one layout into FILETIME ticks with integer arithmetic.
+
+    Returns (ticks, matched); rows that do not follow the layout or hold an impossible date are not matched.
+    """
+    size = len(layout)
+    ticks = np.full(len(text), NO_TICKS, dtype=np.int64)
+    matched = np.char.str_len(text) == size
+    codes = text[matched].astype(f"<U{size}").view(np.uint32).reshape(-1, size).astype(np.int64)
+
+    digit = np.frombuffer(layout.encode("ascii"), dtype=np.uint8) == ord("d")
+    literals = np.frombuffer(layout.encode("ascii"), dtype=np.uint8)[~digit]
+    codes[:, digit] -= ord("0")
+    ok = ((codes[:, digit] >= 0) & (codes[:, digit] <= 9)).all(axis=1) & (codes[:, ~digit] == literals).all(axis=1)
+
+    def number(start, end):
+        value = np.zeros(len(codes), dtype=np.int64)
+        for position in range(start, end):
+            value = value * 10 + codes[:, position]
+        return value
+
+    year, month, day = number(0, 4), number(5, 7), number(8, 10)
+    hour, minute, second = number(11, 13), number(14, 16), number(17, 19)
+    # Fractions beyond 7 digits are finer than a FILETIME tick and are truncated.
+    digits = min(layout.count("d") - 14, 7)
+    fraction = number(20, 20 + digits) * 10 ** (7 - digits) if digits else 0
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)] + (leap & (month == 2))
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) & (hour < 24) & (minute < 60) & (second < 60)
+
+    seconds = days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+    matched[matched] = ok
+    ticks[matched] = (seconds * TICKS_PER_SECOND + fraction + FILETIME_UNIX_EPOCH)[ok]
+    return ticks, matched
+
+
+def datetime_ticks(series):
+    """Convert a datetime64 column to FILETIME ticks, NaT to NO_TICKS."""
+    if getattr(series.dt, "tz", None) is not None:
+        series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+    ns = series.astype("datetime64[ns]").to_numpy().astype(np.int64)
+    return np.where(series.isna().to_numpy(), NO_TICKS, ns // 100 + FILETIME_UNIX_EPOCH)
+
+
+def parse_ticks(series):
+    """Parse a timestamp column into int64 FILETIME ticks (100 ns since 1601), NO_TICKS where missing or unparseable.
+
+    Strings in a 'yyyy-MM-dd HH:mm:ss.fffffff'-like layout are parsed with integer arithmetic at
+    full precision and over the whole FILETIME range. The layout is taken from the first value of
+    each call; values in any other layout, or with a day the month does not have, go through pandas.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return datetime_ticks(series)
+
+    text = series.to_numpy(dtype=object)
+    ticks = np.full(len(text), NO_TICKS, dtype=np.int64)
+    present = pd.notna(text) & (text != "")
+    if not present.any():
+        return ticks
+    values = text[present].astype(str)
+
+    layout = timestamp_layout(values[0])
+    if layout is not None:
+        parsed, matched = layout_ticks(values, layout)
+    else:
+        parsed, matched = np.full(len(values), NO_TICKS, dtype=np.int64), np.zeros(len(values), dtype=bool)
+    if not matched.all():
+        others = pd.to_datetime(pd.Series(values[~matched]), errors="coerce", utc=True, format="mixed")
+        parsed[~matched] = datetime_ticks(others)
+    ticks[present] = parsed
+    return ticks
+
+
+def ticks_to_datetimes(ticks):
+    """Convert FILETIME ticks to datetime64[ns]; NO_TICKS and times outside its 1677-2262 range become NaT."""
+    offsets = ticks - FILETIME_UNIX_EPOCH
+    in_range = (ticks != NO_TICKS) & (np.abs(offsets) <= np.iinfo(np.int64).max // 100)
+    ns = np.where(in_range, offsets, 0) * 100
+    return np.where(in_range, ns, np.iinfo(np.int64).min).view("datetime64[ns]")
+
+
+def usec_zeros(*ticks):
+    """True where any of the given tick columns holds a time with a zero sub-second part."""
+    return np.logical_or.reduce([(column != NO_TICKS) & (column % TICKS_PER_SECOND == 0) for column in ticks])
+
+
+def format_timestamps(series):
+    """Render datetime64 values as MFTECmd-style 'yyyy-MM-dd HH:mm:ss.fffffff' strings, NaT as NaN."""
+    ns = series.astype("datetime64[ns]").to_numpy().astype(np.int64)
+    ticks = np.where(series.isna().to_numpy(), 0, ns // 100 + FILETIME_UNIX_EPOCH)
+    return filetime_to_string(ticks).set_axis(series.index)
+
+
+def apply_schema(df, name):
+    """Cast a stage frame to its fixed columnar schema."""
+    schema = STAGE_SCHEMAS.get(name, {})
+    typed = df.copy()
+    for col in schema.get("timestamps", []):
+        if col in typed.columns:
+            typed[col] = parse_timestamps(typed[col])
+    for col in schema.get("booleans", []):
+        if col in typed.columns:
+            values = as_booleans(typed[col])
+            if values is None and (typed[col].isna() | (typed[col] == "")).all():
+                values = pd.Series(pd.NA, index=typed.index, dtype="boolean")
+            if values is not None:
+                typed[col] = values.astype("boolean")
+    for col in schema.get("integers", []):
+        if col in typed.columns:
+            typed[col] = pd.to_numeric(typed[col], errors="coerce").astype("Int64")
+    for col in schema.get("paths", []):
+        if col in typed.columns:
+            typed[col] = typed[col].astype("category")
+    for col in typed.columns:
+        if typed[col].dtype == object:
+            typed[col] = typed[col].astype("string")
+    return typed
+
+
+def write_stage(df, outdir, name, fmt="csv"):
+    """Write a stage frame in the requested format and return the file path."""
+    require_pyarrow(fmt)
+    path = stage_path(outdir, name, fmt)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return path
+
+    write_table(pa.Table.from_pandas(apply_schema(df, name), preserve_index=False), path, fmt)
+    return path
+
+
+def batch_table(df, name):
+    """Build the Arrow table of one batch of a stage, with column types that do not depend on the batch's values.
+
+    Timestamp, boolean and integer columns get their STAGE_SCHEMAS type; every other column,
+    paths included, is a plain string, so a column that is empty in one batch still matches the rest.
+    """
+    typed = apply_schema(df, name)
+    schema = STAGE_SCHEMAS.get(name, {})
+    fixed = set(schema.get("timestamps", []) + schema.get("booleans", []) + schema.get("integers", []))
+    for col in typed.columns:
+        if col not in fixed:
+            typed[col] = typed[col].astype("string")
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    return table.cast(pa.schema([field if field.name in fixed else field.with_type(pa.large_string()) for field in table.schema]))
+
+
+def write_stage_batches(batches, outdir, name, fmt="csv"):
+    """Write a stage from an iterable of DataFrames, holding one batch in memory at a time.
+
+    Returns the file path, or None if there were no batches. Arrow IPC files allow only one
+    dictionary per column, so batched columnar output stores path columns as plain strings.
+    """
+    require_pyarrow(fmt)
+    path = stage_path(outdir, name, fmt)
+    written = False
+    schema = writer = None
+    try:
+        for df in batches:
+            if fmt == "csv":
+                df.to_csv(path, mode="a" if written else "w", header=not written, index=False)
+                written = True
+                continue
+
+            table = batch_table(df, name)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(path, schema) if fmt == "parquet" else pa.ipc.new_file(path, schema)
+            writer.write_table(table.cast(schema))
+            written = True
+    finally:
+        if writer is not None:
+            writer.close()
+    return path if written else None
+
+
+def write_table(table, path, fmt):
+    """Write an Arrow table to a Parquet or Arrow IPC file."""
+    require_pyarrow(fmt)
+    if fmt == "parquet":
+        pq.write_table(table, path)
+    else:
+        feather.write_feather(table, path)
+
+
+def table_columns(path, fmt, columns):
+    """Return the requested columns present in a columnar file, in the file's own order."""
+    if columns is None:
+        return None
+    schema = pq.read_schema(path) if fmt == "parquet" else pa.ipc.open_file(pa.memory_map(path)).schema
+    return [col for col in schema.names if col in columns]
+
+
+def read_table(path, fmt, columns=None):
+    """Read an Arrow table from a columnar stage file, projecting only the requested columns."""
+    require_pyarrow(fmt)
+    columns = table_columns(path, fmt, columns)
+    if fmt == "parquet":
+        return pq.read_table(path, columns=columns)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def read_stage(outdir, name, columns=None):
+    """Read the latest output of a stage from outdir, projecting only the requested columns."""
+    path, fmt = find_stage(outdir, name)
+    if path is None:
+        raise FileNotFoundError(f"No output of stage '{name}' found in {outdir}")
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=columns)
+    return read_table(path, fmt, columns).to_pandas()
+
+
+def iter_stage(outdir, name, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield the latest output of a stage from outdir as DataFrames of at most chunk_rows rows."""
+    path, fmt = find_stage(outdir, name)
+    if path is None:
+        raise FileNotFoundError(f"No output of stage '{name}' found in {outdir}")
+    if fmt == "csv":
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+        return
+
+    require_pyarrow(fmt)
+    columns = table_columns(path, fmt, columns)
+    if fmt == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    reader = pa.ipc.open_file(pa.memory_map(path))
+    for index in range(reader.num_record_batches):
+        table = pa.Table.from_batches([reader.get_batch(index)])
+        for offset in range(0, max(table.num_rows, 1), chunk_rows):
+            chunk = table.slice(offset, chunk_rows)
+            yield (chunk.select(columns) if columns is not None else chunk).to_pandas()
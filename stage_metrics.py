@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+LAUNCH_EVENTS = {"subprocess.Popen", "os.system", "os.posix_spawn", "os.spawn", "os.startfile"}
+
+PROFILE_TOP_FUNCTIONS = 40
+
+# External processes started so far, or None until count_subprocesses is called
+subprocess_launches = None
+
+
+def count_launches(event, args):
+    """Audit hook counting every external process this process starts."""
+    global subprocess_launches
+    if event in LAUNCH_EVENTS:
+        subprocess_launches += 1
+
+
+def count_subprocesses():
+    """Start counting the external processes this process starts, for the subprocesses metric.
+
+    Audit hooks cannot be removed, so the hook is installed once, and only by callers that record metrics.
+    """
+    global subprocess_launches
+    if subprocess_launches is None:
+        subprocess_launches = 0
+        sys.addaudithook(count_launches)
+
+
+def io_counters():
+    """Return (bytes read, bytes written) by this process so far, or (None, None) where the platform does not expose them."""
+    if psutil is not None:
+        counters = psutil.Process().io_counters()
+        return getattr(counters, "read_chars", counters.read_bytes), getattr(counters, "write_chars", counters.write_bytes)
+    try:
+        with open("/proc/self/io", "r") as infile:
+            fields = dict(line.split(": ") for line in infile.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_mb(who="self"):
+    """Peak resident set size in MB of this process ("self") or of its largest finished child ("children")."""
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+        return round(usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+    if psutil is not None and who == "self":
+        memory = psutil.Process().memory_info()
+        return round(getattr(memory, "peak_wset", memory.rss) / 1024 ** 2, 1)
+    return None
+
+
+def difference(after, before):
+    """after - before, or None if either counter is unavailable."""
+    return after - before if after is not None and before is not None else None
+
+
+@contextmanager
+def measure(stage, metrics_path, run_id, profile_dir=None):
+    """Measure one stage and append its metrics to metrics_path as a JSON line.
+
+    Yields the record so the stage can fill in rows_in and rows_out. CPU time, I/O and
+    peak RSS of child processes only count children that have finished, and bytes read
+    and written are those of this process, not of the external tools it launches.
+    With a profile_dir, the stage also runs under cProfile and its stats are saved there.
+    """
+    record = {
+        "run_id": run_id, "stage": stage, "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "status": "ok", "rows_in": None, "rows_out": None,
+    }
+    times = os.times()
+    read_before, written_before = io_counters()
+    launches_before = subprocess_launches
+    start = time.perf_counter()
+
+    profiler = cProfile.Profile() if profile_dir else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "error"
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        wall = time.perf_counter() - start
+        times_after = os.times()
+        read_after, written_after = io_counters()
+        record.update({
+            "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(times_after.user + times_after.system - times.user - times.system, 3),
+            "children_cpu_seconds": round(times_after.children_user + times_after.children_system
+                                          - times.children_user - times.children_system, 3),
+            "bytes_read": difference(read_after, read_before),
+            "bytes_written": difference(written_after, written_before),
+            "peak_rss_mb": peak_rss_mb("self"),
+            "children_peak_rss_mb": peak_rss_mb("children"),
+            "subprocesses": difference(subprocess_launches, launches_before),
+        })
+        if profiler:
+            record["profile"] = save_profile(profiler, profile_dir, f"{run_id}_{stage}")
+
+        with open(metrics_path, "a", encoding="utf-8") as outfile:
+            outfile.write(json.dumps(record) + "\n")
+
+
+def save_profile(profiler, profile_dir, name):
+    """Save cProfile data as <name>.prof plus a readable <name>.txt of the top functions by cumulative time."""
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_path = os.path.join(profile_dir, f"{name}.prof")
+    profiler.dump_stats(profile_path)
+    with open(os.path.join(profile_dir, f"{name}.txt"), "w", encoding="utf-8") as outfile:
+        pstats.Stats(profiler, stream=outfile).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    return profile_path
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from baseline import baseline_keys, open_baseline, probe_baseline, write_baseline
+
+
+def merged_output(**indicators):
+    df = pd.DataFrame({"merge_key": ["c:\\windows\\a.exe", "C:\\Tools\\b.dll"], "sha1": ["AB" * 20, ""],
+                       "si<fn": ["False", "True"], "useczeros": [False, True]})
+    for col, values in indicators.items():
+        df[col] = values
+    return df
+
+
+def build(tmp_path, df):
+    index_path = str(tmp_path / "known_good.idx")
+    write_baseline(baseline_keys(df), index_path)
+    return open_baseline(index_path)
+
+
+def test_baselines_without_optional_sources_match_hosts_that_have_them(tmp_path):
+    index = build(tmp_path, merged_output())
+
+    with_sources = merged_output(**{"BASIC_INFO_CHANGE after creation": ["False", True],
+                                    "Timestamps regressed between snapshots": [False, "True"]})
+    blank = merged_output(**{"BASIC_INFO_CHANGE after creation": ["", np.nan]})
+
+    assert probe_baseline(index, baseline_keys(with_sources)).tolist() == [True, False]
+    assert probe_baseline(index, baseline_keys(blank)).tolist() == [True, True]
+
+
+def test_pattern_and_sha1_changes_do_not_match(tmp_path):
+    index = build(tmp_path, merged_output())
+
+    changed = merged_output()
+    changed.loc[0, "si<fn"] = "True"
+    changed.loc[1, "sha1"] = "cd" * 20
+
+    assert probe_baseline(index, baseline_keys(changed)).tolist() == [False, False]
+    assert probe_baseline(index, baseline_keys(merged_output().assign(sha1=lambda df: df["sha1"].str.lower()))).tolist() == [True, True]
+
+
+def test_indexes_of_an_older_version_are_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(baseline, "MAGIC", b"TSBASE03")
+    index_path = str(tmp_path / "old.idx")
+    write_baseline(baseline_keys(merged_output()), index_path)
+    monkeypatch.undo()
+
+    with pytest.raises(ValueError, match="older version"):
+        open_baseline(index_path)
@@ -0,0 +1,126 @@
+import os
+import csv
+import sys
+import json
+
+import pytest
+
+import batch
+from batch import read_manifest, run_batch
+
+# Stands in for pipeline.py: the host name picks the behaviour, and every start is logged under
+# the state directory so the tests can count runs.
+PIPELINE = """
+import os, sys, time, subprocess
+state, host = sys.argv[1], sys.argv[2]
+with open(os.path.join(state, host), "a") as log:
+    log.write("x")
+if host.startswith("fail"):
+    sys.exit(3)
+if host.startswith("hang"):
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    with open(os.path.join(state, host + ".child"), "w") as pid_file:
+        pid_file.write(str(child.pid))
+    time.sleep(60)
+if host.startswith("big"):
+    ballast = b"x" * (200 * 1024 ** 2)
+    time.sleep(60)
+if host.startswith("mid"):
+    ballast = b"x" * (80 * 1024 ** 2)
+    time.sleep(1.5)
+"""
+
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    state = tmp_path / "state"
+    state.mkdir()
+    monkeypatch.setattr(batch, "POLL_SECONDS", 0.1)
+    monkeypatch.setattr(batch, "pipeline_command",
+                        lambda collection, toolsdir, outdir, host_workers=1, **options: [sys.executable, "-c", PIPELINE, str(state), collection["host"]])
+    return state
+
+
+def collections(*hosts):
+    return [{"host": host, "filesdir": host, "partition": "C:", "is_it_os": "yes", "volume": ""} for host in hosts]
+
+
+def runs(state, host):
+    path = state / host
+    return os.path.getsize(path) if path.exists() else 0
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as infile:
+            return infile.read().rsplit(b")", 1)[1].split()[0] != b"Z"
+    except OSError:
+        return False
+
+
+def test_read_manifest_csv_defaults_host_and_strips_fields(tmp_path):
+    manifest = tmp_path / "hosts.csv"
+    manifest.write_text("host,filesdir,partition,is_it_os,volume\n"
+                        ",/cases/ws01/,C:,Yes,\n"
+                        "dc01, /cases/dc , D:,no,/images/dc.raw\n")
+
+    assert read_manifest(str(manifest)) == [
+        {"host": "ws01", "filesdir": "/cases/ws01/", "partition": "C:", "is_it_os": "Yes", "volume": ""},
+        {"host": "dc01", "filesdir": "/cases/dc", "partition": "D:", "is_it_os": "no", "volume": "/images/dc.raw"},
+    ]
+
+
+def test_read_manifest_json_rejects_missing_fields_and_duplicate_hosts(tmp_path):
+    manifest = tmp_path / "hosts.json"
+    manifest.write_text(json.dumps([{"filesdir": "/cases/a", "partition": "C:", "is_it_os": "yes"}]))
+    assert read_manifest(str(manifest))[0]["host"] == "a"
+
+    manifest.write_text(json.dumps([{"host": "a", "filesdir": "/cases/a"}]))
+    with pytest.raises(ValueError, match="entry 1 is missing partition, is_it_os"):
+        read_manifest(str(manifest))
+
+    manifest.write_text(json.dumps([{"host": "a", "filesdir": "/x", "partition": "C:", "is_it_os": "yes"},
+                                    {"filesdir": "/y/a", "partition": "C:", "is_it_os": "yes"}]))
+    with pytest.raises(ValueError, match="Duplicate host names in manifest: a"):
+        read_manifest(str(manifest))
+
+
+def test_a_failing_host_does_not_stop_the_batch(stand_in, tmp_path):
+    outroot = tmp_path / "out"
+
+    results = run_batch(collections("ok1", "fail", "ok2"), "tools", str(outroot), cpus=2)
+
+    assert [(result["host"], result["status"], result["returncode"]) for result in results] == [
+        ("ok1", "ok", 0), ("fail", "failed", 3), ("ok2", "ok", 0)]
+    with open(outroot / "batch_summary.csv", newline="") as infile:
+        assert [row["status"] for row in csv.DictReader(infile)] == ["ok", "failed", "ok"]
+    assert all(runs(stand_in, host) == 1 for host in ["ok1", "fail", "ok2"])
+
+
+@pytest.mark.skipif(os.name == "nt", reason="checks the killed processes through /proc")
+def test_timeout_kills_the_whole_process_tree(stand_in, tmp_path):
+    results = run_batch(collections("hang", "ok"), "tools", str(tmp_path / "out"), cpus=2, timeout=1)
+
+    assert [result["status"] for result in results] == ["timeout", "ok"]
+    assert "Timed out after 1s" in open(results[0]["log"]).read()
+    child = int((stand_in / "hang.child").read_text())
+    assert not is_running(child)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc") and batch.psutil is None, reason="resident memory cannot be read here")
+def test_a_host_over_the_memory_budget_is_killed(stand_in, tmp_path):
+    results = run_batch(collections("big"), "tools", str(tmp_path / "out"), memory_bytes=100 * 1024 ** 2, timeout=30)
+
+    assert results[0]["status"] == "memory"
+    assert "over the 100 MB budget" in open(results[0]["log"]).read()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc") and batch.psutil is None, reason="resident memory cannot be read here")
+def test_hosts_over_the_memory_budget_together_run_one_after_the_other(stand_in, tmp_path):
+    # The tiny footprint admits both hosts at once; together they exceed the budget, so the second is
+    # stopped and runs again once the first has finished, admitted by the memory it was seen using.
+    results = run_batch(collections("mid1", "mid2"), "tools", str(tmp_path / "out"), cpus=2,
+                        memory_bytes=150 * 1024 ** 2, host_memory=1, timeout=30)
+
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert (runs(stand_in, "mid1"), runs(stand_in, "mid2")) == (1, 2)
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from check import add_indicators, aggregate_source, check_frames, check_partitioned, consolidate_sources, normalize_source, sources
+
+
+def consolidate_group(group):
+    """Combine non-null, unique values from all columns into a single cell."""
+    return group.apply(lambda col: "; ".join(col.dropna().astype(str).unique()))
+
+
+def reference_consolidation(frames, key="merge_key"):
+    """The consolidation check.py used before it was vectorized: chained outer merges, then groupby/apply."""
+    merged_df = frames[0]
+    for df in frames[1:]:
+        merged_df = pd.merge(merged_df, df, on=key, how="outer")
+    consolidated = merged_df.groupby(key).apply(consolidate_group).reset_index()
+    return consolidated[[key] + [col for col in merged_df.columns if col != key]]
+
+
+def random_keys(rng, rows, pool, nan_share=0.1):
+    """Keys drawn with repeats from a small pool, some of them NaN."""
+    keys = rng.choice(np.array([f"c:\\dir{n % 3}\\file{n}.exe".lower() for n in range(pool)], dtype=object), rows).astype(object)
+    keys[rng.random(rows) < nan_share] = np.nan
+    return keys
+
+
+def with_nans(rng, values, share=0.2):
+    values = pd.Series(values, dtype=object if values.dtype == object else None)
+    return values.where(rng.random(len(values)) >= share)
+
+
+def random_sources(seed, rows=200, pool=40):
+    """Sources with mixed bool, float, int and string columns, duplicated and NaN keys, and columns only some sources have."""
+    rng = np.random.default_rng(seed)
+    mft = pd.DataFrame({
+        "merge_key": random_keys(rng, rows, pool),
+        "si<fn": rng.random(rows) < 0.5,
+        "created0x10": with_nans(rng, np.array([f"2020-01-{day:02d} 10:00:00.1234567" for day in rng.integers(1, 29, rows)], dtype=object)),
+        "size": with_nans(rng, rng.random(rows) * 1000),
+    })
+    shimcache = pd.DataFrame({
+        "merge_key": random_keys(rng, rows // 2, pool),
+        "lastmodifiedtimeutc": with_nans(rng, np.array([f"2019-06-{day:02d} 08:00:00" for day in rng.integers(1, 29, rows // 2)], dtype=object)),
+        "executed": with_nans(rng, (rng.random(rows // 2) < 0.5).astype(object)),
+    })
+    i30 = pd.DataFrame({
+        "merge_key": random_keys(rng, rows, pool // 2),
+        "mftid": rng.integers(0, 5, rows),
+        "btime": rng.choice(np.array(["2018-01-01 00:00:00", "2018-02-01 00:00:00"], dtype=object), rows),
+    })
+    empty = pd.DataFrame({"merge_key": pd.Series(dtype=object), "usncreated": pd.Series(dtype=object)})
+    return [mft, shimcache, i30, empty]
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_consolidate_sources_matches_groupby_apply(seed):
+    frames = random_sources(seed)
+    expected = reference_consolidation(frames)
+    result = consolidate_sources(frames, progress=False)
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.astype(str).reset_index(drop=True), check_dtype=False)
+
+
+def test_consolidate_sources_with_all_keys_duplicated():
+    frames = [
+        pd.DataFrame({"merge_key": ["a", "a", "b", "b"], "flag": [True, False, True, True], "value": [1.5, np.nan, 2.0, 2.0]}),
+        pd.DataFrame({"merge_key": ["a", "a", "c"], "text": ["x", "y", "x"]}),
+    ]
+    result = consolidate_sources(frames, progress=False)
+    assert result.to_dict("list") == {
+        "merge_key": ["a", "b", "c"],
+        "flag": ["True; False", "True", ""],
+        "value": ["1.5", "2.0", ""],
+        "text": ["x; y", "", "x"],
+    }
+    pd.testing.assert_frame_equal(result, reference_consolidation(frames).astype(str), check_dtype=False)
+
+
+def test_aggregate_source_matches_groupby_apply():
+    frame = random_sources(3)[0]
+    expected = frame[frame["merge_key"].notna()].groupby("merge_key").apply(consolidate_group).reset_index()
+    pd.testing.assert_frame_equal(aggregate_source(frame).astype(str), expected[list(frame.columns)].astype(str), check_dtype=False)
+
+
+def random_case(seed, rows=300, pool=60):
+    """Extracted sources with check.py's own columns, in the path spellings the tools write."""
+    rng = np.random.default_rng(seed)
+    names = [f"Windows\\System32\\file{n}.dll" for n in range(pool)]
+
+    def paths(count):
+        chosen = rng.choice(np.array(names, dtype=object), count)
+        spelled = np.where(rng.random(count) < 0.5, "C:\\" + chosen, chosen).astype(object)
+        spelled[rng.random(count) < 0.05] = np.nan
+        return spelled
+
+    def times(count, year):
+        return with_nans(rng, np.array([f"{year}-{month:02d}-01 12:00:00.0000000" for month in rng.integers(1, 13, count)], dtype=object))
+
+    frames = {
+        "mft": pd.DataFrame({"Full Path with the name": paths(rows), "SI<FN": rng.random(rows) < 0.3, "uSecZeros": rng.random(rows) < 0.3,
+                             **{col: times(rows, 2020) for col in ["Created0x10", "Created0x30", "LastModified0x10", "LastModified0x30",
+                                                                   "LastRecordChange0x10", "LastRecordChange0x30"]}}),
+        "appcompat": pd.DataFrame({"Full Path with the name": paths(rows // 3), "LastModifiedTimeUTC": times(rows // 3, 2021)}),
+        "amcache": pd.DataFrame({"SHA1": rng.choice(np.array(["aa", "bb"], dtype=object), rows // 3),
+                                 "Full Path with the name": paths(rows // 3), "LinkDate": times(rows // 3, 2019)}),
+        "other": pd.DataFrame({"Full Path with the name": paths(rows), **{col: times(rows, 2020) for col in ["Mtime", "Atime", "Ctime", "Btime"]},
+                               "MFTId": rng.integers(0, 1000, rows)}),
+        "usn": pd.DataFrame({"Full Path with the name": paths(rows // 4), "UsnCreated": times(rows // 4, 2020),
+                             "UsnBasicInfoChange": times(rows // 4, 2021), "UsnBasicInfoChanges": rng.integers(1, 4, rows // 4)}),
+        "snapshots": pd.DataFrame({"Full Path with the name": paths(10), "SnapshotChanges": "$SI LastModified0x10 regressed (vss1 -> live)"}),
+    }
+    return frames
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_checks_match_groupby_apply_in_memory_and_partitioned(seed, tmp_path):
+    frames = random_case(seed)
+    normalized = [normalize_source(frames[name], columns) for name, (_, columns) in sources.items()]
+    expected = add_indicators(reference_consolidation(normalized).astype(str))
+
+    pd.testing.assert_frame_equal(check_frames(*frames.values()), expected, check_dtype=False)
+
+    chunks = {name: [frame.iloc[start:start + 70] for start in range(0, len(frame), 70)] for name, frame in frames.items()}
+    partitioned = check_partitioned(chunks, str(tmp_path), partitions=3)
+    pd.testing.assert_frame_equal(partitioned, expected, check_dtype=False)
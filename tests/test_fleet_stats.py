@@ -0,0 +1,61 @@
+import numpy as np
+
+from fleet_stats import load_summary, merge_fleet, merge_summaries, prevalence, save_summary, sketch_columns
+
+WIDTH, DEPTH = 2, 1
+EXACT_BELOW = 3
+
+
+def host(*keys):
+    keys = np.unique(np.array(keys, dtype=np.uint64))
+    return {"hosts": 1, "keys": keys, "counts": np.ones(len(keys), dtype=np.uint32), "sketch": None, "exact_below": EXACT_BELOW}
+
+
+def colliding_keys():
+    """Two keys sharing their sketch column, and one in the other column."""
+    columns = sketch_columns(np.arange(1, 64, dtype=np.uint64), WIDTH, DEPTH)[0]
+    same = np.flatnonzero(columns == columns[0]) + 1
+    other = np.flatnonzero(columns != columns[0]) + 1
+    return np.uint64(same[0]), np.uint64(same[1]), np.uint64(other[0])
+
+
+def test_common_keys_move_to_the_sketch_and_rare_ones_stay_exact():
+    common, rare, _ = colliding_keys()
+    hosts = [host(common) for _ in range(5)] + [host(common, rare)]
+
+    merged = merge_summaries(hosts, EXACT_BELOW, WIDTH, DEPTH)
+
+    assert merged["hosts"] == 6
+    assert merged["keys"].tolist() == [rare]
+    # The rare key shares the common key's counter; its exact count is used, not that plus the estimate.
+    assert prevalence(merged, np.array([common, rare, np.uint64(999_999)], dtype=np.uint64)).tolist() == [6, 1, 0]
+
+
+def test_keys_promoted_in_a_later_merge_are_counted_once():
+    common, _, other = colliding_keys()
+    first = merge_summaries([host(common), host(common, other)], EXACT_BELOW, WIDTH, DEPTH)
+    assert first["sketch"] is None and prevalence(first, np.array([common], dtype=np.uint64)).tolist() == [2]
+
+    # Two more hosts promote the key that was counted exactly so far; its exact count moves into the sketch.
+    second = merge_summaries([first, host(common), host(common)], EXACT_BELOW, WIDTH, DEPTH)
+    third = merge_summaries([second, host(common)], EXACT_BELOW, WIDTH, DEPTH)
+
+    assert second["keys"].tolist() == third["keys"].tolist() == [other]
+    assert prevalence(second, np.array([common, other], dtype=np.uint64)).tolist() == [4, 1]
+    assert prevalence(third, np.array([common, other], dtype=np.uint64)).tolist() == [5, 1]
+
+
+def test_merging_in_groups_matches_merging_at_once(tmp_path):
+    common, _, other = colliding_keys()
+    hosts = [host(common) for _ in range(4)] + [host(other), host(common)]
+    paths = [save_summary(summary, str(tmp_path / f"host{number}.npz")) for number, summary in enumerate(hosts)]
+    keys = np.array([common, other], dtype=np.uint64)
+
+    at_once = merge_summaries(hosts, EXACT_BELOW, WIDTH, DEPTH)
+    grouped = merge_summaries([merge_summaries(hosts[:3], EXACT_BELOW, WIDTH, DEPTH), merge_summaries(hosts[3:], EXACT_BELOW, WIDTH, DEPTH)],
+                              EXACT_BELOW, WIDTH, DEPTH)
+    from_files = load_summary(merge_fleet(paths, str(tmp_path / "fleet.npz"), exact_below=EXACT_BELOW, width=WIDTH, depth=DEPTH))
+
+    assert prevalence(at_once, keys).tolist() == [5, 1]
+    assert prevalence(grouped, keys).tolist() == [5, 1]
+    assert prevalence(from_files, keys).tolist() == [5, 1]
@@ -0,0 +1,161 @@
+import struct
+
+import numpy as np
+
+from hive_parser import parse_amcache, parse_shimcache, parse_shimcache_value
+
+REG_SZ = 1
+REG_DWORD = 4
+REG_QWORD = 11
+TICKS = int((np.datetime64("2020-03-01T10:00:00", "s") - np.datetime64("1601-01-01T00:00:00", "s")).astype(np.int64)) * 10_000_000
+
+
+class Hive:
+    """Builds a hive with a single hive bin; cells are appended and addressed by their hive bin offset."""
+
+    def __init__(self):
+        self.data = bytearray(b"hbin" + bytes(28))
+
+    def add(self, body):
+        offset = len(self.data)
+        size = (4 + len(body) + 7) // 8 * 8
+        self.data += struct.pack("<i", -size) + body + bytes(size - 4 - len(body))
+        return offset
+
+    def key(self, name, subkeys=(), values=(), list_type=b"lf", compressed=True):
+        """An nk cell with its subkey list (lf, lh or li) and value list."""
+        subkey_list = self.subkey_list(list_type, subkeys) if subkeys else 0xFFFFFFFF
+        value_list = self.add(struct.pack(f"<{len(values)}I", *values)) if values else 0xFFFFFFFF
+        raw = name.encode("latin-1") if compressed else name.encode("utf-16-le")
+        body = struct.pack("<2sHQ15IHH", b"nk", 0x0020 if compressed else 0, 0, 0, 0, len(subkeys), 0, subkey_list,
+                           0xFFFFFFFF, len(values), value_list, 0xFFFFFFFF, 0xFFFFFFFF, 0, 0, 0, 0, 0, len(raw), 0)
+        return self.add(body + raw)
+
+    def subkey_list(self, list_type, subkeys):
+        if list_type in (b"lf", b"lh"):
+            return self.add(struct.pack("<2sH", list_type, len(subkeys)) + b"".join(struct.pack("<II", key, 0) for key in subkeys))
+        return self.add(struct.pack(f"<2sH{len(subkeys)}I", list_type, len(subkeys), *subkeys))
+
+    def index_root(self, lists):
+        """An ri cell pointing at one li list per group of keys."""
+        return self.add(struct.pack(f"<2sH{len(lists)}I", b"ri", len(lists), *[self.subkey_list(b"li", keys) for keys in lists]))
+
+    def value(self, name, data_type, data):
+        if data_type == REG_DWORD:
+            body = struct.pack("<2sHIIIHH", b"vk", len(name), 4 | 0x80000000, data, data_type, 1, 0)
+            return self.add(body + name.encode("latin-1"))
+        if data_type == REG_SZ:
+            data = (data + "\0").encode("utf-16-le")
+        elif data_type == REG_QWORD:
+            data = struct.pack("<Q", data)
+        if len(data) > 16344:
+            segments = [self.add(data[start:start + 16344]) for start in range(0, len(data), 16344)]
+            data_offset = self.add(struct.pack("<2sHI", b"db", len(segments), self.add(struct.pack(f"<{len(segments)}I", *segments))))
+        else:
+            data_offset = self.add(data)
+        body = struct.pack("<2sHIIIHH", b"vk", len(name), len(data), data_offset, data_type, 1, 0)
+        return self.add(body + name.encode("latin-1"))
+
+    def write(self, path, root, dirty=False):
+        base = bytearray(4096)
+        struct.pack_into("<4sII", base, 0, b"regf", 7, 6 if dirty else 7)
+        struct.pack_into("<II", base, 0x14, 1, 5)
+        struct.pack_into("<I", base, 0x24, root)
+        path.write_bytes(bytes(base) + bytes(self.data))
+        return str(path)
+
+
+def key_with_ri(hive, name, lists):
+    """A key whose subkeys are reached through an ri list of li lists."""
+    key = hive.key(name)
+    ri = hive.index_root(lists)
+    count = sum(len(keys) for keys in lists)
+    struct.pack_into("<I", hive.data, key + 4 + 20, count)
+    struct.pack_into("<I", hive.data, key + 4 + 28, ri)
+    return key
+
+
+def shimcache_value(paths):
+    """A Windows 10 (Creators Update) AppCompatCache value holding a "10ts" entry per path."""
+    data = struct.pack("<I", 0x34).ljust(0x34, b"\0")
+    for number, path in enumerate(paths):
+        encoded = path.encode("utf-16-le")
+        entry = struct.pack("<H", len(encoded)) + encoded + struct.pack("<QI", TICKS + number * 10_000_000, 4) + b"data"
+        data += b"10ts" + struct.pack("<II", 0, len(entry)) + entry
+    return data
+
+
+def test_parse_shimcache_value_reads_win10_entries_in_order():
+    entries = parse_shimcache_value(shimcache_value(["C:\\a.exe", "C:\\Windows\\b.dll"]))
+
+    assert entries == [("C:\\a.exe", TICKS), ("C:\\Windows\\b.dll", TICKS + 10_000_000)]
+
+
+def test_parse_shimcache_walks_control_sets_and_big_data_values(tmp_path):
+    big_paths = [f"C:\\Program Files\\Vendor\\tool_{n:04}.exe" for n in range(300)]
+    hive = Hive()
+
+    def control_set(name, paths, list_type):
+        cache = hive.key("AppCompatCache", values=[hive.value("AppCompatCache", 3, shimcache_value(paths))])
+        session_manager = hive.key("Session Manager", subkeys=[cache], list_type=list_type)
+        control = hive.key("Control", subkeys=[session_manager], list_type=list_type)
+        return hive.key(name, subkeys=[control], list_type=list_type)
+
+    select = hive.key("Select", values=[hive.value("Current", REG_DWORD, 1)])
+    root = hive.key("ROOT", subkeys=[select, control_set("ControlSet002", ["C:\\old.exe"], b"lh"),
+                                     control_set("ControlSet001", big_paths, b"lf")], compressed=False)
+
+    df = parse_shimcache(hive.write(tmp_path / "SYSTEM", root))
+
+    assert len(df) == 301
+    assert df["ControlSet"].tolist() == [1] * 300 + [2]
+    assert df["CacheEntryPosition"].tolist() == list(range(300)) + [0]
+    assert df["Path"].tolist() == big_paths + ["C:\\old.exe"]
+    assert df["LastModifiedTimeUTC"].iloc[0] == "2020-03-01 10:00:00"
+    assert df["LastModifiedTimeUTC"].iloc[299] == "2020-03-01 10:04:59"
+
+
+def amcache_hive(tmp_path, dirty=False):
+    hive = Hive()
+
+    def file_entry(name, path, size, size_type):
+        values = [hive.value("LowerCaseLongPath", REG_SZ, path), hive.value("FileId", REG_SZ, "0000" + "ab" * 20),
+                  hive.value("LinkDate", REG_SZ, "03/01/2020 10:00:00"), hive.value("Size", size_type, size),
+                  hive.value("ProgramId", REG_SZ, "ignored")]
+        return hive.key(name, values=values)
+
+    files = hive.key("InventoryApplicationFile", list_type=b"lh", subkeys=[
+        file_entry("a", "c:\\windows\\a.exe", 1234, REG_QWORD),
+        file_entry("b", "c:\\tools\\b.dll", "0x1A2B", REG_SZ),
+        file_entry("c", "c:\\tools\\c.sys", "789", REG_SZ),
+    ])
+    drivers = key_with_ri(hive, "InventoryDriverBinary", [
+        [hive.key("c:\\windows\\system32\\drivers\\one.sys", values=[hive.value("DriverTimeStamp", REG_DWORD, 1583056800)])],
+        [hive.key("c:\\windows\\system32\\drivers\\two.sys", values=[hive.value("DriverTimeStamp", REG_DWORD, 0)])],
+    ])
+    root = hive.key("Root", subkeys=[files, drivers])
+    return hive.write(tmp_path / "Amcache.hve", hive.key("{root}", subkeys=[root]), dirty)
+
+
+def test_parse_amcache_reads_files_and_drivers(tmp_path):
+    df = parse_amcache(amcache_hive(tmp_path))
+
+    assert df["FullPath"].tolist() == ["c:\\windows\\a.exe", "c:\\tools\\b.dll", "c:\\tools\\c.sys",
+                                       "c:\\windows\\system32\\drivers\\one.sys", "c:\\windows\\system32\\drivers\\two.sys"]
+    assert df["SHA1"].iloc[0] == "ab" * 20
+    assert df["FileExtension"].iloc[:3].tolist() == [".exe", ".dll", ".sys"]
+    assert df["LinkDate"].iloc[:4].tolist() == ["2020-03-01 10:00:00"] * 4
+    assert df["LinkDate"].isna().iloc[4]
+
+
+def test_parse_amcache_reads_hex_size_strings(tmp_path):
+    df = parse_amcache(amcache_hive(tmp_path))
+
+    assert df["Size"].iloc[:3].tolist() == [1234, 0x1A2B, 789]
+
+
+def test_dirty_hives_are_read_with_a_warning(tmp_path, capsys):
+    df = parse_amcache(amcache_hive(tmp_path, dirty=True))
+
+    assert len(df) == 5
+    assert "transaction logs are not replayed" in capsys.readouterr().out
@@ -0,0 +1,96 @@
+import struct
+
+import numpy as np
+
+from i30_parser import parse_index_allocation, parse_index_stream
+
+BLOCK_SIZE = 4096
+DIRECTORY_ENTRY = 40
+USN = 0x0A0B
+
+
+def filetime(text):
+    seconds = (np.datetime64(text, "s") - np.datetime64("1601-01-01T00:00:00", "s")).astype(np.int64)
+    return int(seconds) * 10_000_000
+
+
+TIMES = (filetime("2020-03-01T10:00:00"), filetime("2020-03-02T10:00:00"),
+         filetime("2020-03-03T10:00:00"), filetime("2020-03-04T10:00:00"))
+
+
+def index_entry(entry, name, size=0, flags=0):
+    """An index entry whose key is the $FILE_NAME of name, in directory DIRECTORY_ENTRY."""
+    key = struct.pack("<QQQQQQQIIBB", 1 << 48 | DIRECTORY_ENTRY, *TIMES, size, size, 0, 0, len(name), 1) + name.encode("utf-16-le")
+    length = (16 + len(key) + 7) // 8 * 8
+    return struct.pack("<QHHI", 1 << 48 | entry, length, len(key), flags) + key.ljust(length - 16, b"\0")
+
+
+def last_entry():
+    return struct.pack("<QHHI", 0, 16, 0, 0x02)
+
+
+def indx_block(entries, slack=b"", corrupt=False):
+    """An INDX block holding entries, followed by slack bytes after the last entry, with fixups applied."""
+    sectors = BLOCK_SIZE // 512
+    usa_offset = 40
+    first = (usa_offset + 2 * (sectors + 1) + 7) // 8 * 8
+    live = b"".join(entries) + last_entry()
+    block = bytearray(BLOCK_SIZE)
+    struct.pack_into("<4sHHQQIIII", block, 0, b"INDX", usa_offset, sectors + 1, 0, 0,
+                     first - 24, first - 24 + len(live), BLOCK_SIZE - 24, 0)
+    block[first:first + len(live)] = live
+    block[first + len(live):first + len(live) + len(slack)] = slack
+    struct.pack_into("<H", block, usa_offset, USN)
+    for sector in range(sectors):
+        end = sector * 512 + 510
+        block[usa_offset + 2 + 2 * sector:usa_offset + 4 + 2 * sector] = block[end:end + 2]
+        struct.pack_into("<H", block, end, USN)
+    if corrupt:
+        block[1022:1024] = b"\xff\xff"
+    return bytes(block)
+
+
+LIVE_NAMES = [f"file_{n}_with_a_name_long_enough_to_span_sectors.txt" for n in range(6)]
+
+
+def sample_stream():
+    live = [index_entry(100 + n, name, size=n) for n, name in enumerate(LIVE_NAMES)]
+    deleted = index_entry(200, "deleted.txt", size=7)
+    good = indx_block(live, slack=b"\0" * 8 + deleted)
+    broken = indx_block([index_entry(300, "in_a_torn_block.txt")], corrupt=True)
+    return good + broken
+
+
+def test_parse_index_allocation_reads_live_and_slack_entries_and_skips_torn_blocks():
+    rows = parse_index_allocation(sample_stream(), BLOCK_SIZE)
+
+    live = [row for row in rows if not row[0]]
+    slack = [row for row in rows if row[0]]
+    assert [key[3] for _, _, _, key in live] == LIVE_NAMES
+    assert [reference & 0xFFFFFFFFFFFF for _, _, reference, _ in live] == list(range(100, 106))
+    assert all(key[0] == DIRECTORY_ENTRY and key[1] == TIMES for _, _, _, key in live)
+
+    assert len(slack) == 1
+    _, slack_offset, reference, key = slack[0]
+    assert key[3] == "deleted.txt" and key[4] == 7
+    assert reference & 0xFFFFFFFFFFFF == 200
+    used_end = 64 + sum(len(index_entry(0, name)) for name in LIVE_NAMES) + 16
+    assert slack_offset == used_end + 8
+
+
+def test_parse_index_stream_builds_i30_columns(tmp_path):
+    stream_path = tmp_path / "i30.bin"
+    stream_path.write_bytes(sample_stream())
+
+    df = parse_index_stream(str(stream_path), "Windows\\Temp", drive="C:", block_size=BLOCK_SIZE)
+
+    assert len(df) == len(LIVE_NAMES) + 1
+    assert df["IsSlack"].tolist() == [False] * len(LIVE_NAMES) + [True]
+    deleted = df.iloc[-1]
+    assert deleted["Name"] == "deleted.txt"
+    assert deleted["MFTId"] == 200
+    assert deleted["FullPath"] == "\\\\.\\C:\\Windows\\Temp"
+    assert deleted["Full Path with the name"] == "Windows\\Temp\\deleted.txt"
+    assert deleted["Btime"] == "2020-03-01T10:00:00.0000000Z"
+    assert deleted["Mtime"] == "2020-03-02T10:00:00.0000000Z"
+    assert "in_a_torn_block.txt" not in df["Name"].tolist()
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from mft_diff import SI_FIELDS, FN_FIELDS, diff_snapshots
+
+
+def snapshot(records):
+    """An extracted_mft_info frame from (entry, sequence, parent entry, name, path, $SI modified) records."""
+    rows = []
+    for entry, sequence, parent, name, path, modified in records:
+        times = {field: "2020-03-01 10:00:00.0000000" for field in SI_FIELDS + FN_FIELDS}
+        times["LastModified0x10"] = modified
+        rows.append({"EntryNumber": entry, "SequenceNumber": sequence, "ParentEntryNumber": parent, "ParentSequenceNumber": 1,
+                     "FileName": name, "Full Path with the name": path, **times})
+    return pd.DataFrame(rows)
+
+
+MARCH = "2020-03-05 10:00:00.0000000"
+FEBRUARY = "2020-02-05 10:00:00.0000000"
+
+OLDER = snapshot([
+    (40, 1, 5, "Docs", ".\\Docs", MARCH),
+    (41, 1, 40, "report.docx", ".\\Docs\\report.docx", MARCH),
+    (42, 1, 40, "notes.txt", ".\\Docs\\notes.txt", MARCH),
+    (43, 1, 5, "draft.txt", ".\\draft.txt", MARCH),
+    (44, 1, 5, "old.tmp", ".\\old.tmp", MARCH),
+    (45, 1, 40, "tool.exe", ".\\Docs\\tool.exe", MARCH),
+])
+NEWER = snapshot([
+    (40, 1, 5, "Papers", ".\\Papers", MARCH),
+    (41, 1, 40, "report.docx", ".\\Papers\\report.docx", MARCH),
+    (42, 1, 5, "notes.txt", ".\\notes.txt", MARCH),
+    (43, 1, 5, "final.txt", ".\\final.txt", MARCH),
+    (44, 2, 5, "new.tmp", ".\\new.tmp", MARCH),
+    (45, 1, 40, "tool.exe", ".\\Papers\\tool.exe", FEBRUARY),
+])
+
+
+def test_renaming_a_directory_reports_the_directory_but_not_its_files():
+    diff = diff_snapshots([OLDER, NEWER], ["vss1", "live"]).set_index("EntryNumber")
+
+    assert diff.index.tolist() == [40, 42, 43, 44, 45]
+    assert diff["Renamed"].tolist() == [True, True, True, False, False]
+    assert diff.loc[40, "SnapshotChanges"] == "renamed from .\\Docs (vss1 -> live)"
+    assert diff.loc[42, "PreviousPath"] == ".\\Docs\\notes.txt"
+    assert diff.loc[44, "Reused"] and diff.loc[44, "PreviousSequenceNumber"] == 1
+    assert diff.loc[45, "SIRegressed"] == "LastModified0x10"
+    assert diff.loc[45, "Full Path with the name"] == ".\\Papers\\tool.exe"
+
+
+def test_findings_in_renamed_directories_are_keyed_by_the_latest_path():
+    oldest = snapshot([(40, 1, 5, "Docs", ".\\Docs", MARCH), (45, 1, 40, "tool.exe", ".\\Docs\\tool.exe", MARCH)])
+    middle = snapshot([(40, 1, 5, "Docs", ".\\Docs", MARCH), (45, 1, 40, "tool.exe", ".\\Docs\\tool.exe", FEBRUARY)])
+    latest = snapshot([(40, 1, 5, "Papers", ".\\Papers", MARCH), (45, 1, 40, "tool.exe", ".\\Papers\\tool.exe", FEBRUARY)])
+
+    diff = diff_snapshots([oldest, middle, latest], ["vss1", "vss2", "live"])
+
+    assert diff[["EntryNumber", "Snapshot", "Full Path with the name"]].values.tolist() == [
+        [45, "vss1", ".\\Papers\\tool.exe"], [40, "vss2", ".\\Papers"]]
+    assert diff["Renamed"].tolist() == [False, True]
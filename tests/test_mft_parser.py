@@ -0,0 +1,148 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mft_parser import apply_fixups, parse_mft, read_record_size
+
+
+def filetime(text):
+    """FILETIME ticks of an ISO timestamp with up to 100 ns precision."""
+    whole, _, fraction = text.partition(".")
+    seconds = (np.datetime64(whole, "s") - np.datetime64("1601-01-01T00:00:00", "s")).astype(np.int64)
+    return int(seconds) * 10_000_000 + int(fraction.ljust(7, "0"))
+
+
+def attribute(attr_type, content):
+    """A resident attribute with its content right after the 24-byte header."""
+    length = (24 + len(content) + 7) // 8 * 8
+    header = struct.pack("<IIBBHHHIHBB", attr_type, length, 0, 0, 24, 0, 0, len(content), 24, 0, 0)
+    return (header + content).ljust(length, b"\0")
+
+
+def standard_information(created, modified, changed, accessed):
+    return attribute(0x10, struct.pack("<QQQQ", created, modified, changed, accessed).ljust(72, b"\0"))
+
+
+def file_name(parent_entry, parent_seq, name, times, namespace=1):
+    encoded = name.encode("utf-16-le")
+    body = struct.pack("<QQQQQQQIIBB", parent_seq << 48 | parent_entry, *times, 0, 0, 0, 0, len(name), namespace)
+    return attribute(0x30, body + encoded)
+
+
+def file_record(sequence, flags, attributes, size=1024, base_ref=0, usn=7):
+    """A FILE record with its update sequence array applied, as it is stored on disk."""
+    sectors = size // 512
+    usa_offset = 48
+    first = (usa_offset + 2 * (sectors + 1) + 7) // 8 * 8
+    body = b"".join(attributes) + struct.pack("<I", 0xFFFFFFFF)
+    record = bytearray(size)
+    struct.pack_into("<4sHHQHHHHIIQH", record, 0, b"FILE", usa_offset, sectors + 1, 0, sequence, 1, first, flags,
+                     first + len(body), size, base_ref, 0)
+    record[first:first + len(body)] = body
+    struct.pack_into("<H", record, usa_offset, usn)
+    for sector in range(sectors):
+        end = sector * 512 + 510
+        record[usa_offset + 2 + 2 * sector:usa_offset + 4 + 2 * sector] = record[end:end + 2]
+        struct.pack_into("<H", record, end, usn)
+    return bytes(record)
+
+
+def write_mft(path, records, size=1024):
+    """Write records, a dict of entry number to FILE record, as an $MFT with zeroed unused entries."""
+    data = bytearray(size * (max(records) + 1))
+    for entry, record in records.items():
+        data[entry * size:(entry + 1) * size] = record
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+SI_TIMES = (filetime("2020-01-02T03:04:05.1234567"), filetime("2020-01-03T00:00:00"),
+            filetime("2020-01-04T00:00:00.5"), filetime("2020-01-05T00:00:00.5"))
+FN_TIMES = (filetime("2021-06-01T12:00:00.0000001"), filetime("2021-06-01T12:00:00.0000001"),
+            filetime("2021-06-01T12:00:00.0000001"), filetime("2021-06-01T12:00:00.0000001"))
+LONG_NAME = "a_file_name_long_enough_to_cross_a_sector_boundary.exe"
+
+
+def sample_records(size=1024):
+    directory, in_use = 0x0003, 0x0001
+    torn = bytearray(file_record(1, in_use, [file_name(5, 5, "torn.txt", FN_TIMES)], size))
+    torn[size - 2:size] = b"\x09\x09"
+    return {
+        0: file_record(1, in_use, [standard_information(*SI_TIMES), file_name(5, 5, "$MFT", FN_TIMES)], size),
+        5: file_record(5, directory, [standard_information(*SI_TIMES), file_name(5, 5, ".", FN_TIMES)], size),
+        6: file_record(2, directory, [standard_information(*SI_TIMES), file_name(5, 5, "Windows", FN_TIMES)], size),
+        # The $DATA padding pushes the long name across offset 510, so it only reads back with fixups applied.
+        7: file_record(3, in_use, [standard_information(*SI_TIMES), attribute(0x80, b"x" * 330),
+                                   file_name(6, 2, "AFILE_~1.EXE", FN_TIMES, namespace=2),
+                                   file_name(6, 2, LONG_NAME, FN_TIMES)], size),
+        8: file_record(1, in_use, [file_name(6, 2, "no_si.txt", FN_TIMES)], size),
+        9: file_record(1, 0, [standard_information(*SI_TIMES), file_name(30, 1, "orphan.txt", FN_TIMES)], size),
+        10: file_record(1, in_use, [standard_information(*SI_TIMES), file_name(6, 1, "stale_parent.txt", FN_TIMES)], size),
+        11: bytes(torn),
+        12: file_record(1, in_use, [file_name(6, 2, "extension.txt", FN_TIMES)], size, base_ref=1 << 48 | 7),
+    }
+
+
+def test_apply_fixups_restores_sector_ends_and_rejects_torn_records():
+    record = file_record(1, 1, [file_name(5, 5, LONG_NAME, FN_TIMES)])
+    torn = bytearray(record)
+    torn[1022:1024] = b"\x09\x09"
+    batch = np.frombuffer(record + bytes(torn), dtype=np.uint8).reshape(2, 1024).copy()
+
+    valid = apply_fixups(batch)
+
+    assert valid.tolist() == [True, False]
+    assert batch[0, 510:512].tolist() == list(record[50:52])
+    assert batch[0, 1022:1024].tolist() == list(record[52:54])
+
+
+@pytest.mark.parametrize("size", [1024, 4096])
+def test_parse_mft_decodes_si_and_fn_and_resolves_paths(tmp_path, size):
+    mft_path = write_mft(tmp_path / "$MFT", sample_records(size), size)
+    assert read_record_size(mft_path) == size
+
+    df = parse_mft(mft_path).set_index("EntryNumber")
+
+    assert sorted(df.index) == [0, 5, 6, 7, 8, 9, 10]
+    row = df.loc[7]
+    assert row["FileName"] == LONG_NAME
+    assert row["ParentPath"] == ".\\Windows"
+    assert (row["ParentEntryNumber"], row["ParentSequenceNumber"], row["SequenceNumber"]) == (6, 2, 3)
+    assert row["Created0x10"] == "2020-01-02 03:04:05.1234567"
+    assert row["LastModified0x10"] == "2020-01-03 00:00:00.0000000"
+    assert row["Created0x30"] == "2021-06-01 12:00:00.0000001"
+    assert row["SI<FN"] and row["uSecZeros"] and row["InUse"]
+    assert not df.loc[9, "InUse"]
+
+
+def test_parse_mft_treats_missing_si_times_as_absent(tmp_path):
+    df = parse_mft(write_mft(tmp_path / "$MFT", sample_records())).set_index("EntryNumber")
+
+    row = df.loc[8]
+    assert pd.isna(row["Created0x10"]) and pd.isna(row["LastModified0x10"])
+    assert row["Created0x30"] == "2021-06-01 12:00:00.0000001"
+    assert not row["SI<FN"] and not row["uSecZeros"]
+
+
+def test_parse_mft_marks_orphans_with_unknown_parent_paths(tmp_path):
+    df = parse_mft(write_mft(tmp_path / "$MFT", sample_records())).set_index("EntryNumber")
+
+    assert df.loc[9, "ParentPath"] == ".\\PathUnknown\\Directory with ID 0x0000001E-00000001"
+    assert df.loc[10, "ParentPath"] == ".\\PathUnknown\\Directory with ID 0x00000006-00000001"
+    assert df.loc[6, "ParentPath"] == "."
+
+
+def test_parse_mft_is_the_same_with_several_workers(tmp_path):
+    records = sample_records()
+    for entry in range(13, 60):
+        times = tuple(value + entry for value in SI_TIMES)
+        records[entry] = file_record(1, 1, [standard_information(*times), file_name(6, 2, f"file{entry}.dll", FN_TIMES)])
+    mft_path = write_mft(tmp_path / "$MFT", records)
+
+    single = parse_mft(mft_path, workers=1, batch_records=8)
+    sharded = parse_mft(mft_path, workers=3, batch_records=8)
+
+    assert len(single) == 7 + 47
+    pd.testing.assert_frame_equal(single, sharded)
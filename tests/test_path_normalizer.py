@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from appcompatcache import shape_appcompat_info
+from path_normalizer import normalize_paths
+
+
+def test_normalize_paths_makes_paths_relative_to_the_volume_root():
+    paths = ["C:\\Windows\\System32\\cmd.exe", "\\\\?\\Volume{0a1b2c3d-0000-0000-0000-100000000000}\\Tools\\x.exe",
+             "SYSVOL\\Windows\\notepad.exe", "%SystemRoot%\\System32\\a.dll", "c:/users/public/b.txt",
+             ".\\Users\\report.docx", "Users\\already\\relative.txt", None]
+
+    assert normalize_paths(paths, fold_case=True).tolist() == [
+        "windows\\system32\\cmd.exe", "tools\\x.exe", "windows\\notepad.exe", "windows\\system32\\a.dll",
+        "users\\public\\b.txt", "users\\report.docx", "users\\already\\relative.txt", np.nan]
+
+
+def test_volume_roots_and_trailing_separators_normalize_the_same():
+    paths = ["C:", "C:\\", "c:/", "\\\\?\\C:\\", "\\\\.\\C:", "C:\\Windows", "C:\\Windows\\", "%windir%", "%windir%\\"]
+
+    assert normalize_paths(paths).tolist() == ["", "", "", "", "", "Windows", "Windows", "Windows", "Windows"]
+
+
+def test_shape_appcompat_info_takes_the_file_name_from_either_separator():
+    df = pd.DataFrame({"Path": ["C:\\Windows\\System32\\cmd.exe", "C:/tools/x.exe", "SYSVOL\\a.dll", "C:\\dir\\"],
+                       "LastModifiedTimeUTC": ["2020-03-01 10:00:00"] * 4})
+
+    shaped = shape_appcompat_info(df)
+
+    assert shaped["FileName"].tolist() == ["cmd.exe", "x.exe", "a.dll", ""]
+    assert shaped["Full Path with the name"].tolist() == ["Windows\\System32\\cmd.exe", "tools\\x.exe", "a.dll", "dir"]
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from results_store import query_results, write_results_db
+
+INDICATORS = ["si<fn", "$SI times prior to $I30"]
+
+
+def sample_results():
+    return pd.DataFrame({
+        "merge_key": ["windows\\system32\\a.dll", "windows\\system32\\drivers\\b.sys", "windows\\system32x\\c.dll",
+                      "windows\\d.exe", "windows\\system32"],
+        "lastmodified0x10": ["2020-01-01 00:00:00.0000000", "", "2021-01-01 00:00:00.0000000", "", ""],
+        "si<fn": ["True", "False", "True", "", "False"],
+        "$SI times prior to $I30": ["True", "True", "", "False", "False"],
+        "true_count": [2, 1, 1, 0, 0],
+    })
+
+
+def test_query_results_covers_every_level_below_a_directory(tmp_path):
+    db_path = write_results_db(sample_results(), str(tmp_path / "merged_output.sqlite"), INDICATORS)
+
+    for under in ["C:\\Windows\\System32", "\\\\?\\C:\\windows\\system32\\", "%SystemRoot%\\System32"]:
+        rows = query_results(db_path, under=under)
+        assert rows["merge_key"].tolist() == ["windows\\system32\\a.dll", "windows\\system32\\drivers\\b.sys"]
+
+
+def test_query_results_filters_on_score_and_indicators(tmp_path):
+    db_path = write_results_db(sample_results(), str(tmp_path / "merged_output.sqlite"), INDICATORS)
+
+    rows = query_results(db_path, min_score=1, indicators=["si<fn"])
+    assert rows["merge_key"].tolist() == ["windows\\system32\\a.dll", "windows\\system32x\\c.dll"]
+    assert rows["si<fn"].tolist() == [True, True]
+    assert rows["$SI times prior to $I30"].iloc[0] == True and pd.isna(rows["$SI times prior to $I30"].iloc[1])
+    assert rows["lastmodified0x10"].tolist() == ["2020-01-01 00:00:00.0000000", "2021-01-01 00:00:00.0000000"]
+
+    everything = query_results(db_path, limit=3)
+    assert everything["true_count"].tolist() == [2, 1, 1]
@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+
+import stage_cache
+
+
+def test_cache_key_changes_with_inputs_version_and_params(tmp_path, monkeypatch):
+    source = tmp_path / "$MFT"
+    source.write_bytes(b"FILE" * 100)
+    key = stage_cache.cache_key("mft", {"$mft": stage_cache.hash_file(str(source))}, {"native_mft": True})
+
+    assert stage_cache.cache_key("mft", {"$mft": stage_cache.hash_file(str(source))}, {"native_mft": True}) == key
+    assert stage_cache.cache_key("mft", {"$mft": stage_cache.hash_file(str(source))}, {"native_mft": False}) != key
+
+    source.write_bytes(b"FILE" * 101)
+    changed = stage_cache.cache_key("mft", {"$mft": stage_cache.hash_file(str(source))}, {"native_mft": True})
+    assert changed != key
+
+    monkeypatch.setitem(stage_cache.STAGE_VERSIONS, "mft", stage_cache.STAGE_VERSIONS["mft"] + 1)
+    assert stage_cache.cache_key("mft", {"$mft": stage_cache.hash_file(str(source))}, {"native_mft": True}) != changed
+
+
+def test_hash_directories_follows_directory_changes(tmp_path):
+    directory = tmp_path / "Temp"
+    directory.mkdir()
+    before = stage_cache.hash_directories([str(directory)])
+    os.utime(directory, ns=(0, 10 ** 18))
+    assert stage_cache.hash_directories([str(directory)]) != before
+
+
+def test_store_and_load_evict_the_least_recently_used_entry(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    frame = pd.DataFrame({"Full Path with the name": [f"file{n}" for n in range(100)]})
+    paths = {name: stage_cache.store(cache_dir, name, frame) for name in ["a", "b"]}
+    os.utime(paths["a"], ns=(10 ** 18, 10 ** 18))
+    os.utime(paths["b"], ns=(15 * 10 ** 17, 15 * 10 ** 17))
+    size = os.path.getsize(paths["a"])
+
+    # A hit refreshes the entry, so b becomes the least recently used.
+    pd.testing.assert_frame_equal(stage_cache.load(cache_dir, "a"), frame)
+    stage_cache.store(cache_dir, "c", frame, max_bytes=2 * size + size // 2)
+
+    assert sorted(os.listdir(cache_dir)) == ["a.pkl", "c.pkl"]
+    assert stage_cache.load(cache_dir, "b") is None
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stage_io import NO_TICKS, parse_ticks, read_stage, write_stage_batches
+
+
+def ticks(text):
+    """FILETIME ticks of an ISO timestamp with up to 100 ns precision, computed independently of the parser."""
+    whole, _, fraction = text.partition(".")
+    seconds = (np.datetime64(whole, "s") - np.datetime64("1601-01-01T00:00:00", "s")).astype(np.int64)
+    return int(seconds) * 10_000_000 + int(fraction.ljust(7, "0"))
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_write_stage_batches_keeps_columns_empty_in_the_first_batch(tmp_path, fmt):
+    pytest.importorskip("pyarrow")
+    batches = [
+        pd.DataFrame({"Name": ["a", "b"], "Extra": [np.nan, np.nan], "IsSlack": [np.nan, np.nan], "MFTId": [np.nan, np.nan],
+                      "Mtime": [np.nan, np.nan], "Full Path with the name": [np.nan, np.nan]}),
+        pd.DataFrame({"Name": ["c"], "Extra": ["x"], "IsSlack": ["True"], "MFTId": ["42"],
+                      "Mtime": ["2020-01-01T00:00:00.1234567Z"], "Full Path with the name": ["dir\\c"]}),
+    ]
+
+    write_stage_batches(iter(batches), str(tmp_path), "consolidated_i30_data", fmt)
+    df = read_stage(str(tmp_path), "consolidated_i30_data")
+
+    assert df["Name"].tolist() == ["a", "b", "c"]
+    assert df["Extra"].isna().tolist() == [True, True, False] and df["Extra"].iloc[2] == "x"
+    assert df["IsSlack"].iloc[2] == True and df["IsSlack"].iloc[:2].isna().all()
+    assert df["MFTId"].iloc[2] == 42
+    assert str(df["Mtime"].iloc[2]) == "2020-01-01 00:00:00.123456700"
+    assert df["Full Path with the name"].iloc[2] == "dir\\c"
+
+
+def test_parse_ticks_rejects_days_the_month_does_not_have():
+    values = pd.Series(["2020-02-29 10:00:00", "2020-02-30 10:00:00", "2019-02-29 10:00:00", "1900-02-29 10:00:00",
+                        "2000-02-29 10:00:00", "2021-04-31 00:00:00", "2021-12-31 23:59:59"])
+
+    parsed = parse_ticks(values)
+
+    assert parsed.tolist() == [ticks("2020-02-29T10:00:00"), NO_TICKS, NO_TICKS, NO_TICKS,
+                               ticks("2000-02-29T10:00:00"), NO_TICKS, ticks("2021-12-31T23:59:59")]
+
+
+def test_parse_ticks_detects_the_layout_of_every_call(monkeypatch):
+    def no_pandas(*args, **kwargs):
+        raise AssertionError("the integer parser should have handled these values")
+
+    monkeypatch.setattr(pd, "to_datetime", no_pandas)
+    # Two sources sharing a column name but not a layout: both take the integer path.
+    velociraptor = parse_ticks(pd.Series(["2020-01-01T00:00:00.1234567Z"], name="Created0x10"))
+    mftecmd = parse_ticks(pd.Series(["2020-01-01 00:00:01.5"], name="Created0x10"))
+
+    assert velociraptor.tolist() == [ticks("2020-01-01T00:00:00.1234567")]
+    assert mftecmd.tolist() == [ticks("2020-01-01T00:00:01.5")]
@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import subprocess
+
+import stage_metrics
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_module_installs_no_audit_hook():
+    # Run in a fresh interpreter, as this one may already have the hook installed.
+    script = ("import sys\n"
+              "installed = []\n"
+              "sys.addaudithook = lambda hook: installed.append(hook)\n"
+              "import stage_metrics\n"
+              "print(len(installed), stage_metrics.subprocess_launches)\n")
+    output = subprocess.run([sys.executable, "-c", script], cwd=REPO, capture_output=True, text=True, check=True).stdout
+
+    assert output.split() == ["0", "None"]
+
+
+def test_measure_counts_subprocesses_once_counting_is_enabled(tmp_path):
+    metrics_path = tmp_path / "metrics.jsonl"
+    stage_metrics.count_subprocesses()
+    stage_metrics.count_subprocesses()
+
+    with stage_metrics.measure("stage", str(metrics_path), "run") as record:
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        record["rows_out"] = 1
+
+    record = json.loads(metrics_path.read_text())
+    assert record["subprocesses"] == 1
+    assert record["rows_out"] == 1 and record["status"] == "ok"
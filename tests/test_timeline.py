@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from timeline import merge_runs, slice_timeline, sort_events, split_block, write_run, write_timeline
+
+
+def random_events(seed, count=400):
+    """Events with many repeated times, so runs and blocks have ties to keep together."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Ticks": 132000000000000000 + rng.integers(0, 60, count) * 10_000_000,
+        "Source": rng.choice(np.array(["$SI", "$FN", "$I30"], dtype=object), count),
+        "Attribute": rng.choice(np.array(["Created", "Modified"], dtype=object), count),
+        "MACB": "m",
+        "Path": np.array([f"windows\\file{n}.dll" for n in rng.integers(0, 50, count)], dtype=object),
+        "Indicators": "",
+        "true_count": pd.array(rng.integers(0, 3, count), dtype="Int64"),
+    })
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_merge_runs_yields_one_sorted_stream_without_splitting_a_time(tmp_path, seed):
+    events = random_events(seed)
+    runs = [write_run(sort_events(events.iloc[start:start + 80]), str(tmp_path / f"run{start}.pkl"), block_events=7)
+            for start in range(0, len(events), 80)]
+
+    blocks = list(merge_runs(runs))
+
+    pd.testing.assert_frame_equal(pd.concat(blocks, ignore_index=True), sort_events(events))
+    for before, after in zip(blocks, blocks[1:]):
+        assert before["Ticks"].iat[-1] < after["Ticks"].iat[0]
+
+
+def test_split_block_cuts_only_where_the_time_changes():
+    events = sort_events(random_events(7))
+
+    pieces = list(split_block(events, block_events=25))
+
+    assert len(pieces) > 5
+    pd.testing.assert_frame_equal(pd.concat(pieces), events)
+    for before, after in zip(pieces, pieces[1:]):
+        assert before["Ticks"].iat[-1] < after["Ticks"].iat[0]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "arrow"])
+def test_slice_timeline_reads_windows_through_the_block_index(tmp_path, fmt):
+    if fmt != "csv":
+        pytest.importorskip("pyarrow")
+    events = sort_events(random_events(11))
+    write_timeline(split_block(events, block_events=30), str(tmp_path), fmt=fmt)
+    index = pd.read_csv(tmp_path / "timeline_index.csv")
+    assert len(index) > 5 and index["row_start"].iat[-1] + index["rows"].iat[-1] == len(events)
+
+    ticks = np.unique(events["Ticks"])
+    for start, end in [(ticks[0], ticks[-1] + 1), (ticks[10], ticks[11]), (ticks[15], ticks[40]), (ticks[-1] + 1, ticks[-1] + 2)]:
+        expected = events[(events["Ticks"] >= start) & (events["Ticks"] < end)]
+        sliced = list(slice_timeline(str(tmp_path), int(start), int(end)))
+        got = pd.concat(sliced, ignore_index=True) if sliced else events.iloc[:0]
+        assert got["Ticks"].astype(np.int64).tolist() == expected["Ticks"].tolist()
+        assert got["Path"].tolist() == expected["Path"].tolist()
+        assert got["true_count"].astype("Int64").tolist() == expected["true_count"].tolist()
@@ -0,0 +1,97 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+from usn_parser import REASON_BASIC_INFO_CHANGE, REASON_FILE_CREATE, iter_usn_records, join_usn_to_mft, parse_usn_journal
+
+
+def filetime(text):
+    seconds = (np.datetime64(text, "s") - np.datetime64("1601-01-01T00:00:00", "s")).astype(np.int64)
+    return int(seconds) * 10_000_000
+
+
+T1, T2, T3, T4, T5, T6 = (filetime(f"2020-03-0{day}T10:00:00") for day in range(1, 7))
+
+
+def usn_record(version, entry, seq, usn, ticks, reason, name):
+    """A USN_RECORD_V2 or V3 for file reference (entry, seq) in directory 5, padded to 8 bytes."""
+    encoded = name.encode("utf-16-le")
+    reference = seq << 48 | entry
+    if version == 2:
+        fixed = struct.pack("<IHHQQqqIIIIHH", 0, 2, 0, reference, 1 << 48 | 5, usn, ticks, reason, 0, 0, 0x20, len(encoded), 60)
+    else:
+        fixed = struct.pack("<IHH16s16sqqIIIIHH", 0, 3, 0, reference.to_bytes(16, "little"), (1 << 48 | 5).to_bytes(16, "little"),
+                            usn, ticks, reason, 0, 0, 0x20, len(encoded), 76)
+    record = (fixed + encoded).ljust((len(fixed) + len(encoded) + 7) // 8 * 8, b"\0")
+    return struct.pack("<I", len(record)) + record[4:]
+
+
+def sample_journal():
+    """A $J with a sparse zero head, V2 and V3 records, a zero-filled gap and bytes that are no record."""
+    head = b"\0" * (3 * (1 << 20) + 4096)
+    first = [
+        usn_record(2, 100, 1, 1, T1, REASON_FILE_CREATE, "report.docx"),
+        usn_record(2, 100, 1, 2, T2, REASON_FILE_CREATE | REASON_BASIC_INFO_CHANGE, "report.docx"),
+        usn_record(3, 100, 1, 3, T3, REASON_BASIC_INFO_CHANGE, "report.docx"),
+    ]
+    gap = b"\0" * 40000
+    junk = struct.pack("<IH", 0x7FFFFFF0, 9).ljust(16, b"\xff")
+    second = [
+        usn_record(3, 100, 1, 4, T4, REASON_BASIC_INFO_CHANGE, "report.docx"),
+        usn_record(2, 100, 2, 5, T5, REASON_FILE_CREATE, "reused.txt"),
+        usn_record(3, 200, 1, 6, T6, REASON_BASIC_INFO_CHANGE, "tool.exe"),
+    ]
+    return head + b"".join(first) + gap + junk + b"".join(second)
+
+
+def test_iter_usn_records_decodes_v2_and_v3_records_across_gaps(tmp_path):
+    journal = tmp_path / "$J"
+    journal.write_bytes(sample_journal())
+
+    records = pd.concat(iter_usn_records(str(journal), window_bytes=256, with_names=True), ignore_index=True)
+
+    assert records["Usn"].tolist() == [1, 2, 3, 4, 5, 6]
+    assert records["EntryNumber"].tolist() == [100, 100, 100, 100, 100, 200]
+    assert records["SequenceNumber"].tolist() == [1, 1, 1, 1, 2, 1]
+    assert (records["ParentEntryNumber"] == 5).all() and (records["ParentSequenceNumber"] == 1).all()
+    assert records["Ticks"].tolist() == [T1, T2, T3, T4, T5, T6]
+    assert records["Name"].tolist() == ["report.docx"] * 4 + ["reused.txt", "tool.exe"]
+
+
+def test_parse_usn_journal_summarizes_each_file_reference(tmp_path):
+    journal = tmp_path / "$J"
+    journal.write_bytes(sample_journal())
+
+    summary = parse_usn_journal(str(journal), window_bytes=256).set_index(["EntryNumber", "SequenceNumber"]).sort_index()
+
+    assert summary.index.tolist() == [(100, 1), (100, 2), (200, 1)]
+    # The BASIC_INFO_CHANGE carrying FILE_CREATE is the creating handle's own and is not counted.
+    assert summary.loc[(100, 1)].tolist() == [T1, T4, 2]
+    assert summary.loc[(100, 2), "UsnCreated"] == T5 and pd.isna(summary.loc[(100, 2), "UsnBasicInfoChange"])
+    assert pd.isna(summary.loc[(200, 1), "UsnCreated"]) and summary.loc[(200, 1), "UsnBasicInfoChanges"] == 1
+    pd.testing.assert_frame_equal(parse_usn_journal(str(journal)), parse_usn_journal(str(journal), window_bytes=256))
+
+
+def test_join_usn_to_mft_matches_entry_and_sequence(tmp_path):
+    journal = tmp_path / "$J"
+    journal.write_bytes(sample_journal())
+    mft_df = pd.DataFrame({"EntryNumber": ["100", "200"], "SequenceNumber": ["1", "1"],
+                           "Full Path with the name": [".\\Users\\report.docx", ".\\Tools\\tool.exe"]})
+
+    joined = join_usn_to_mft(parse_usn_journal(str(journal)), mft_df).set_index("Full Path with the name")
+
+    assert joined.index.tolist() == [".\\Users\\report.docx", ".\\Tools\\tool.exe"]
+    assert joined.loc[".\\Users\\report.docx", "UsnCreated"] == "2020-03-01 10:00:00.0000000"
+    assert joined.loc[".\\Users\\report.docx", "UsnBasicInfoChange"] == "2020-03-04 10:00:00.0000000"
+    assert pd.isna(joined.loc[".\\Tools\\tool.exe", "UsnCreated"])
+
+
+def test_parse_usn_journal_of_an_all_zero_journal_is_empty(tmp_path):
+    journal = tmp_path / "$J"
+    journal.write_bytes(b"\0" * (2 * (1 << 20)))
+
+    summary = parse_usn_journal(str(journal))
+
+    assert summary.empty and list(summary.columns) == ["EntryNumber", "SequenceNumber", "UsnCreated", "UsnBasicInfoChange",
+                                                       "UsnBasicInfoChanges"]
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+import velocerabtor
+from velocerabtor import consolidate_i30_recursive, iter_streamed, run_i30_collections
+
+if os.name == "nt":
+    pytest.skip("the stand-in collector is a script run through its shebang", allow_module_level=True)
+
+# Stands in for Velociraptor: the last part of the DirectoryGlobs argument picks the behaviour,
+# and every run is logged under COLLECTOR_STATE so the tests can count attempts.
+COLLECTOR = """#!{python}
+import os, sys, time
+directory_glob = sys.argv[5].split("=", 1)[1]
+name = directory_glob.rstrip("*").rstrip("\\\\").split("\\\\")[-1]
+state = os.path.join(os.environ["COLLECTOR_STATE"], name)
+with open(state, "a") as log:
+    log.write("x")
+attempt = os.path.getsize(state)
+if name.startswith("fail") or (name.startswith("flaky") and attempt == 1):
+    sys.stdout.write("FullPath,Name,Size\\n" + directory_glob + ",half")
+    sys.exit(3)
+if name.startswith("slow"):
+    print("FullPath,Name,Size", flush=True)
+    print(directory_glob + ",early.txt,0", flush=True)
+    time.sleep(60)
+if name.startswith("late"):
+    time.sleep(0.5)
+print("FullPath,Name,Size")
+for n in range(3):
+    print(f"{{directory_glob}},{{name}}_{{n}}.txt,{{n}}")
+"""
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    state = tmp_path / "state"
+    state.mkdir()
+    monkeypatch.setenv("COLLECTOR_STATE", str(state))
+    path = tmp_path / "collector"
+    path.write_text(COLLECTOR.format(python=sys.executable))
+    path.chmod(0o755)
+    return str(path), state
+
+
+def attempts(state, name):
+    path = state / name
+    return os.path.getsize(path) if path.exists() else 0
+
+
+def test_failed_exits_are_retried_and_reported(collector, tmp_path):
+    path, state = collector
+    directories = ["C:\\data\\ok1", "C:\\data\\flaky", "C:\\data\\fail", "C:\\data\\ok2"]
+
+    csv_files = run_i30_collections(path, directories, str(tmp_path / "out"), workers=3, retries=1)
+
+    assert [os.path.basename(csv_file) for csv_file in csv_files] == ["C_data_ok1.csv", "C_data_flaky.csv", "C_data_ok2.csv"]
+    with open(csv_files[1]) as infile:
+        assert infile.read().splitlines() == ["FullPath,Name,Size"] + [f"C:\\data\\flaky,flaky_{n}.txt,{n}" for n in range(3)]
+    assert [attempts(state, name) for name in ["ok1", "flaky", "fail", "ok2"]] == [1, 2, 2, 1]
+
+
+def test_timed_out_collections_are_killed(collector, tmp_path):
+    path, state = collector
+
+    started = time.monotonic()
+    csv_files = run_i30_collections(path, ["C:\\data\\slow", "C:\\data\\ok"], str(tmp_path / "out"), workers=2, timeout=1, retries=1)
+
+    assert time.monotonic() - started < 30
+    assert [os.path.basename(csv_file) for csv_file in csv_files] == ["C_data_ok.csv"]
+    assert attempts(state, "slow") == 2
+
+
+def consolidated_rows(tmp_path, path, globs, monkeypatch, **options):
+    monkeypatch.setattr(velocerabtor, "plan_i30_globs", lambda partition, is_os_partition: globs)
+    consolidated = consolidate_i30_recursive(path, "C:\\", False, str(tmp_path), **options)
+    with open(consolidated) as infile:
+        return infile.read().splitlines()
+
+
+def test_recursive_collections_are_written_in_plan_order(collector, tmp_path, monkeypatch):
+    path, state = collector
+    globs = ["C:\\data\\late\\**", "C:\\data\\fail", "C:\\data\\ok\\**"]
+
+    rows = consolidated_rows(tmp_path, path, globs, monkeypatch, workers=3, retries=1)
+
+    assert rows[0] == "FullPath,Name,Size,Full Path with the name"
+    assert [row.split(",")[1] for row in rows[1:]] == [f"late_{n}.txt" for n in range(3)] + [f"ok_{n}.txt" for n in range(3)]
+    assert attempts(state, "fail") == 2
+
+
+def test_recursive_collections_that_time_out_are_killed_and_keep_their_rows(collector, tmp_path, monkeypatch):
+    path, state = collector
+
+    started = time.monotonic()
+    rows = consolidated_rows(tmp_path, path, ["C:\\data\\slow\\**", "C:\\data\\ok"], monkeypatch, workers=2, timeout=1, retries=1)
+
+    assert time.monotonic() - started < 30
+    assert [row.split(",")[1] for row in rows[1:]] == ["early.txt"] + [f"ok_{n}.txt" for n in range(3)]
+    assert attempts(state, "slow") == 1
+
+
+def test_iter_streamed_holds_a_bounded_number_of_values():
+    produced = []
+    lock = threading.Lock()
+
+    def stream(item):
+        for n in range(50):
+            with lock:
+                produced.append((item, n))
+            yield item, n
+
+    consumed = []
+    for value in iter_streamed(stream, ["a", "b", "c"], workers=2, buffered=3):
+        consumed.append(value)
+        time.sleep(0.002)
+        with lock:
+            # Values produced but not consumed yet: two queues of three, plus one waiting to be put per worker.
+            assert len(produced) - len(consumed) <= 2 * 3 + 2
+
+    assert consumed == [(item, n) for item in "abc" for n in range(50)]
@@ -0,0 +1,343 @@
+import os
+import sys
+import shutil
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from baseline import PATTERN_COLUMNS
+from fleet_stats import indicator_hits
+from mft_parser import TICKS_PER_SECOND, filetime_to_string
+import stage_io
+from stage_io import FILETIME_UNIX_EPOCH, FORMATS, NO_TICKS, find_stage, iter_stage, pa, parse_ticks, require_pyarrow, stage_path
+
+
+TIMELINE_NAME = "timeline"
+RUN_ROWS = 100000
+BLOCK_EVENTS = 100000
+
+# merged_output timestamp column -> (source, attribute, MACB slot it fills in a bodyfile)
+EVENT_SOURCES = {
+    "created0x10": ("$SI", "Created", "b"),
+    "lastmodified0x10": ("$SI", "Modified", "m"),
+    "lastrecordchange0x10": ("$SI", "RecordChange", "c"),
+    "created0x30": ("$FN", "Created", "b"),
+    "lastmodified0x30": ("$FN", "Modified", "m"),
+    "lastrecordchange0x30": ("$FN", "RecordChange", "c"),
+    "btime": ("$I30", "Created", "b"),
+    "mtime": ("$I30", "Modified", "m"),
+    "atime": ("$I30", "Accessed", "a"),
+    "ctime": ("$I30", "RecordChange", "c"),
+    "lastmodifiedtimeutc": ("ShimCache", "Modified", "m"),
+    "linkdate": ("Amcache", "LinkDate", "b"),
+    "usncreated": ("$J", "FileCreate", "b"),
+    "usnbasicinfochange": ("$J", "BasicInfoChange", "c"),
+}
+
+EVENT_COLUMNS = ["Time", "Ticks", "Source", "Attribute", "MACB", "Path", "Indicators", "true_count"]
+SORT_COLUMNS = ["Ticks", "Path", "Source", "Attribute"]
+INDEX_COLUMNS = ["block", "first_ticks", "last_ticks", "row_start", "rows", "offset"]
+MACTIME_COLUMNS = ["Date", "Size", "Type", "Mode", "UID", "GID", "Meta", "File Name"]
+
+
+def row_indicators(df):
+    """The names of the indicators True on each row, joined with '; ', '' for none."""
+    names = np.full(len(df), "", dtype=object)
+    for col in PATTERN_COLUMNS:
+        hits = indicator_hits(df, col)
+        names[hits] = np.where(names[hits] == "", col, names[hits] + "; " + col)
+    return names
+
+
+def explode_events(df):
+    """Turn merged_output rows into one event per timestamp, splitting cells that hold several '; '-joined times."""
+    paths = df["merge_key"].astype(str).to_numpy(dtype=object)
+    indicators = row_indicators(df)
+    true_count = (pd.to_numeric(df["true_count"], errors="coerce").astype("Int64") if "true_count" in df.columns
+                  else pd.Series(pd.NA, index=df.index, dtype="Int64")).to_numpy(dtype=object)
+
+    frames = []
+    for col, (source, attribute, macb) in EVENT_SOURCES.items():
+        if col not in df.columns:
+            continue
+        present = df[col].notna().to_numpy()
+        values = df[col][present].astype(str).set_axis(np.flatnonzero(present))
+        if values.str.contains("; ", regex=False).any():
+            values = values.str.split("; ").explode()
+        ticks = parse_ticks(values)
+        timed = ticks != NO_TICKS
+        rows = values.index.to_numpy()[timed]
+        frames.append(pd.DataFrame({
+            "Ticks": ticks[timed], "Source": source, "Attribute": attribute, "MACB": macb,
+            "Path": paths[rows], "Indicators": indicators[rows], "true_count": true_count[rows],
+        }))
+    if not frames:
+        return pd.DataFrame({col: pd.Series(dtype=object) for col in EVENT_COLUMNS[1:]}).astype({"Ticks": np.int64})
+    return pd.concat(frames, ignore_index=True)
+
+
+def sort_events(events):
+    return events.sort_values(SORT_COLUMNS, kind="stable", ignore_index=True)
+
+
+def write_run(events, run_path, block_events=BLOCK_EVENTS):
+    """Spill sorted events to a run file as a sequence of pickled blocks."""
+    with open(run_path, "wb") as outfile:
+        for start in range(0, len(events), block_events):
+            pickle.dump(events.iloc[start:start + block_events], outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+
+def read_run(run_path):
+    with open(run_path, "rb") as infile:
+        while True:
+            try:
+                yield pickle.load(infile)
+            except EOFError:
+                return
+
+
+def merge_runs(run_paths):
+    """k-way merge sorted runs into a stream of sorted blocks, holding about one block per run in memory.
+
+    Each round emits every buffered event earlier than the smallest last time among the runs
+    still being read, so a block never splits the events of one time and the blocks follow one
+    another in order. A run whose buffer holds a single time is read further before the round.
+    """
+    readers = [read_run(path) for path in run_paths]
+    buffers = [None] * len(readers)
+    while True:
+        for number, reader in enumerate(readers):
+            while reader is not None and (buffers[number] is None or buffers[number].empty
+                                          or buffers[number]["Ticks"].iat[0] == buffers[number]["Ticks"].iat[-1]):
+                block = next(reader, None)
+                if block is None:
+                    readers[number] = reader = None
+                elif buffers[number] is None or buffers[number].empty:
+                    buffers[number] = block
+                else:
+                    buffers[number] = pd.concat([buffers[number], block], ignore_index=True)
+
+        live = [number for number, buffer in enumerate(buffers) if buffer is not None and not buffer.empty]
+        if not live:
+            return
+        reading = [number for number in live if readers[number] is not None]
+        cutoff = min(buffers[number]["Ticks"].iat[-1] for number in reading) if reading else None
+
+        parts = []
+        for number in live:
+            ticks = buffers[number]["Ticks"].to_numpy()
+            emitted = len(ticks) if cutoff is None else int(np.searchsorted(ticks, cutoff, side="left"))
+            if emitted:
+                parts.append(buffers[number].iloc[:emitted])
+                buffers[number] = buffers[number].iloc[emitted:]
+        yield sort_events(pd.concat(parts, ignore_index=True))
+        if cutoff is None:
+            return
+
+
+def sorted_events(chunks, work_dir, progress=True):
+    """Externally sort the events of merged_output chunks: one sorted run file per chunk, then merge_runs."""
+    run_dir = tempfile.mkdtemp(prefix="timeline_runs_", dir=work_dir)
+    try:
+        run_paths = []
+        for number, chunk in enumerate(tqdm(chunks, desc="Sorting runs...", file=sys.stdout, disable=not progress)):
+            events = explode_events(chunk)
+            if not events.empty:
+                run_paths.append(write_run(sort_events(events), os.path.join(run_dir, f"run_{number:06d}.pkl")))
+        yield from merge_runs(run_paths)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def split_block(block, block_events=BLOCK_EVENTS):
+    """Cut a sorted block into pieces of about block_events events, only where the time changes."""
+    ticks = block["Ticks"].to_numpy()
+    start = 0
+    while start < len(ticks):
+        stop = len(ticks) if start + block_events >= len(ticks) else int(np.searchsorted(ticks, ticks[start + block_events], side="left"))
+        if stop <= start:
+            stop = int(np.searchsorted(ticks, ticks[start], side="right"))
+        yield block.iloc[start:stop]
+        start = stop
+
+
+def with_times(block):
+    """Add the formatted Time column in front of a block of events."""
+    block = block.copy()
+    block.insert(0, "Time", filetime_to_string(block["Ticks"].to_numpy(dtype=np.uint64)).to_numpy())
+    return block[EVENT_COLUMNS]
+
+
+def entries(block):
+    """Collapse events with the same time, path and source into one entry with its MACB flags, as mactime lists them."""
+    ticks = block["Ticks"].to_numpy()
+    paths = block["Path"].to_numpy(dtype=object)
+    sources = block["Source"].to_numpy(dtype=object)
+    starts = np.flatnonzero(np.concatenate(([True], (ticks[1:] != ticks[:-1]) | (paths[1:] != paths[:-1]) | (sources[1:] != sources[:-1]))))
+    macb = block["MACB"].to_numpy(dtype=object)
+    flags = {letter: np.logical_or.reduceat(macb == letter, starts) for letter in "macb"}
+    return ticks[starts], paths[starts], sources[starts], flags
+
+
+def mactime_lines(block):
+    """Render a block as rows of `mactime -d` CSV output; File Name carries the source, e.g. 'windows\\notepad.exe ($SI)'."""
+    ticks, paths, sources, flags = entries(block)
+    types = np.full(len(ticks), "", dtype=object)
+    for letter in "macb":
+        types = types + np.where(flags[letter], letter, ".")
+    return pd.DataFrame({
+        "Date": filetime_to_string(ticks.astype(np.uint64)).to_numpy(), "Size": 0, "Type": types,
+        "Mode": "", "UID": 0, "GID": 0, "Meta": 0, "File Name": paths + " (" + sources + ")",
+    })
+
+
+def body_lines(block):
+    """Render a block as TSK 3.x bodyfile lines, MD5|name|inode|mode|UID|GID|size|atime|mtime|ctime|crtime, times in Unix seconds."""
+    ticks, paths, sources, flags = entries(block)
+    seconds = ((ticks - FILETIME_UNIX_EPOCH) // TICKS_PER_SECOND).astype(str).astype(object)
+    slots = {letter: np.where(flags[letter], seconds, "0") for letter in "macb"}
+    names = paths + " (" + sources + ")"
+    return "".join(f"0|{name}|0|0|0|0|0|{a}|{m}|{c}|{b}\n"
+                   for name, a, m, c, b in zip(names, slots["a"], slots["m"], slots["c"], slots["b"]))
+
+
+def write_timeline(blocks, outdir, name=TIMELINE_NAME, fmt="csv", mactime=False, body=False):
+    """Write sorted event blocks to outdir/<name>.<fmt>, its block index, and optionally mactime CSV and bodyfile copies.
+
+    The index holds each block's first and last time, first row and, for CSV, byte offset, so a
+    time window is read back without scanning or re-sorting the timeline. Returns the timeline path.
+    """
+    require_pyarrow(fmt)
+    path = stage_path(outdir, name, fmt)
+    index = []
+    rows = 0
+    writer = schema = None
+    csv_file = open(path, "w", encoding="utf-8", newline="") if fmt == "csv" else None
+    mactime_file = open(os.path.join(outdir, f"{name}_mactime.csv"), "w", encoding="utf-8", newline="") if mactime else None
+    body_file = open(os.path.join(outdir, f"{name}.body"), "w", encoding="utf-8", newline="\n") if body else None
+    try:
+        if csv_file:
+            csv_file.write(",".join(EVENT_COLUMNS) + "\n")
+        if mactime_file:
+            mactime_file.write(",".join(MACTIME_COLUMNS) + "\n")
+        pieces = (piece for block in blocks for piece in split_block(block))
+        for number, block in enumerate(pieces):
+            block = with_times(block)
+            offset = csv_file.tell() if csv_file else None
+            if csv_file:
+                block.to_csv(csv_file, header=False, index=False)
+            else:
+                table = pa.Table.from_pandas(block.astype({"true_count": "Int64"}), preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = stage_io.pq.ParquetWriter(path, schema) if fmt == "parquet" else pa.ipc.new_file(path, schema)
+                writer.write_table(table.cast(schema))
+            if mactime_file:
+                mactime_lines(block).to_csv(mactime_file, header=False, index=False)
+            if body_file:
+                body_file.write(body_lines(block))
+            index.append((number, int(block["Ticks"].iat[0]), int(block["Ticks"].iat[-1]), rows, len(block), offset))
+            rows += len(block)
+        if writer is None and fmt != "csv":
+            empty = pa.Table.from_pandas(with_times(explode_events(pd.DataFrame({"merge_key": []}))).astype({"true_count": "Int64"}), preserve_index=False)
+            writer = stage_io.pq.ParquetWriter(path, empty.schema) if fmt == "parquet" else pa.ipc.new_file(path, empty.schema)
+    finally:
+        for handle in (csv_file, mactime_file, body_file, writer):
+            if handle is not None:
+                handle.close()
+    pd.DataFrame(index, columns=INDEX_COLUMNS).to_csv(os.path.join(outdir, f"{name}_index.csv"), index=False)
+    return path
+
+
+def build_timeline(outdir, fmt="csv", mactime=False, body=False, chunk_rows=RUN_ROWS):
+    """Build the sorted super-timeline of the merged_output in outdir, in memory bounded by chunk_rows rows per run."""
+    chunks = iter_stage(outdir, "merged_output", chunk_rows=chunk_rows)
+    return write_timeline(sorted_events(chunks, outdir), outdir, TIMELINE_NAME, fmt, mactime, body)
+
+
+def read_rows(path, fmt, index, start, stop):
+    """Read rows [start, stop) of a timeline file, touching only the blocks, row groups or batches that hold them."""
+    if fmt == "csv":
+        first = index[index["row_start"] + index["rows"] > start].iloc[0]
+        with open(path, "r", encoding="utf-8", newline="") as infile:
+            infile.seek(int(first["offset"]))
+            rows = pd.read_csv(infile, header=None, names=EVENT_COLUMNS, skiprows=start - int(first["row_start"]),
+                               nrows=stop - start, keep_default_na=False, dtype=str)
+        return rows.astype({"Ticks": np.int64}).assign(true_count=pd.to_numeric(rows["true_count"], errors="coerce").astype("Int64"))
+
+    if fmt == "parquet":
+        parquet = stage_io.pq.ParquetFile(path)
+        sizes = [parquet.metadata.row_group(group).num_rows for group in range(parquet.num_row_groups)]
+        read_group = parquet.read_row_group
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        sizes = [reader.get_batch(batch).num_rows for batch in range(reader.num_record_batches)]
+        read_group = lambda batch: pa.Table.from_batches([reader.get_batch(batch)])
+    bounds = np.concatenate(([0], np.cumsum(sizes)))
+    groups = [group for group in range(len(sizes)) if bounds[group] < stop and bounds[group + 1] > start]
+    if not groups:
+        return read_group(0).slice(0, 0).to_pandas() if sizes else pd.DataFrame(columns=EVENT_COLUMNS)
+    table = pa.concat_tables([read_group(group) for group in groups])
+    return table.slice(start - int(bounds[groups[0]]), stop - start).to_pandas()
+
+
+def slice_timeline(outdir, start_ticks, end_ticks, name=TIMELINE_NAME):
+    """Yield the events of a built timeline with start_ticks <= time < end_ticks, in blocks, reading only the blocks in the window."""
+    path, fmt = find_stage(outdir, name)
+    if path is None:
+        raise FileNotFoundError(f"No {name} found in {outdir}; build it first")
+    index = pd.read_csv(os.path.join(outdir, f"{name}_index.csv"))
+    window = index[(index["last_ticks"] >= start_ticks) & (index["first_ticks"] < end_ticks)]
+    for _, block in window.iterrows():
+        rows = read_rows(path, fmt, index, int(block["row_start"]), int(block["row_start"] + block["rows"]))
+        ticks = rows["Ticks"].to_numpy(dtype=np.int64)
+        rows = rows[(ticks >= start_ticks) & (ticks < end_ticks)]
+        if not rows.empty:
+            yield rows.drop(columns="Time")
+
+
+def window_ticks(text, default):
+    if text is None:
+        return default
+    ticks = parse_ticks(pd.Series([text]))[0]
+    if ticks == NO_TICKS:
+        raise ValueError(f"Cannot read the time '{text}'")
+    return int(ticks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export merged_output as a time-sorted super-timeline, or slice a time window from one.")
+    parser.add_argument("-outdir", required=True, help="Directory holding merged_output and receiving the timeline.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of the timeline (parquet and arrow need pyarrow).")
+    parser.add_argument("-mactime", action="store_true", help="Also write the timeline as `mactime -d` CSV.")
+    parser.add_argument("-body", action="store_true", help="Also write the timeline as a TSK bodyfile.")
+    parser.add_argument("-start", default=None, help="Slice the built timeline from this UTC time on (e.g. 2024-03-01 or 2024-03-01 12:00:00).")
+    parser.add_argument("-end", default=None, help="Slice the built timeline up to, not including, this UTC time.")
+    parser.add_argument("-name", default="timeline_slice", help="Base name of the files a slice is written to.")
+    parser.add_argument("-chunk_rows", type=int, default=RUN_ROWS, help="merged_output rows sorted in memory per run.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.outdir):
+        print(f"Error: Output directory not found at {args.outdir}")
+        exit(1)
+
+    try:
+        if args.start or args.end:
+            start_ticks = window_ticks(args.start, np.iinfo(np.int64).min)
+            end_ticks = window_ticks(args.end, NO_TICKS)
+            path = write_timeline(slice_timeline(args.outdir, start_ticks, end_ticks), args.outdir, args.name, args.format, args.mactime, args.body)
+            print(f"Timeline slice saved to: {path}")
+        else:
+            if find_stage(args.outdir, "merged_output")[0] is None:
+                print(f"Error: No merged_output found in {args.outdir}")
+                exit(1)
+            path = build_timeline(args.outdir, args.format, args.mactime, args.body, args.chunk_rows)
+            print(f"Timeline saved to: {path}")
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        exit(1)
@@ -0,0 +1,231 @@
+import mmap
+import os
+import struct
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from mft_parser import filetime_to_string
+from stage_io import FORMATS, read_stage, write_stage
+
+
+WINDOW_BYTES = 1 << 24
+ZERO_STRIDE = 1 << 20
+COMPACT_ROWS = 1 << 22
+
+RECORD_ALIGNMENT = 8
+MIN_RECORD_LENGTH = 0x3C
+ENTRY_MASK = 0xFFFFFFFFFFFF
+
+REASON_FILE_CREATE = 0x00000100
+REASON_BASIC_INFO_CHANGE = 0x00008000
+
+# Offsets of the fixed fields in USN_RECORD_V2 and USN_RECORD_V3, whose file references are 128-bit.
+V2_FIELDS = {"file_ref": 8, "parent_ref": 16, "usn": 24, "timestamp": 32, "reason": 40, "name_length": 56, "name_offset": 58}
+V3_FIELDS = {"file_ref": 8, "parent_ref": 24, "usn": 40, "timestamp": 48, "reason": 56, "name_length": 72, "name_offset": 74}
+
+USN_COLUMNS = ["EntryNumber", "SequenceNumber", "Full Path with the name", "UsnCreated", "UsnBasicInfoChange", "UsnBasicInfoChanges"]
+
+
+def release_pages(journal, start, end):
+    """Drop the mapped pages of [start, end) from this process's resident set once they have been read, where the OS allows it."""
+    if not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    start -= start % mmap.PAGESIZE
+    end -= end % mmap.PAGESIZE
+    if end > start:
+        journal.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def skip_zeros(journal, position, end):
+    """Return the first 8-byte aligned offset in [position, end) holding a non-zero byte, or end.
+
+    The sparse, zero-filled head of a $J can be gigabytes long, so it is scanned in large strides.
+    """
+    while position < end:
+        stride_end = min(position + ZERO_STRIDE, end)
+        block = np.frombuffer(journal, dtype=np.uint8, count=stride_end - position, offset=position)
+        if block.any():
+            return position + int(np.flatnonzero(block)[0]) // RECORD_ALIGNMENT * RECORD_ALIGNMENT
+        del block
+        release_pages(journal, position, stride_end)
+        position = stride_end
+    return end
+
+
+def record_offsets(journal, start, end):
+    """Walk the records starting in [start, end) and return (their offsets, the position after the last one).
+
+    Zero padding is skipped in strides, and anything that is not a V2/V3 record is stepped over
+    8 bytes at a time until the walk finds a record again.
+    """
+    size = len(journal)
+    offsets = []
+    position = start
+    while position < end and position + 8 <= size:
+        length, major = struct.unpack_from("<IH", journal, position)
+        if length == 0:
+            position = skip_zeros(journal, position, size)
+            continue
+        if major not in (2, 3) or length < MIN_RECORD_LENGTH or length % RECORD_ALIGNMENT or position + length > size:
+            position += RECORD_ALIGNMENT
+            continue
+        offsets.append(position)
+        position += length
+    return offsets, position
+
+
+def gather(buffer, positions, dtype):
+    """Read one little-endian integer of the given dtype at each position of a uint8 buffer."""
+    width = np.dtype(dtype).itemsize
+    return np.ascontiguousarray(buffer[positions[:, None] + np.arange(width)]).view(dtype).ravel()
+
+
+def decode_records(journal, offsets, with_names=False):
+    """Decode the records at the given offsets into a DataFrame, gathering every fixed field for the whole batch at once."""
+    buffer = np.frombuffer(journal, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    v3 = gather(buffer, offsets + 4, "<u2") == 3
+
+    def field(name, dtype):
+        return gather(buffer, offsets + np.where(v3, V3_FIELDS[name], V2_FIELDS[name]), dtype)
+
+    file_ref = field("file_ref", "<u8")
+    parent_ref = field("parent_ref", "<u8")
+    records = pd.DataFrame({
+        "EntryNumber": (file_ref & ENTRY_MASK).astype(np.int64),
+        "SequenceNumber": (file_ref >> 48).astype(np.int64),
+        "ParentEntryNumber": (parent_ref & ENTRY_MASK).astype(np.int64),
+        "ParentSequenceNumber": (parent_ref >> 48).astype(np.int64),
+        "Usn": field("usn", "<i8"),
+        "Ticks": field("timestamp", "<i8"),
+        "Reason": field("reason", "<u4"),
+    })
+    if with_names:
+        starts = (offsets + field("name_offset", "<u2")).tolist()
+        ends = (np.asarray(starts) + field("name_length", "<u2")).tolist()
+        records["Name"] = [journal[a:b].decode("utf-16-le", "replace") for a, b in zip(starts, ends)]
+    return records
+
+
+def iter_usn_records(journal_path, window_bytes=WINDOW_BYTES, with_names=False):
+    """Yield the records of a $J file as one DataFrame per window of about window_bytes, through a memory map.
+
+    Pages are released behind the walk, so resident memory stays at about one window whatever the journal size.
+    """
+    if os.path.getsize(journal_path) == 0:
+        return
+    with open(journal_path, "rb") as infile:
+        journal = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        size = len(journal)
+        position = skip_zeros(journal, 0, size)
+        while position < size:
+            start = position
+            offsets, position = record_offsets(journal, position, min(position + window_bytes, size))
+            records = decode_records(journal, offsets, with_names) if offsets else None
+            release_pages(journal, start, position)
+            if records is not None:
+                yield records
+    finally:
+        journal.close()
+
+
+def summarize_records(records):
+    """Reduce records to one row per (EntryNumber, SequenceNumber).
+
+    UsnCreated is the first FILE_CREATE time. UsnBasicInfoChange is the last BASIC_INFO_CHANGE
+    from a later handle, i.e. one not carrying FILE_CREATE, and UsnBasicInfoChanges counts those
+    records. Times stay FILETIME ticks (nullable Int64).
+    """
+    reason = records["Reason"].to_numpy()
+    created = (reason & REASON_FILE_CREATE) != 0
+    changed = ((reason & REASON_BASIC_INFO_CHANGE) != 0) & ~created
+    summary = pd.DataFrame({
+        "EntryNumber": records["EntryNumber"],
+        "SequenceNumber": records["SequenceNumber"],
+        "UsnCreated": records["Ticks"].astype("Int64").where(created),
+        "UsnBasicInfoChange": records["Ticks"].astype("Int64").where(changed),
+        "UsnBasicInfoChanges": changed.astype(np.int64),
+    })
+    return combine_summaries([summary])
+
+
+def combine_summaries(summaries):
+    combined = pd.concat(summaries, ignore_index=True)
+    return combined.groupby(["EntryNumber", "SequenceNumber"], as_index=False, sort=False).agg(
+        UsnCreated=("UsnCreated", "min"),
+        UsnBasicInfoChange=("UsnBasicInfoChange", "max"),
+        UsnBasicInfoChanges=("UsnBasicInfoChanges", "sum"),
+    )
+
+
+def parse_usn_journal(journal_path, window_bytes=WINDOW_BYTES):
+    """Stream a $J file into one summary row per file reference, in memory bounded by the number of files, not the journal size."""
+    summaries = []
+    rows = 0
+    for records in iter_usn_records(journal_path, window_bytes):
+        summary = summarize_records(records)
+        summaries.append(summary)
+        rows += len(summary)
+        if rows > COMPACT_ROWS:
+            summaries = [combine_summaries(summaries)]
+            rows = len(summaries[0])
+    if not summaries:
+        return pd.DataFrame({"EntryNumber": pd.Series(dtype=np.int64), "SequenceNumber": pd.Series(dtype=np.int64),
+                             "UsnCreated": pd.Series(dtype="Int64"), "UsnBasicInfoChange": pd.Series(dtype="Int64"),
+                             "UsnBasicInfoChanges": pd.Series(dtype=np.int64)})
+    return combine_summaries(summaries)
+
+
+def join_usn_to_mft(summary, mft_df):
+    """Attach each summarized file reference to its MFT path on EntryNumber and SequenceNumber, formatting the times like MFTECmd."""
+    paths = mft_df[["EntryNumber", "SequenceNumber", "Full Path with the name"]].astype({"EntryNumber": np.int64, "SequenceNumber": np.int64})
+    joined = summary.merge(paths, on=["EntryNumber", "SequenceNumber"], how="inner")
+    for col in ["UsnCreated", "UsnBasicInfoChange"]:
+        joined[col] = filetime_to_string(joined[col].fillna(0).to_numpy(dtype=np.uint64)).to_numpy()
+    return joined[USN_COLUMNS]
+
+
+def extract_usn_info(journal_path, mft_df, output_directory, write_output=True, fmt="csv"):
+    """Summarize the $J change journal per file and join it to the MFT data.
+
+    Without a $J file the stage is empty, so the check leaves its journal indicator blank.
+    """
+    if journal_path is None or not os.path.exists(journal_path):
+        print(f"No $J change journal found at {journal_path}, skipping the journal checks.")
+        extracted_data = pd.DataFrame({col: pd.Series(dtype=object) for col in USN_COLUMNS})
+    else:
+        extracted_data = join_usn_to_mft(parse_usn_journal(journal_path), mft_df)
+
+    if write_output:
+        extracted_file = write_stage(extracted_data, output_directory, "extracted_usn_info", fmt)
+        print(f"Extracted information saved to: {extracted_file}")
+    return extracted_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a $UsnJrnl:$J change journal and correlate it with the MFT.")
+    parser.add_argument("-journal", required=True, help="Path to the extracted $J file.")
+    parser.add_argument("-outdir", required=True, help="Directory holding extracted_mft_info and receiving extracted_usn_info.")
+    parser.add_argument("-records", default=None, help="Also write every decoded record, with its name, to this CSV file.")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of extracted_usn_info (parquet and arrow need pyarrow).")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.journal):
+        print(f"Error: Journal file not found at {args.journal}")
+        exit(1)
+    if not os.path.exists(args.outdir):
+        print(f"Error: Output directory not found at {args.outdir}")
+        exit(1)
+
+    if args.records:
+        for number, records in enumerate(iter_usn_records(args.journal, with_names=True)):
+            records.insert(5, "TimeStamp", filetime_to_string(records.pop("Ticks").to_numpy(dtype=np.uint64)).to_numpy())
+            records.to_csv(args.records, mode="a" if number else "w", header=not number, index=False)
+        print(f"Records saved to: {args.records}")
+
+    mft_df = read_stage(args.outdir, "extracted_mft_info", ["EntryNumber", "SequenceNumber", "Full Path with the name"])
+    extracted_data = extract_usn_info(args.journal, mft_df, args.outdir, fmt=args.format)
+    print(extracted_data)
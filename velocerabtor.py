@@ -1,6 +1,23 @@
 import os
+import io
+import csv
+import queue
 import subprocess
+import threading
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import chain
+import pandas as pd
+from path_normalizer import full_path
+from stage_io import FORMATS, stage_path, write_stage_batches
+
+# Characters of a per-directory CSV read and converted at a time
+READ_CHUNK_CHARS = 1 << 22
+
+# Chunks each running recursive collection may hold ahead of the writer
+QUEUED_CHUNKS = 4
 
 # Base directories for scanning (specific to the OS partition)
 base_directories = [
@@ -60,64 +77,306 @@ def get_user_directories(partition):
 
     return user_dirs
 
-def collect_i30_data(velociraptor_path, directory, csv_files, output_dir):
-    """Run Velociraptor to collect $I30 index data for the specified directory."""
-    sanitized_directory = directory.replace(':', '').replace('\\', '_')
-    output_csv = os.path.join(output_dir, "I30", f"{sanitized_directory}.csv")
+def i30_output_csv(directory, output_dir, used_names):
+    """Return a per-directory CSV path under output_dir/I30 that no other directory in this run uses."""
+    sanitized_directory = directory.replace(':', '').replace('\\', '_').replace('/', '_')
+    name = sanitized_directory
+    suffix = 1
+    while name in used_names:
+        suffix += 1
+        name = f"{sanitized_directory}_{suffix}"
+    used_names.add(name)
+    return os.path.join(output_dir, "I30", f"{name}.csv")
+
+def collector_command(velociraptor_path, directory_glob):
+    return [
+        velociraptor_path, "artifacts", "collect", "Windows.NTFS.I30",
+        "--args", f"DirectoryGlobs={directory_glob}", "--format=csv", "--nobanner",
+    ]
+
+def ends_mid_row(csv_file):
+    """True if a non-empty file does not end with a newline, as when the collector died while writing a row."""
+    with open(csv_file, 'rb') as infile:
+        infile.seek(0, os.SEEK_END)
+        if infile.tell() == 0:
+            return False
+        infile.seek(-1, os.SEEK_END)
+        return infile.read(1) != b"\n"
 
+def collect_i30_data(velociraptor_path, directory, output_csv, timeout=None, retries=0):
+    """Run Velociraptor to collect $I30 index data for the specified directory, returning the CSV path or None.
+
+    A collection that times out, fails to start, exits with an error or leaves a partial last row is retried.
+    """
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)  # Ensure output directory exists
-    command = f"{velociraptor_path} artifacts collect Windows.NTFS.I30 --args DirectoryGlobs=\"{directory}\" --format=csv --nobanner"
-    
-    with open(output_csv, 'w') as output_file:
-        subprocess.run(command, stdout=output_file, shell=True)
+    command = collector_command(velociraptor_path, directory)
+
+    for attempt in range(retries + 1):
+        try:
+            with open(output_csv, 'w') as output_file:
+                result = subprocess.run(command, stdout=output_file, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"Timed out after {timeout}s collecting {directory} (attempt {attempt + 1} of {retries + 1})")
+            continue
+        except OSError as e:
+            print(f"Error running collector for {directory}: {e} (attempt {attempt + 1} of {retries + 1})")
+            continue
+        if result.returncode != 0:
+            print(f"Collector exited with code {result.returncode} for {directory} (attempt {attempt + 1} of {retries + 1})")
+            continue
+        if ends_mid_row(output_csv):
+            print(f"Collector output for {directory} ends mid-row (attempt {attempt + 1} of {retries + 1})")
+            continue
+        break
+    else:
+        print(f"Failed to collect {directory}; skipping it.")
+        return None
     
     if os.path.getsize(output_csv) > 0:
         print(f"Processed directory: {directory}, output saved to: {output_csv}")
-        csv_files.append(output_csv)
+        return output_csv
+
+    print(f"No data collected for directory: {directory}. Skipping CSV: {output_csv}")
+    return None
+
+def run_i30_collections(velociraptor_path, directories, output_dir, workers=1, timeout=None, retries=0):
+    """Collect every directory on a pool of at most `workers` concurrent collectors, returning CSVs in directory order."""
+    used_names = set()
+    jobs = [(directory, i30_output_csv(directory, output_dir, used_names)) for directory in directories]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(collect_i30_data, velociraptor_path, directory, output_csv, timeout, retries)
+            for directory, output_csv in jobs
+        ]
+        results = [future.result() for future in futures]
+
+    return [output_csv for output_csv in results if output_csv]
+
+def iter_prefetched(function, items, workers=1):
+    """Map function over items on a thread pool, yielding results in order with a bounded number in flight."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) > 2 * max(1, workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_streamed(stream, items, workers=1, buffered=QUEUED_CHUNKS):
+    """Run the generator stream(item) of every item on up to `workers` threads, yielding their values item by item in order.
+
+    Each generator hands its values over through a queue of at most `buffered` values, and pauses
+    while it is full, so no more than about workers * buffered values are held at once.
+    """
+    finished = object()
+    stop = threading.Event()
+
+    def put(values, value):
+        while not stop.is_set():
+            try:
+                values.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def drain(item, values):
+        try:
+            with closing(stream(item)) as produced:
+                for value in produced:
+                    if not put(values, value):
+                        return
+        finally:
+            put(values, finished)
+
+    workers = max(1, workers)
+    items = iter(items)
+    running = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                values = queue.Queue(maxsize=buffered)
+                running.append((executor.submit(drain, item, values), values))
+                if len(running) < workers:
+                    continue
+                future, values = running.popleft()
+                yield from iter(values.get, finished)
+                future.result()
+            while running:
+                future, values = running.popleft()
+                yield from iter(values.get, finished)
+                future.result()
+        finally:
+            stop.set()
+
+def append_full_paths(lines):
+    """Render quote-free CSV lines, where splitting on ',' is exact, with the full path column appended."""
+    rendered = []
+    for line in lines:
+        line = line.rstrip("\r")
+        parts = line.split(",", 2)
+        if len(parts) > 1:
+            rendered.append(f"{line},{full_path(parts[0], parts[1])}\n")
+    return "".join(rendered)
+
+def complete_lines(lines):
+    """Yield the lines that end with a newline, leaving out a last line cut off before it."""
+    for line in lines:
+        if line.endswith("\n"):
+            yield line
+
+def render_rows(infile, drop_partial=False):
+    """Yield the rows of a collector CSV, past its header, as CSV text chunks of about READ_CHUNK_CHARS with the full path column appended.
+
+    Chunks without a quote character take a plain split; from the first quoted chunk on, the
+    rest of the input goes through the csv tokenizer so quoted commas and newlines stay intact.
+    infile may be a file or a collector's stdout. With drop_partial set, a last row without
+    its newline, as a collector that died while writing it leaves, is left out.
+    """
+    while True:
+        chunk = infile.read(READ_CHUNK_CHARS)
+        if not chunk:
+            return
+        chunk += infile.readline()
+        if drop_partial and not chunk.endswith("\n"):
+            chunk = chunk[:chunk.rfind("\n") + 1]
+        if '"' not in chunk:
+            yield append_full_paths(chunk.split("\n"))
+            continue
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        lines = chain(io.StringIO(chunk), infile)
+        for row in csv.reader(complete_lines(lines) if drop_partial else lines):
+            if len(row) > 1:
+                writer.writerow(row + [full_path(row[0], row[1])])
+                if buffer.tell() >= READ_CHUNK_CHARS:
+                    yield buffer.getvalue()
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer, lineterminator="\n")
+        yield buffer.getvalue()
+        return
+
+def render_i30_csv(csv_file):
+    """Read one per-directory CSV in large chunks and return its header and its rows, as CSV text, with the full path column appended."""
+    with open(csv_file, 'r', encoding='utf-8', newline='') as infile:
+        header = next(csv.reader([infile.readline()]), None)
+        return header, "".join(render_rows(infile))
+
+def stream_i30_collection(velociraptor_path, directory_glob, timeout=None, retries=0):
+    """Run one collection and yield (header, rows as CSV text) chunks from the collector's stdout as it prints them.
+
+    Nothing is written to disk. A collection that fails to start, or times out or exits with an
+    error before printing a complete row, is retried; one that stops part-way keeps the complete
+    rows it printed. Closing the generator early kills the collector.
+    """
+    command = collector_command(velociraptor_path, directory_glob)
+    for attempt in range(retries + 1):
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        except OSError as e:
+            print(f"Error running collector for {directory_glob}: {e} (attempt {attempt + 1} of {retries + 1})")
+            continue
+
+        timed_out = threading.Event()
+        timer = threading.Timer(timeout, lambda: (timed_out.set(), process.kill())) if timeout else None
+        if timer:
+            timer.start()
+        rows_seen = False
+        try:
+            stdout = io.TextIOWrapper(process.stdout, encoding='utf-8', newline='')
+            header = next(csv.reader([stdout.readline()]), None)
+            if header is not None:
+                for text in render_rows(stdout, drop_partial=True):
+                    if text:
+                        rows_seen = True
+                        yield header, text
+        except GeneratorExit:
+            process.kill()
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+            process.stdout.close()
+            process.wait()
+
+        if not timed_out.is_set() and process.returncode == 0:
+            break
+        reason = f"Timed out after {timeout}s" if timed_out.is_set() else f"Collector exited with code {process.returncode}"
+        print(f"{reason} collecting {directory_glob} (attempt {attempt + 1} of {retries + 1})")
+        if rows_seen:
+            print(f"Keeping the rows collected for {directory_glob} before it stopped.")
+            break
+    else:
+        print(f"Failed to collect {directory_glob}; skipping it.")
+        return
+
+    if rows_seen:
+        print(f"Processed directory glob: {directory_glob}")
     else:
-        print(f"No data collected for directory: {directory}. Skipping CSV: {output_csv}")
+        print(f"No data collected for directory glob: {directory_glob}")
+
+def header_line(header):
+    """Render the merged CSV header: the collector's columns followed by the full path column."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(header + ["Full Path with the name"])
+    return buffer.getvalue()
 
-def merge_csv_files(csv_files, output_csv):
-    """Merge multiple CSV files into a single CSV file with an additional column for full path with name."""
-    with open(output_csv, 'w', encoding='utf-8') as outfile:  
+def write_rendered_csv(rendered, output_csv):
+    """Write (header, rows as CSV text) chunks to one CSV, with the header of the first chunk that has one."""
+    with open(output_csv, 'w', encoding='utf-8', newline='') as outfile:
         header_written = False
-        new_header = "Full Path with the name"
-
-        for csv_file in csv_files:
-            with open(csv_file, 'r', encoding='utf-8') as infile:  
-                header = infile.readline().strip().split(',')
-                
-                
-                if not header_written:
-                    outfile.write(','.join(header + [new_header]) + '\n')
-                    header_written = True
-
-                
-                for line in infile:
-                    parts = line.strip().split(',')
-                    if len(parts) > 1:
-                        full_path = parts[0][7:]  
-                        name = parts[1]
-                        new_full_path_with_name = f"{full_path}\\{name}"
-
-                        outfile.write(line.strip().rstrip('\n') + f",{new_full_path_with_name}\n")
+        for header, text in rendered:
+            if header is None:
+                continue
+            if not header_written:
+                outfile.write(header_line(header))
+                header_written = True
+            outfile.write(text)
+    return output_csv
 
+def merge_csv_files(csv_files, output_csv, workers=1):
+    """Merge multiple CSV files into a single CSV file with an additional column for full path with name.
+
+    The per-directory files are read ahead on `workers` threads and written straight to output_csv in order.
+    """
+    write_rendered_csv(iter_prefetched(render_i30_csv, csv_files, workers), output_csv)
     print(f"All CSV files merged into: {output_csv}")
+    return output_csv
 
-def collect_temp_data_recursively(velociraptor_path, temp_directory, csv_files, output_dir):
-    """Collect $I30 index data from the Temp directory recursively."""
-    if os.path.exists(temp_directory):
-        collect_i30_data(velociraptor_path, temp_directory, csv_files, output_dir)
-        for root, dirs, _ in os.walk(temp_directory):
-            for dir_name in dirs:
-                full_dir_path = os.path.join(root, dir_name)
-                collect_i30_data(velociraptor_path, full_dir_path, csv_files, output_dir)
-    else:
-        print(f"The Temp directory does not exist or is inaccessible: {temp_directory}")
+def rendered_frames(rendered):
+    """Turn (header, rows as CSV text) chunks into DataFrames of about READ_CHUNK_CHARS of CSV text each, for columnar output.
 
-def consolidate_i30_index(velociraptor_path, partition, is_os_partition, output_dir):
-    """Collect $I30 index data for system and user directories."""
-    csv_files = []  # List to store paths of all generated CSV files
+    Every column is read as text and typed by the stage schema, so a column that is empty in one chunk is not read as float.
+    """
+    header = None
+    texts = []
+    size = 0
+    for file_header, text in rendered:
+        if file_header is None:
+            continue
+        header = header or header_line(file_header)
+        texts.append(text)
+        size += len(text)
+        if size >= READ_CHUNK_CHARS:
+            yield pd.read_csv(io.StringIO(header + "".join(texts)), dtype=str)
+            texts, size = [], 0
+    if texts:
+        yield pd.read_csv(io.StringIO(header + "".join(texts)), dtype=str)
+
+def merged_i30_frames(csv_files, workers=1):
+    """Yield the merged rows of the per-directory CSVs as DataFrames, for columnar output."""
+    return rendered_frames(iter_prefetched(render_i30_csv, csv_files, workers))
+
+def walk_subdirectories(directory):
+    """List every subdirectory below directory in os.walk order."""
+    return [os.path.join(root, dir_name) for root, dirs, _ in os.walk(directory) for dir_name in dirs]
+
+def plan_i30_directories(partition, is_os_partition):
+    """List the directories to collect, in the order the collection results are merged."""
+    directories = []
     
     if is_os_partition:
     
@@ -127,34 +386,107 @@ def consolidate_i30_index(velociraptor_path, partition, is_os_partition, output_
         
         for directory in adjusted_base_directories:
             if directory.endswith("Temp"):
-                collect_temp_data_recursively(velociraptor_path, directory, csv_files, output_dir)
+                if os.path.exists(directory):
+                    directories.append(directory)
+                    directories.extend(walk_subdirectories(directory))
+                else:
+                    print(f"The Temp directory does not exist or is inaccessible: {directory}")
             elif os.path.exists(directory):
-                collect_i30_data(velociraptor_path, directory, csv_files, output_dir)
+                directories.append(directory)
             else:
                 print(f"Directory does not exist or is inaccessible: {directory}")
         
       
         for user_directory in adjusted_user_directories:
             if os.path.exists(user_directory):
-                collect_i30_data(velociraptor_path, user_directory, csv_files, output_dir)
+                directories.append(user_directory)
             else:
                 print(f"User directory does not exist or is inaccessible: {user_directory}")
 
     else:
        
         if os.path.exists(partition):
-            for root, dirs, _ in os.walk(partition):
-                for dir_name in dirs:
-                    full_dir_path = os.path.join(root, dir_name)
-                    collect_i30_data(velociraptor_path, full_dir_path, csv_files, output_dir)
+            directories.extend(walk_subdirectories(partition))
         else:
             print(f"The specified partition does not exist or is inaccessible: {partition}")
 
+    return directories
+
+def plan_i30_globs(partition, is_os_partition):
+    """List the directory globs of a recursive collection: one recursive glob per tree that would otherwise be walked.
+
+    On the OS partition the Temp directory is collected as itself plus `Temp\\**`; other partitions
+    are a single `<partition>\\**`, every directory below the root.
+    """
+    if not is_os_partition:
+        if os.path.exists(partition):
+            return [partition.rstrip('\\') + "\\**"]
+        print(f"The specified partition does not exist or is inaccessible: {partition}")
+        return []
+
+    globs = []
+    for directory in adjust_paths_for_partition(base_directories, partition):
+        if not os.path.exists(directory):
+            print(f"Directory does not exist or is inaccessible: {directory}")
+            continue
+        globs.append(directory)
+        if directory.endswith("Temp"):
+            globs.append(directory + "\\**")
+    for user_directory in get_user_directories(partition):
+        if os.path.exists(user_directory):
+            globs.append(user_directory)
+        else:
+            print(f"User directory does not exist or is inaccessible: {user_directory}")
+    return globs
+
+def consolidate_i30_recursive(velociraptor_path, partition, is_os_partition, output_dir, fmt="csv", workers=1, timeout=None, retries=0):
+    """Collect $I30 index data with one recursive collection per tree, writing every collector's output into the consolidated file.
+
+    Up to `workers` collectors run at once, and their output is written in plan order as it streams.
+    A collector ahead of the writer buffers at most QUEUED_CHUNKS chunks and then waits on a full
+    pipe, so memory does not grow with the size of a tree; that wait counts towards its `timeout`.
+    No per-directory CSVs are written and there is no separate merge pass.
+    """
+    globs = plan_i30_globs(partition, is_os_partition)
+    print(f"Collecting $I30 data for {len(globs)} directory globs with {workers} worker(s)...")
+    collect = lambda directory_glob: stream_i30_collection(velociraptor_path, directory_glob, timeout, retries)
+    rendered = iter_streamed(collect, globs, workers)
+    first = next(rendered, None)
+    if first is None:
+        print("No $I30 data was collected.")
+        return None
+    rendered = chain([first], rendered)
+
+    if fmt == "csv":
+        consolidated_file = write_rendered_csv(rendered, stage_path(output_dir, "consolidated_i30_data"))
+    else:
+        consolidated_file = write_stage_batches(rendered_frames(rendered), output_dir, "consolidated_i30_data", fmt)
+    print(f"All collected data written to: {consolidated_file}")
+    return consolidated_file
+
+def consolidate_i30_index(velociraptor_path, partition, is_os_partition, output_dir, fmt="csv", workers=1, timeout=None, retries=0, recursive=False):
+    """Collect $I30 index data for system and user directories.
+
+    With recursive set, each walked tree is one recursive collection written straight into the output (see consolidate_i30_recursive).
+    """
+    if recursive:
+        return consolidate_i30_recursive(velociraptor_path, partition, is_os_partition, output_dir, fmt, workers, timeout, retries)
+
+    directories = plan_i30_directories(partition, is_os_partition)
+    print(f"Collecting $I30 data for {len(directories)} directories with {workers} worker(s)...")
+    csv_files = run_i30_collections(velociraptor_path, directories, output_dir, workers, timeout, retries)
+
    
     if csv_files:  
-        merge_csv_files(csv_files, os.path.join(output_dir, "consolidated_i30_data.csv"))
-    else:
-        print("No valid CSV files were generated for merging.")
+        if fmt == "csv":
+            return merge_csv_files(csv_files, stage_path(output_dir, "consolidated_i30_data"), workers)
+
+        consolidated_file = write_stage_batches(merged_i30_frames(csv_files, workers), output_dir, "consolidated_i30_data", fmt)
+        print(f"All CSV files merged into: {consolidated_file}")
+        return consolidated_file
+
+    print("No valid CSV files were generated for merging.")
+    return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="I30 Index Data Collector")
@@ -162,13 +494,20 @@ if __name__ == "__main__":
     parser.add_argument("-outdir", required=True, help="Path to the output directory.")
     parser.add_argument("-partition", required=True, help="Partition to scan (e.g., C:\\ or D:\\).")
     parser.add_argument("-is_it_os", required=True, choices=["yes", "no"], help="Is the specified partition the OS partition? (yes or no).")
+    parser.add_argument("-format", choices=list(FORMATS), default="csv", help="File format of the consolidated output (parquet and arrow need pyarrow).")
+    parser.add_argument("-workers", type=int, default=4, help="Number of collector processes to run at the same time.")
+    parser.add_argument("-timeout", type=float, default=None, help="Seconds before a single directory collection is killed.")
+    parser.add_argument("-retries", type=int, default=0, help="How many times to retry a collection that timed out or failed to start.")
+    parser.add_argument("-collector", default=None, help="Path of the collector executable (defaults to Velociraptor.exe in the tools directory).")
+    parser.add_argument("-recursive", action="store_true", help="Collect each tree with one recursive glob and stream the collector output into the consolidated file, without per-directory CSVs.")
 
     args = parser.parse_args()
 
-    velociraptor_path = os.path.join(args.toolsdir, "Velociraptor.exe")
+    velociraptor_path = args.collector or os.path.join(args.toolsdir, "Velociraptor.exe")
     if not os.path.exists(velociraptor_path):
-        print(f"Velociraptor executable not found in tools directory: {args.toolsdir}")
+        print(f"Velociraptor executable not found: {velociraptor_path}")
         exit(1)
 
     is_os_partition = args.is_it_os.lower() == "yes"
-    consolidate_i30_index(velociraptor_path, args.partition, is_os_partition, args.outdir)
+    consolidate_i30_index(velociraptor_path, args.partition, is_os_partition, args.outdir, args.format,
+                          workers=args.workers, timeout=args.timeout, retries=args.retries, recursive=args.recursive)